@@ -3,6 +3,7 @@
 set -e
 
 original_import_dir="import"
+manifest="${original_import_dir}/import_manifest.json"
 neo4j_home="$HOME/neo4j"
 neo4j_data="${neo4j_home}/data"
 neo4j_import="${neo4j_home}/import"
@@ -15,6 +16,11 @@ if [[ ! "$continue_to_drop" == "drop" ]]; then
   exit 1
 fi
 
+# Files to import come from the manifest written by generate_neo4j_data.py.
+# This fails if a listed file is missing, its checksum changed or a CSV isn't listed.
+import_args=$(python3 -m rxnorm.neo4j_import "$manifest" args --import-dir import ${IMPORT_THREADS:+--threads "$IMPORT_THREADS"})
+echo "Import arguments: $import_args"
+
 container=$(docker ps --format json | jq -r '{id: .ID, img: .Image} | select(.img == "neo4j") | .id')
 if [[ ! -z $container ]]; then
   echo "Stopping Neo4j..."
@@ -28,6 +34,7 @@ echo "Removed old databases"
 sudo rm -rf "$neo4j_import/*"
 mkdir -p "$neo4j_import"
 cp ./$original_import_dir/*.csv* "$neo4j_import"
+cp "$manifest" "$neo4j_import"
 echo "Copied files for import into Neo4j"
 
 # Let file locks settle before starting Docker Neo4j import tool
@@ -37,26 +44,10 @@ docker run -it \
 --user="$(id -u):$(id -g)" \
 --volume="$neo4j_data:/data" \
 --volume="$neo4j_import:/var/lib/neo4j/import" \
-neo4j bash -c 'neo4j-admin database import full \
---nodes=import/ndc_nodes.csv \
---nodes=import/rxcui_BN_nodes.csv \
---nodes=import/rxcui_IN_nodes.csv \
---nodes=import/rxcui_SBD_nodes.csv \
---nodes=import/rxcui_SBDC_nodes.csv \
---nodes=import/rxcui_SBDF_nodes.csv \
---nodes=import/rxcui_SBDG_nodes.csv \
---nodes=import/rxcui_SCD_nodes.csv \
---nodes=import/rxcui_SCDC_nodes.csv \
---nodes=import/rxcui_SCDF_nodes.csv \
---nodes=import/rxcui_SCDG_nodes.csv \
---nodes=import/tui_semantic_types_nodes.csv \
---relationships=import/ndc_cui_relations.csv \
---relationships=import/rel_consists_of.csv \
---relationships=import/rel_contains.csv \
---relationships=import/rel_has_ingredient.csv \
---relationships=import/rel_has_tradename.csv \
+neo4j bash -c "neo4j-admin database import full \
+$import_args \
 --skip-bad-relationships=true \
---overwrite-destination'
+--overwrite-destination"
 
 echo "Import Completed"
 sleep 4 # Give Docker container time to shutdown properly
@@ -72,6 +63,18 @@ docker run \
 -d neo4j
 # --env NEO4JLABS_PLUGINS='["graph-data-science"]' \ #Add this to include Data Science Modules
 
+# Constraints and indexes need a password that isn't the default, see README step 6
+if [[ ! -z $NEO4J_PASSWORD ]]; then
+  echo "Creating constraints and indexes..."
+  for attempt in $(seq 12); do
+    python3 -m rxnorm.schema && break
+    echo "Waiting for Neo4j to accept connections..."
+    sleep 5
+  done
+else
+  echo "Run 'python3 -m rxnorm.schema' once the password is set to create the indexes"
+fi
+
 sleep 3
 echo "Ready!"
 sleep 2
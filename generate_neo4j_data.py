@@ -9,21 +9,51 @@
 This script currently doesn't leverage relationships in the opposite direction since Neo4j can
 search either direction anyway.
 """
+
+import argparse
 import logging
 import logging.config
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional
 
+import numpy as np
 import pandas as pd
 import yaml
+from pandas.api.extensions import take
+
+from rxnorm import cache, checkpoints, delta, graph, joins, neo4j_import, profiling, rrf
+from rxnorm.csr_graph import CSRGraph
+from rxnorm.ndc import normalize_ndcs
+from rxnorm.search_index import DEFAULT_INDEX_DIR, SearchIndex
 
-from rxnorm import graph, rrf
+# Replaced with the configured logger when run as a script, this is for imports
+logger = logging.getLogger(__name__)
 
 
 class MissingDataException(ValueError):
     pass
 
 
+# Columns and row filters pushed down into the RRF reads
+NDC_COLUMNS = ["rxcui", "rxaui", "atn", "atv", "sab", "suppress"]
+NDC_FILTERS = {"atn": "NDC", "sab": "RXNORM", "suppress": "N"}
+REL_MAP_COLUMNS = ["rxcui1", "rxaui1", "rxcui2", "rxaui2", "rela"]
+RELA_TYPES = ["consists_of", "has_ingredient", "contains", "has_tradename"]
+
+DEFAULT_RRF_DIR = Path("./rrf")
+DEFAULT_IMPORT_DIR = Path("./import")
+# Build stages in order, see build_import_files. Each writes its own import files, graph
+# and search write the CSRGraph and SearchIndex.
+STAGES = ["ndc", "sty", "rxcui", "rels", "ingredients", "graph", "search"]
+# Stages built from the output of earlier ones, they're rebuilt when any of those change
+STAGE_DEPENDENCIES = {
+    "ingredients": ["ndc", "rxcui", "rels"],
+    "graph": ["ndc", "rxcui", "rels"],
+    "search": ["ndc", "rxcui"],
+}
+
+
 def get_neo_rrf():
     return graph.NeoRRF(
         "bolt+ssc://127.0.0.1:7687",
@@ -32,6 +62,11 @@ def get_neo_rrf():
     )
 
 
+def _import_dir(manifest: Optional[neo4j_import.ImportManifest]) -> Path:
+    """Import files are written to the directory of the manifest they're added to"""
+    return manifest.import_dir if manifest is not None else DEFAULT_IMPORT_DIR
+
+
 def check_missing_columns(required_cols: List, df: pd.DataFrame, df_name: str):
     missing = False
     for col in required_cols:
@@ -58,10 +93,18 @@ def create_rel_connections(neo_rrf: graph.NeoRRF, rel: pd.DataFrame):
     check_missing_columns(aui_check_list, rel_aui, df_name="RXREL-AUI")
     rel_aui = rel.loc[aui_filter, aui_check_list]
 
+    neo_rrf.create_constraints()
     neo_rrf.merge_rel_connections(rel_cui)
 
 
-def create_rxcui_nodes(neo_rrf: graph.NeoRRF, conso: pd.DataFrame):
+def create_rxcui_nodes(
+    neo_rrf: graph.NeoRRF,
+    conso: pd.DataFrame,
+    compress: bool = False,
+    rows_per_part: Optional[int] = None,
+    encode_workers: Optional[int] = None,
+    manifest: Optional[neo4j_import.ImportManifest] = None,
+):
     tty = "tty"
     code = "code"
     rxcui = "rxcui"
@@ -73,30 +116,47 @@ def create_rxcui_nodes(neo_rrf: graph.NeoRRF, conso: pd.DataFrame):
     columns_to_keep = [
         column_name for column_name in columns_to_keep if column_name in conso.columns
     ]
-    tty_keep = (
-        conso[tty].str.startswith("SBD")
-        | conso[tty].str.startswith("SCD")
-        | conso[tty].isin(["BN", "IN"])
-    )
-
-    conso_rx = conso.loc[tty_keep, columns_to_keep]
+    conso_rx = conso.loc[rxcui_node_filter(conso), columns_to_keep]
     dedupe_conso_rx = conso_rx.drop_duplicates(subset=["rxcui", "tty"])
     logger.warning(
         f"Dropping any duplicate RXCUI values...dropped {len(conso_rx)-len(dedupe_conso_rx)}"
     )
-    neo_rrf.create_conso_nodes_by_tty(dedupe_conso_rx)
+    neo_rrf.create_conso_nodes_by_tty(
+        dedupe_conso_rx,
+        out_dir=_import_dir(manifest),
+        compress=compress,
+        rows_per_part=rows_per_part,
+        workers=encode_workers,
+        manifest=manifest,
+    )
     # neo_rrf.create_conso_nodes_by_tty(conso_rx)
 
 
-def create_sty_nodes_and_relationships(sty: pd.DataFrame) -> Path:
+def rxcui_node_filter(conso: pd.DataFrame) -> pd.Series:
+    """Rows of the concepts that become RXCUI nodes"""
+    return (
+        conso["tty"].str.startswith("SBD")
+        | conso["tty"].str.startswith("SCD")
+        | conso["tty"].isin(["BN", "IN"])
+    )
+
+
+def create_sty_nodes_and_relationships(
+    sty: pd.DataFrame,
+    compress: bool = False,
+    rows_per_part: Optional[int] = None,
+    encode_workers: Optional[int] = None,
+    manifest: Optional[neo4j_import.ImportManifest] = None,
+) -> Path:
     """
     Semantic type nodes include things like "animals", "vitamins", "Food", "Clinical Drug", "Organic Chemical", etc.
     These are structured in a tree / hierarchy A1.1 -> A1.1.2 -> A1.1.2.3 and so on.
 
     """
+    # observed=True so categorical columns don't add every unseen stn/tui/sty combination
     sty_nodes = (
-        sty.groupby("stn")[["tui", "sty"]]
-        .value_counts()
+        sty.groupby(["stn", "tui", "sty"], observed=True)
+        .size()
         .rename("sty_count")
         .reset_index()
     ).copy()
@@ -108,41 +168,73 @@ def create_sty_nodes_and_relationships(sty: pd.DataFrame) -> Path:
         inplace=True,
     )
     semantic_types_nodes_path = Path("tui_semantic_types_nodes.csv")
-    graph.save_node_csv_file(
-        sty_nodes, filename=semantic_types_nodes_path, id_col="tui", node_label="STY"
+    return graph.save_node_csv_file(
+        sty_nodes,
+        filename=semantic_types_nodes_path,
+        basedir=_import_dir(manifest),
+        id_col="tui",
+        node_label="STY",
+        compress=compress,
+        rows_per_part=rows_per_part,
+        workers=encode_workers,
+        manifest=manifest,
     )
 
 
-def create_ndc_nodes_and_relationships(sat: pd.DataFrame) -> List[Path]:
+def prepare_ndc_data(sat: pd.DataFrame) -> pd.DataFrame:
     """
-    Creates paths from NDC nodes to RXCUI nodes.
-    Returns list of files created.
+    Keeps the RxNorm NDC attributes, one row per NDC, with the NDC normalized to 11 digits
+    in an ndc column.
     """
-    files_written = []
     ndc = "ndc"
-    rxcui = "rxcui"
-    rxaui = "rxaui"
-    col_check_list = [ndc, rxcui, rxaui]
-
     ndc_data = (
         sat[(sat["atn"] == "NDC") & (sat["suppress"] == "N") & (sat["sab"] == "RXNORM")]
         .rename(columns={"atv": ndc})
         .drop_duplicates(subset=ndc)
     )
-    ndc_data[ndc] = ndc_data[ndc].apply(graph._standardize_ndc_11)
+    normalized = normalize_ndcs(ndc_data[ndc])
+    ndc_data[ndc] = normalized[ndc]
+    invalid = ~normalized["ndc_valid"]
+    if invalid.any():
+        logger.warning(
+            f"{invalid.sum()} NDC values don't match a 4-4-2, 5-3-2, 5-4-1 or 5-4-2 layout"
+        )
+    return ndc_data
+
+
+def create_ndc_nodes_and_relationships(
+    ndc_data: pd.DataFrame,
+    compress: bool = False,
+    rows_per_part: Optional[int] = None,
+    encode_workers: Optional[int] = None,
+    manifest: Optional[neo4j_import.ImportManifest] = None,
+) -> List[Path]:
+    """
+    Creates paths from NDC nodes to RXCUI nodes, from the output of prepare_ndc_data.
+    Returns list of files created.
+    """
+    files_written = []
+    ndc = "ndc"
+    rxcui = "rxcui"
+    rxaui = "rxaui"
+    col_check_list = [ndc, rxcui, rxaui]
 
     # Make the CSV!
     ndc_node_path = Path("ndc_nodes.csv")
     node_path = graph.save_node_csv_file(
-        ndc_data[[ndc, rxcui, rxaui, "brand"]].rename(
-            columns={ndc: f"{ndc}:ID({ndc.upper()})"}
-        ),
+        ndc_data[[ndc, rxcui, rxaui, "brand"]],
         filename=ndc_node_path,
+        basedir=_import_dir(manifest),
+        id_col=ndc,
         node_label=ndc,
+        compress=compress,
+        rows_per_part=rows_per_part,
+        workers=encode_workers,
+        manifest=manifest,
     )
 
-    if node_path.exists() and node_path == ndc_node_path:
-        files_written.append(ndc_node_path)
+    if node_path.exists():
+        files_written.append(node_path)
 
     ndc_relationships_path = Path("ndc_cui_relations.csv")
 
@@ -151,15 +243,20 @@ def create_ndc_nodes_and_relationships(sat: pd.DataFrame) -> List[Path]:
             ndc_data["sab"] == "RXNORM", [ndc, rxaui, rxcui]
         ].drop_duplicates(),
         filename=ndc_relationships_path,
+        basedir=_import_dir(manifest),
         start_col=ndc,
         start_label="NDC",
         end_col=rxcui,
         end_label="RXCUI",
         rela_type="aka",
+        compress=compress,
+        rows_per_part=rows_per_part,
+        workers=encode_workers,
+        manifest=manifest,
     )
 
-    if saved_path.exists() and saved_path == ndc_relationships_path:
-        files_written.append(ndc_relationships_path)
+    if saved_path.exists():
+        files_written.append(saved_path)
         logger.info(
             f"NDC Nodes and RXCUI relationships files created with {len(ndc_data)} records"
         )
@@ -167,46 +264,244 @@ def create_ndc_nodes_and_relationships(sat: pd.DataFrame) -> List[Path]:
     return files_written
 
 
-def create_relationship_map(rel, rela_type) -> pd.DataFrame:
-    relation_cols = ["rxcui1", "rxaui1", "rxcui2", "rxaui2", "rela"]
-    rel_map = (
-        rel[(rel["rela"] == rela_type)][relation_cols]
-        .rename(columns={"rela": ":TYPE"})
-        .copy()
+def create_active_ingredient_relationships(
+    ndc_data: pd.DataFrame,
+    rel_maps: List[pd.DataFrame],
+    node_rxcuis: pd.Series,
+    ingredient_rxcuis: pd.Series,
+    compress: bool = False,
+    rows_per_part: Optional[int] = None,
+    encode_workers: Optional[int] = None,
+    manifest: Optional[neo4j_import.ImportManifest] = None,
+) -> Path:
+    """
+    Links every NDC straight to its ingredients with has_active_ingredient relationships,
+    so looking up an NDC's ingredients is one hop instead of a variable length match.
+
+    An ingredient is any IN concept within three hops of the NDC in either direction,
+    the same as the webapp's old (n:NDC)-[*1..3]-(i:IN) match: the NDC's own RXCUI, or
+    up to two hops from it over the relationship maps. Only relationships between
+    RXCUI nodes that are written count, as neo4j-admin skips the rest.
+    """
+    ndc = "ndc"
+    rxcui = "rxcui"
+    nodes = pd.Index(node_rxcuis.dropna().astype("string").unique())
+    ingredients = pd.Index(ingredient_rxcuis.dropna().astype("string").unique())
+
+    edges = pd.concat(
+        [rel_map[["rxcui1", "rxcui2"]] for rel_map in rel_maps], ignore_index=True
+    ).astype("string")
+    edges = edges[edges["rxcui1"].isin(nodes) & edges["rxcui2"].isin(nodes)]
+    # Both directions, as the match ignores direction
+    edges = pd.concat(
+        [
+            edges.set_axis(["source", "target"], axis=1),
+            edges[["rxcui2", "rxcui1"]].set_axis(["source", "target"], axis=1),
+        ],
+        ignore_index=True,
+    ).drop_duplicates()
+
+    ndc_rxcuis = ndc_data[[ndc, rxcui]].astype("string")
+    ndc_rxcuis = ndc_rxcuis[ndc_rxcuis[rxcui].isin(nodes)].rename(
+        columns={rxcui: "source"}
+    )
+    one_hop = ndc_rxcuis.merge(edges, on="source")[[ndc, "target"]]
+    # The last hop has to land on an ingredient, so only those edges are joined.
+    # This keeps ingredients with thousands of products from fanning out.
+    to_ingredients = edges[edges["target"].isin(ingredients)]
+    two_hops = one_hop.rename(columns={"target": "source"}).merge(
+        to_ingredients, on="source"
+    )[[ndc, "target"]]
+
+    active_ingredients = pd.concat(
+        [
+            ndc_rxcuis.set_axis([ndc, rxcui], axis=1),
+            one_hop.set_axis([ndc, rxcui], axis=1),
+            two_hops.set_axis([ndc, rxcui], axis=1),
+        ],
+        ignore_index=True,
     )
+    active_ingredients = active_ingredients[
+        active_ingredients[rxcui].isin(ingredients)
+    ].drop_duplicates()
     logger.info(
-        f"Created relationship map data for {rela_type} with {len(rel_map)} records"
+        f"Found {len(active_ingredients)} active ingredients for "
+        f"{active_ingredients[ndc].nunique()} of {len(ndc_data)} NDCs"
     )
-    return rel_map
 
+    return graph.save_relationship_csv_file(
+        active_ingredients,
+        filename=Path("rel_has_active_ingredient.csv"),
+        basedir=_import_dir(manifest),
+        start_col=ndc,
+        start_label="NDC",
+        end_col=rxcui,
+        end_label="RXCUI",
+        rela_type="has_active_ingredient",
+        compress=compress,
+        rows_per_part=rows_per_part,
+        workers=encode_workers,
+        manifest=manifest,
+    )
+
+
+def create_build_info_node(manifest: neo4j_import.ImportManifest) -> Path:
+    """
+    Writes the (:BUILD {name: "rxnorm"}) node holding the build version, a digest of the
+    other import files. A delta changes its version, which tells the webapps to drop
+    their cached responses.
+    """
+    build_info = pd.DataFrame(
+        {"name": ["rxnorm"], "version": [manifest.build_version()]}
+    )
+    return graph.save_node_csv_file(
+        build_info,
+        filename=Path(f"{neo4j_import.BUILD_INFO_NAME}.csv"),
+        basedir=_import_dir(manifest),
+        id_col="name",
+        node_label=neo4j_import.BUILD_LABEL,
+        manifest=manifest,
+    )
+
+
+def partition_relationship_maps(
+    rel: pd.DataFrame, rela_types: List[str]
+) -> Dict[str, pd.DataFrame]:
+    """
+    Splits the relationships into one map per type, with rela renamed to :TYPE, in a
+    single groupby pass rather than a full scan and copy for each type. Types with no
+    relationships get an empty map.
+    """
+    with profiling.stage("partition_relationship_maps", rows_in=len(rel)) as stage:
+        rel_maps = rel[REL_MAP_COLUMNS].rename(columns={"rela": ":TYPE"}, copy=False)
+        groups = dict(iter(rel_maps.groupby(":TYPE", observed=True, sort=False)))
+        relationship_maps = {
+            rela_type: groups.get(rela_type, rel_maps.iloc[:0])
+            for rela_type in rela_types
+        }
+        stage.rows_out = sum(len(rel_map) for rel_map in relationship_maps.values())
+    for rela_type, rel_map in relationship_maps.items():
+        logger.info(
+            f"Created relationship map data for {rela_type} with {len(rel_map)} records"
+        )
+    return relationship_maps
+
+
+def save_relationship_maps(
+    relationship_maps: Dict[str, pd.DataFrame],
+    generic_rxcuis: pd.Series,
+    node_rxcuis: pd.Series,
+    workers: Optional[int] = None,
+    compress: bool = False,
+    rows_per_part: Optional[int] = None,
+    encode_workers: Optional[int] = None,
+    manifest: Optional[neo4j_import.ImportManifest] = None,
+) -> List[pd.DataFrame]:
+    """
+    Keeps the relationships whose start (rxcui2) is a generic med or whose end (rxcui1) is
+    any RXCUI node, and writes each type to its rel_<type>.csv on its own thread.
+
+    Both ID sets are hashed once up front, rather than by an isin call per type and
+    column. Manifest entries are added in the order of relationship_maps whichever file
+    finishes first.
+
+    Returns:
+        List[pd.DataFrame]: The kept relationships of each type, in the same order
+    """
+    generic_ids = pd.Index(generic_rxcuis.unique())
+    node_ids = pd.Index(node_rxcuis.unique())
 
-def process_generic_meds(scd, tradename_map, concept_brands):
-    # Using left join since not all generic meds will have a brand name
-    generic_meds = (
-        scd.rename(columns={"str": "generic"})
-        .merge(
-            tradename_map,
-            left_on="rxcui",
-            right_on="rxcui2",
-            how="left",
+    def save(rela_type: str, rel_map: pd.DataFrame):
+        keep = (node_ids.get_indexer(rel_map["rxcui1"]) >= 0) | (
+            generic_ids.get_indexer(rel_map["rxcui2"]) >= 0
+        )
+        if not keep.all():
+            logger.warning(f"Missing {(~keep).sum()} record matches for {rela_type}")
+        saved_map = rel_map.loc[keep, :]
+        type_manifest = (
+            neo4j_import.ImportManifest(manifest.import_dir) if manifest else None
         )
-        .merge(
-            concept_brands,
-            left_on="rxcui1",
-            right_on="rxcui",
-            how="left",
-            suffixes=("", "_BN"),
+        graph.save_relationship_csv_file(
+            saved_map,
+            filename=Path(f"rel_{rela_type}.csv"),
+            basedir=_import_dir(type_manifest),
+            start_col="rxcui2",
+            end_col="rxcui1",
+            compress=compress,
+            rows_per_part=rows_per_part,
+            workers=encode_workers,
+            manifest=type_manifest,
         )
+        return saved_map, type_manifest
+
+    with ThreadPoolExecutor(
+        max_workers=workers or len(relationship_maps) or 1,
+        thread_name_prefix="rel-writer",
+    ) as pool:
+        save_jobs = [
+            pool.submit(profiling.in_stage(save), rela_type, rel_map)
+            for rela_type, rel_map in relationship_maps.items()
+        ]
+        saved = [save_job.result() for save_job in save_jobs]
+
+    if manifest is not None:
+        for _, type_manifest in saved:
+            manifest.entries.extend(type_manifest.entries)
+    return [saved_map for saved_map, _ in saved]
+
+
+def process_generic_meds(
+    scd: pd.DataFrame, tradename_map: pd.DataFrame, brands: joins.RxcuiLookup
+) -> pd.DataFrame:
+    """
+    Pairs each generic (SCD and IN) concept with its tradenames and their brand names.
+    A concept with several tradenames keeps one row for the first, and one row per other
+    tradename with the rxcui replaced by the tradename's. Generic names fill in for
+    concepts without a brand.
+
+    Works on interned RXCUIs: only the first row of each concept and each distinct
+    tradename are joined, which are the only rows the dedupe would keep anyway, and the
+    brand is gathered from the lookup rather than merged in.
+    """
+    # Concepts are interned on their own for the join, brands by the lookup's RXCUIs
+    scd_keys = joins.RxcuiKeys(scd["rxcui"])
+    scd_codes = scd_keys.codes(scd["rxcui"])
+    generic_codes = scd_keys.codes(tradename_map["rxcui2"])
+    brand_codes = brands.keys.codes(tradename_map["rxcui1"])
+    # Rows a plain left merge would have made, for the log
+    all_tradenames = joins.RxcuiAdjacency(scd_keys, generic_codes)
+    original_len = int(np.maximum(all_tradenames.counts(scd_codes), 1).sum())
+
+    # Every row of a concept has the same tradenames, so all but its first would be
+    # dropped as duplicates, as would repeats of a concept and tradename pair
+    first_rows = np.flatnonzero(~pd.Series(scd_codes).duplicated().to_numpy())
+    tradename_pairs = generic_codes.astype(np.int64) * (len(brands.keys) + 1) + (
+        brand_codes + 1
     )
+    tradename_rows = np.flatnonzero(~pd.Series(tradename_pairs).duplicated().to_numpy())
+    tradenames = joins.RxcuiAdjacency(scd_keys, generic_codes[tradename_rows])
+    left, right = tradenames.left_join(scd_codes[first_rows])
+    right = np.where(right >= 0, tradename_rows[np.maximum(right, 0)], -1)
+
+    generic_dedupe = (
+        scd.iloc[first_rows[left]]
+        .rename(columns={"str": "generic"})
+        .reset_index(drop=True)
+    )
+    for col_name in tradename_map.columns:
+        generic_dedupe[col_name] = take(
+            tradename_map[col_name].array, right, allow_fill=True
+        )
+    brand_codes = np.where(right >= 0, brand_codes[np.maximum(right, 0)], -1)
+    generic_dedupe["rxcui_BN"] = brands.keys.rxcuis(brand_codes)
+    generic_dedupe["brand"] = brands.take(brand_codes)
 
     # Fill in blank names
-    noname = generic_meds["brand"].isna()
-    generic_meds.loc[noname, "brand"] = generic_meds.loc[noname, "generic"]
+    noname = generic_dedupe["brand"].isna()
+    generic_dedupe.loc[noname, "brand"] = generic_dedupe.loc[noname, "generic"]
 
     # Remove duplicate RXCUI
-    original_len = len(generic_meds)
-    generic_dedupe = generic_meds.drop_duplicates(subset=["rxcui", "rxcui_BN"])
-    generic_dupes = generic_dedupe.duplicated(subset="rxcui")
+    generic_dupes = pd.Series(scd_codes[first_rows[left]]).duplicated().to_numpy()
     generic_dedupe.loc[generic_dupes, "rxcui"] = generic_dedupe.loc[
         generic_dupes, "rxcui_BN"
     ]
@@ -219,20 +514,69 @@ def process_generic_meds(scd, tradename_map, concept_brands):
     return generic_dedupe
 
 
-def read_and_feather_rxnorm_data(filepath, create_feather=True):
+def read_rxnorm_data(
+    filepath: Path,
+    columns: Optional[List[str]] = None,
+    filters: Optional[rrf.RowFilters] = None,
+    use_cache: bool = True,
+    cache_dir: Path = cache.DEFAULT_CACHE_DIR,
+) -> pd.DataFrame:
     """
-    Goal is to read data from files saved locally.
-    Uses feather files if they exist.
-    Creates them if not and create_feather flag is set.
+    Reads an RRF file with the reader for its table.
+    Uses the Parquet cache by default, which is rebuilt whenever the source file,
+    release or schema version changes.
     """
-    feather_path = filepath.with_suffix(".feather")
-    if feather_path.exists():
-        rxnorm_data = rrf.standardize_columns(pd.read_feather(feather_path))
-    else:
-        rxnorm_data = rrf.read_rrf_sty(filepath=filepath)
-        if create_feather:
-            rxnorm_data.to_feather(feather_path)
-    return rxnorm_data
+    with profiling.stage(f"read_rxnorm_data:{Path(filepath).name}") as stage:
+        if use_cache:
+            rrf_data = cache.load(
+                filepath, columns=columns, filters=filters, cache_dir=cache_dir
+            )
+        else:
+            rrf_data = rrf.read_rrf(filepath, columns=columns, filters=filters)
+        stage.rows_out = len(rrf_data)
+    return rrf_data
+
+
+def read_rxnorm_data_parallel(
+    read_args: Dict[str, Dict],
+    workers: Optional[int] = None,
+    use_cache: bool = True,
+    cache_dir: Path = cache.DEFAULT_CACHE_DIR,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Decompresses and parses several RRF files at the same time across a process pool.
+
+    With the cache enabled, the workers only warm the cache and the tables are then
+    memory-mapped from Parquet here, so the DataFrames never get pickled back from the
+    workers. Without the cache each worker parses and returns its table.
+
+    Args:
+        read_args: Name for each table mapped to read_rxnorm_data keyword arguments
+        workers: Number of processes, defaults to one per file
+
+    Returns:
+        Dict: Name for each table mapped to its DataFrame
+    """
+    workers = workers or len(read_args)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if use_cache:
+            warm_jobs = [
+                pool.submit(cache.warm, kwargs["filepath"], cache_dir)
+                for kwargs in read_args.values()
+            ]
+            for warm_job in warm_jobs:
+                warm_job.result()
+        else:
+            read_jobs = {
+                name: pool.submit(rrf.read_rrf, **kwargs)
+                for name, kwargs in read_args.items()
+            }
+            return {name: read_job.result() for name, read_job in read_jobs.items()}
+
+    return {
+        name: read_rxnorm_data(**kwargs, cache_dir=cache_dir)
+        for name, kwargs in read_args.items()
+    }
 
 
 def rxnorm_only(rx_df):
@@ -245,44 +589,53 @@ def rxnorm_only(rx_df):
     return rx_df[rx_filter]
 
 
-def main(
-    conso_filepath: Optional[Path] = None,
-    rel_filepath: Optional[Path] = None,
-    sat_filepath: Optional[Path] = None,
-    skip: Optional[Path] = None,
-    focus: Optional[Path] = None,
-):
+def prepare_frames(
+    rrf_files: Dict[str, Path],
+    workers: Optional[int] = None,
+    use_cache: bool = True,
+    cache_dir: Path = cache.DEFAULT_CACHE_DIR,
+) -> Dict[str, pd.DataFrame]:
     """
-    Main function that orchestrates filling the Neo4j DB with data from RxNorm files.
+    Reads the RRF files and builds every frame the stages write from: ndc_data, sty,
+    generic_meds, sbd_unique and a rel_map_<type> for each of RELA_TYPES.
 
     Args:
-        conso_filepath  Location for the RXCONSO.RRF(.gz) file
+        rrf_files: Location of the conso, rel, sat and sty RRF(.gz) files
+        workers: Number of processes used to read the RRF files
+        use_cache: Read the RRF files through the Parquet cache in cache_dir
     """
-    conso_filepath = Path("./") / "rrf" / "RXNCONSO.RRF.gz"
-    rel_filepath = Path("./") / "rrf" / "RXNREL.RRF.gz"
-    sat_filepath = Path("./") / "rrf" / "RXNSAT.RRF.gz"
-    sty_filepath = Path("./") / "rrf" / "RXNSTY.RRF.gz"
-
-    if not (
-        conso_filepath.exists() and rel_filepath.exists() and sat_filepath.exists()
-    ):
-        raise ValueError("Missing RRF file(s).")
-
-    neo_rrf = get_neo_rrf()
-
-    sty = read_and_feather_rxnorm_data(sty_filepath)
-    rel = read_and_feather_rxnorm_data(rel_filepath)
-    sat = read_and_feather_rxnorm_data(sat_filepath)
-    conso = read_and_feather_rxnorm_data(conso_filepath)
+    # Only the NDC attributes and the mapped relationship types are needed, so only
+    # those rows and columns of the two largest files are loaded.
+    with profiling.stage("read") as stage:
+        rxnorm_data = read_rxnorm_data_parallel(
+            {
+                "sty": {"filepath": rrf_files["sty"]},
+                "rel": {
+                    "filepath": rrf_files["rel"],
+                    "columns": REL_MAP_COLUMNS,
+                    "filters": {"rela": RELA_TYPES},
+                },
+                "sat": {
+                    "filepath": rrf_files["sat"],
+                    "columns": NDC_COLUMNS,
+                    "filters": NDC_FILTERS,
+                },
+                "conso": {"filepath": rrf_files["conso"]},
+            },
+            workers=workers,
+            use_cache=use_cache,
+            cache_dir=cache_dir,
+        )
+        stage.rows_out = sum(len(rrf_data) for rrf_data in rxnorm_data.values())
+    sty = rxnorm_data["sty"]
+    rel = rxnorm_data["rel"]
+    sat = rxnorm_data["sat"]
+    conso = rxnorm_data["conso"]
 
     # rel = rxnorm_only(rel)
     # sat = rxnorm_only(sat)
 
-    rela_types = ["consists_of", "has_ingredient", "contains", "has_tradename"]
-    relationship_maps = {}
-    for rela_type in rela_types:
-        rela_map = create_relationship_map(rel, rela_type=rela_type)
-        relationship_maps[rela_type] = rela_map
+    relationship_maps = partition_relationship_maps(rel, RELA_TYPES)
     logger.info("Relationship mapping data created")
 
     # Bring ingredients and other types together based on brand vs generic
@@ -290,64 +643,345 @@ def main(
     # while also keeping track of branded meds that have no generic alternative
     scd = group_nodes_by_tty(conso, tty_type="IN", semantic_type="SCD", group="generic")
 
-    concept_brands = conso.rename(columns={"str": "brand"})[
-        ["rxcui", "brand"]
-    ].drop_duplicates(subset="rxcui")
-    generic_meds = process_generic_meds(
-        scd, relationship_maps["has_tradename"], concept_brands
-    )
-
-    sat = sat.merge(
-        concept_brands,
-        on="rxcui",
-        how="left",
-        suffixes=("", "_BN"),
-    )
-    # Create NDC to RxCUI first since that's the "entry" for claims look ups
-    create_ndc_nodes_and_relationships(sat)
-    logger.info(f"NDC nodes and relationships data ready, {len(sat)} records")
-
-    # Create Semantic Type nodes
-    create_sty_nodes_and_relationships(sty)
-    logger.info("STY nodes and relationships data ready")
+    # RXCUIs are interned once, the brand lookup and membership tests all use the codes
+    rxcui_keys = joins.RxcuiKeys(conso["rxcui"])
+    concept_brands = joins.RxcuiLookup(rxcui_keys, conso["rxcui"], conso["str"])
+    with profiling.stage("process_generic_meds", rows_in=len(scd)) as stage:
+        generic_meds = process_generic_meds(
+            scd, relationship_maps["has_tradename"], concept_brands
+        )
+        stage.rows_out = len(generic_meds)
 
-    create_rxcui_nodes(neo_rrf, generic_meds)
-    logger.info("RXCUI TTY nodes and relationships data ready")
+    sat = sat.assign(brand=concept_brands.get(sat["rxcui"]))
+    with profiling.stage("prepare_ndc_data", rows_in=len(sat)) as stage:
+        ndc_data = prepare_ndc_data(sat)
+        stage.rows_out = len(ndc_data)
 
     # Seems like some brand name meds do not have a generic alternative. Need to keep those separately.
     sbd = group_nodes_by_tty(conso, tty_type="BN", semantic_type="SBD", group="brand")
     sbd_filter = (
-        ~sbd["rxcui"].isin(generic_meds["rxcui"])
+        ~rxcui_keys.isin(sbd["rxcui"], rxcui_keys.member_mask(generic_meds["rxcui"]))
         # & ~sbd["rxcui"].isin(generic_meds["rxcui1"])
         # & ~sbd["rxcui"].isin(scd["rxcui"])
         & (sbd["sab"] == "RXNORM")
     )
     sbd_unique = sbd.loc[sbd_filter]
 
-    logger.warning("No brand name file being made! It was causing duplicates.")
-    create_rxcui_nodes(neo_rrf, sbd_unique)
-
+    frames = {
+        "ndc_data": ndc_data,
+        "sty": sty,
+        "generic_meds": generic_meds,
+        "sbd_unique": sbd_unique,
+    }
     for rela_type, rel_map in relationship_maps.items():
-        mapping_filter1 = rel_map["rxcui1"].isin(generic_meds["rxcui"]) | rel_map[
-            "rxcui1"
-        ].isin(sbd_unique["rxcui"])
-        mapping_filter2 = rel_map["rxcui2"].isin(generic_meds["rxcui"]) | rel_map[
-            "rxcui2"
-        ].isin(generic_meds["rxcui"])
-        mapping_diff = (~mapping_filter1) & (~mapping_filter2)
-        if any(mapping_diff):
-            logger.warning(
-                f"Missing {mapping_diff.sum()} record matches for {rela_type}"
+        frames[f"rel_map_{rela_type}"] = rel_map
+    return frames
+
+
+def select_stages(
+    focus: Optional[Iterable[str]] = None, skip: Optional[Iterable[str]] = None
+) -> List[str]:
+    """
+    Stages to run, in build order: the focus stages or else all of them, less the skipped.
+
+    Raises:
+        ValueError: A stage name isn't one of STAGES
+    """
+    unknown = set(focus or []).union(skip or []).difference(STAGES)
+    if unknown:
+        raise ValueError(
+            f"Unknown stage(s) {', '.join(sorted(unknown))}, "
+            f"choose from {', '.join(STAGES)}"
+        )
+    return [
+        stage_name
+        for stage_name in STAGES
+        if (not focus or stage_name in focus) and stage_name not in (skip or [])
+    ]
+
+
+def build_import_files(
+    conso_filepath: Optional[Path] = None,
+    rel_filepath: Optional[Path] = None,
+    sat_filepath: Optional[Path] = None,
+    skip: Optional[Iterable[str]] = None,
+    focus: Optional[Iterable[str]] = None,
+    workers: Optional[int] = None,
+    compress: bool = False,
+    rows_per_part: Optional[int] = None,
+    encode_workers: Optional[int] = None,
+    previous_manifest: Optional[Path] = None,
+    partial_update: bool = False,
+    graph_dir: Optional[Path] = None,
+    search_index_dir: Optional[Path] = DEFAULT_INDEX_DIR,
+    sty_filepath: Optional[Path] = None,
+    rrf_dir: Path = DEFAULT_RRF_DIR,
+    import_dir: Path = DEFAULT_IMPORT_DIR,
+    checkpoint_dir: Optional[Path] = checkpoints.DEFAULT_CHECKPOINT_DIR,
+    fresh: bool = False,
+    write_workers: Optional[int] = None,
+    use_cache: bool = True,
+    cache_dir: Path = cache.DEFAULT_CACHE_DIR,
+):
+    """
+    Orchestrates turning the RxNorm files into the import files for the Neo4j DB.
+
+    The build runs as the STAGES in order. With a checkpoint_dir, the prepared frames and
+    each finished stage are checkpointed, so a rerun with the same RRF files picks up
+    after the last finished stage, and a focus stage is rebuilt from the checkpointed
+    frames without reading the RRF files again. Stages in STAGE_DEPENDENCIES are rebuilt
+    too when a stage they're built from changes, unless they're skipped.
+
+    Args:
+        conso_filepath  Location for the RXCONSO.RRF(.gz) file, defaults to one in rrf_dir
+        skip            Stages not to run. Finished ones are still in the manifest
+        focus           Only run these stages, even when they've finished already
+        workers         Number of processes used to read the RRF files
+        compress        Gzip the import CSV files
+        rows_per_part   Write each import file as a header file and data parts of at most
+                        this many rows, rather than one file
+        encode_workers  Threads serializing and compressing each import file, defaults to
+                        the CPU count
+        previous_manifest  Import manifest of the build currently in Neo4j. When set, also
+                        writes the added/changed/retired rows to import/delta
+        partial_update  The RRF files are a weekly update, so nothing is retired
+        graph_dir       Also saves the relationships as a CSRGraph for traversals without Neo4j
+        search_index_dir  Where the webapps' typeahead SearchIndex is saved, None skips it
+        rrf_dir         Where the RRF files are
+        import_dir      Where the import files and manifest are written
+        checkpoint_dir  Where checkpoints are kept, None turns them off
+        fresh           Discard the checkpoints and build everything
+        write_workers   Threads writing the relationship files, defaults to one per type
+        use_cache       Read the RRF files through the Parquet cache in cache_dir
+    """
+    rrf_dir = Path(rrf_dir)
+    import_dir = Path(import_dir)
+    rrf_files = {
+        "conso": Path(conso_filepath or rrf_dir / "RXNCONSO.RRF.gz"),
+        "rel": Path(rel_filepath or rrf_dir / "RXNREL.RRF.gz"),
+        "sat": Path(sat_filepath or rrf_dir / "RXNSAT.RRF.gz"),
+        "sty": Path(sty_filepath or rrf_dir / "RXNSTY.RRF.gz"),
+    }
+    if not all(rrf_files[name].exists() for name in ["conso", "rel", "sat"]):
+        raise ValueError("Missing RRF file(s).")
+
+    stages = select_stages(focus, skip)
+    import_dir.mkdir(parents=True, exist_ok=True)
+    store = None
+    if checkpoint_dir:
+        store = checkpoints.CheckpointStore(
+            checkpoint_dir,
+            checkpoints.input_fingerprint(
+                rrf_files.values(),
+                compress=compress,
+                rows_per_part=rows_per_part,
+                import_dir=import_dir.resolve(),
+            ),
+        )
+        if fresh:
+            store.clear()
+
+    frames: Dict[str, pd.DataFrame] = {}
+
+    def frame(name: str) -> pd.DataFrame:
+        if name in frames:
+            return frames[name]
+        if store is not None and store.has_frames([name]):
+            frames[name] = store.load_frame(name)
+        elif name.startswith("saved_rel_map_"):
+            raise ValueError(
+                "The relationships aren't built yet, run the rels stage first"
             )
-        graph.save_relationship_csv_file(
-            rel_map.loc[~mapping_diff, :],
-            filename=Path(f"rel_{rela_type}.csv"),
-            start_col="rxcui2",
-            end_col="rxcui1",
+        else:
+            prepared = prepare_frames(rrf_files, workers, use_cache, cache_dir)
+            if store is not None:
+                with profiling.stage("save_checkpoints"):
+                    for frame_name, df in prepared.items():
+                        store.save_frame(frame_name, df)
+            frames.update(prepared)
+        return frames[name]
+
+    def saved_rel_maps() -> List[pd.DataFrame]:
+        return [frame(f"saved_rel_map_{rela_type}") for rela_type in RELA_TYPES]
+
+    def rxcui_nodes() -> pd.DataFrame:
+        if "rxcui_nodes" not in frames:
+            nodes = pd.concat(
+                [frame("generic_meds"), frame("sbd_unique")], ignore_index=True
+            )
+            frames["rxcui_nodes"] = nodes[rxcui_node_filter(nodes)]
+        return frames["rxcui_nodes"]
+
+    def write_ndc(manifest: neo4j_import.ImportManifest):
+        # Create NDC to RxCUI first since that's the "entry" for claims look ups
+        ndc_data = frame("ndc_data")
+        with profiling.stage(
+            "create_ndc_nodes_and_relationships", rows_in=len(ndc_data)
+        ):
+            create_ndc_nodes_and_relationships(
+                ndc_data,
+                compress=compress,
+                rows_per_part=rows_per_part,
+                encode_workers=encode_workers,
+                manifest=manifest,
+            )
+        logger.info(f"NDC nodes and relationships data ready, {len(ndc_data)} records")
+
+    def write_sty(manifest: neo4j_import.ImportManifest):
+        # Create Semantic Type nodes
+        create_sty_nodes_and_relationships(
+            frame("sty"),
+            compress=compress,
+            rows_per_part=rows_per_part,
+            encode_workers=encode_workers,
+            manifest=manifest,
         )
+        logger.info("STY nodes and relationships data ready")
+
+    def write_rxcui(manifest: neo4j_import.ImportManifest):
+        neo_rrf = get_neo_rrf()
+        create_rxcui_nodes(
+            neo_rrf,
+            frame("generic_meds"),
+            compress=compress,
+            rows_per_part=rows_per_part,
+            encode_workers=encode_workers,
+            manifest=manifest,
+        )
+        logger.info("RXCUI TTY nodes and relationships data ready")
+        logger.warning("No brand name file being made! It was causing duplicates.")
+        create_rxcui_nodes(
+            neo_rrf,
+            frame("sbd_unique"),
+            compress=compress,
+            rows_per_part=rows_per_part,
+            encode_workers=encode_workers,
+            manifest=manifest,
+        )
+
+    def write_rels(manifest: neo4j_import.ImportManifest):
+        generic_rxcuis = frame("generic_meds")["rxcui"]
+        saved = save_relationship_maps(
+            {rela_type: frame(f"rel_map_{rela_type}") for rela_type in RELA_TYPES},
+            generic_rxcuis=generic_rxcuis,
+            node_rxcuis=pd.concat([generic_rxcuis, frame("sbd_unique")["rxcui"]]),
+            workers=write_workers,
+            compress=compress,
+            rows_per_part=rows_per_part,
+            encode_workers=encode_workers,
+            manifest=manifest,
+        )
+        for rela_type, saved_map in zip(RELA_TYPES, saved):
+            frames[f"saved_rel_map_{rela_type}"] = saved_map
+            if store is not None:
+                store.save_frame(f"saved_rel_map_{rela_type}", saved_map)
+
+    def write_ingredients(manifest: neo4j_import.ImportManifest):
+        nodes = rxcui_nodes()
+        ndc_data = frame("ndc_data")
+        with profiling.stage(
+            "create_active_ingredient_relationships", rows_in=len(ndc_data)
+        ):
+            create_active_ingredient_relationships(
+                ndc_data,
+                saved_rel_maps(),
+                node_rxcuis=nodes["rxcui"],
+                ingredient_rxcuis=nodes.loc[nodes["tty"] == "IN", "rxcui"],
+                compress=compress,
+                rows_per_part=rows_per_part,
+                encode_workers=encode_workers,
+                manifest=manifest,
+            )
+        logger.info("NDC active ingredient relationships data ready")
+
+    def write_graph(manifest: neo4j_import.ImportManifest):
+        rel_maps, ndc_data, nodes = saved_rel_maps(), frame("ndc_data"), rxcui_nodes()
+        with profiling.stage("csr_graph"):
+            CSRGraph.build(rel_maps, ndc_data, nodes).save(graph_dir)
+
+    def write_search(manifest: neo4j_import.ImportManifest):
+        ndc_data, nodes = frame("ndc_data"), rxcui_nodes()
+        with profiling.stage("search_index", rows_in=len(ndc_data)):
+            SearchIndex.build(ndc_data, generic_names=nodes).save(search_index_dir)
+
+    stage_writers = {
+        "ndc": write_ndc,
+        "sty": write_sty,
+        "rxcui": write_rxcui,
+        "rels": write_rels,
+        "ingredients": write_ingredients,
+        "graph": write_graph,
+        "search": write_search,
+    }
+    # Stages writing outside the import dir, and whether their output is still there
+    outside_outputs = {
+        "graph": lambda: bool(graph_dir) and Path(graph_dir).exists(),
+        "search": lambda: bool(search_index_dir)
+        and SearchIndex.exists(search_index_dir),
+    }
+
+    manifest = neo4j_import.ImportManifest(import_dir)
+    for stage_name in STAGES:
+        if stage_name == "graph" and not graph_dir:
+            continue
+        if stage_name == "search" and not search_index_dir:
+            continue
+        upstream = (
+            store.upstream(STAGE_DEPENDENCIES.get(stage_name, [])) if store else {}
+        )
+        entries = store.finished(stage_name, import_dir, upstream) if store else None
+        if stage_name in outside_outputs and not outside_outputs[stage_name]():
+            entries = None
+        rebuild = stage_name in stages and (entries is None or focus)
+        outdated = store is not None and store.outdated(stage_name, upstream)
+        if outdated and stage_name not in (skip or []):
+            # Even when it isn't a focus stage, ie after --only rels
+            logger.info(f"A stage {stage_name} is built from changed, rebuilding it")
+            rebuild = True
+        if rebuild:
+            stage_manifest = neo4j_import.ImportManifest(import_dir)
+            with profiling.stage(f"stage:{stage_name}"):
+                stage_writers[stage_name](stage_manifest)
+            entries = stage_manifest.entries
+            if store is not None:
+                store.finish(stage_name, entries, upstream)
+        elif entries is None:
+            logger.warning(
+                f"The {stage_name} stage isn't built, its files are left out"
+            )
+            continue
+        else:
+            logger.info(f"The {stage_name} stage is already built, reusing it")
+        manifest.entries.extend(entries)
+
+    create_build_info_node(manifest)
+    with profiling.stage("manifest"):
+        manifest_path = manifest.write()
+    if previous_manifest:
+        with profiling.stage("delta"):
+            delta.write_delta(previous_manifest, manifest_path, partial=partial_update)
     logger.info("Finished transforming the RxNorm data for Neo4j.")
 
 
+def main(*args, profile: Optional[str] = None, **kwargs):
+    """
+    Main function that orchestrates filling the Neo4j DB with data from RxNorm files.
+
+    Runs build_import_files with the same arguments, timing each stage with its row counts
+    and peak RSS. The run report goes to run_report.json in the import dir, also when the
+    run fails, see rxnorm.profiling.
+
+    Args:
+        profile         Also capture the run with "cprofile" or "tracemalloc"
+    """
+    profiler = profiling.RunProfiler(profile)
+    try:
+        with profiler:
+            build_import_files(*args, **kwargs)
+    finally:
+        profiler.write_report(Path(kwargs.get("import_dir", DEFAULT_IMPORT_DIR)))
+
+
 def group_nodes_by_tty(node_df, tty_type, semantic_type, group):
     """
     Creates nodes for each TTY
@@ -360,16 +994,89 @@ def group_nodes_by_tty(node_df, tty_type, semantic_type, group):
     ].rename(columns={"str": group})
 
 
+def stage_list(value: str) -> List[str]:
+    """argparse type for a comma separated list of STAGES"""
+    stage_names = [stage_name.strip() for stage_name in value.split(",")]
+    stage_names = [stage_name for stage_name in stage_names if stage_name]
+    try:
+        select_stages(stage_names)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+    return stage_names
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Builds the Neo4j import files from the RxNorm RRF files. Finished "
+        "stages are checkpointed, so rerunning after a crash resumes where it stopped."
+    )
+    parser.add_argument("--rrf-dir", type=Path, default=DEFAULT_RRF_DIR)
+    parser.add_argument("--import-dir", type=Path, default=DEFAULT_IMPORT_DIR)
+    parser.add_argument(
+        "--only",
+        type=stage_list,
+        help=f"Comma separated stages to (re)build, from {','.join(STAGES)}",
+    )
+    parser.add_argument(
+        "--skip", type=stage_list, help="Comma separated stages not to build"
+    )
+    parser.add_argument(
+        "--checkpoint-dir", type=Path, default=checkpoints.DEFAULT_CHECKPOINT_DIR
+    )
+    parser.add_argument("--no-checkpoints", action="store_true")
+    parser.add_argument(
+        "--fresh", action="store_true", help="Discard the checkpoints first"
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Processes reading the RRF files, one per file"
+    )
+    parser.add_argument(
+        "--write-workers",
+        type=int,
+        help="Threads writing the relationship files, one per type",
+    )
+    parser.add_argument("--compress", action="store_true", help="Gzip the CSV files")
+    parser.add_argument(
+        "--rows-per-part",
+        type=int,
+        help="Split each CSV file into a header file and parts of this many rows",
+    )
+    parser.add_argument(
+        "--encode-workers",
+        type=int,
+        help="Threads serializing and compressing each CSV file, one per CPU",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Skip the RRF cache")
+    parser.add_argument("--cache-dir", type=Path, default=cache.DEFAULT_CACHE_DIR)
+    parser.add_argument("--graph-dir", type=Path, help="Also save a CSRGraph here")
+    parser.add_argument("--search-index-dir", type=Path, default=DEFAULT_INDEX_DIR)
+    parser.add_argument("--no-search-index", action="store_true")
+    parser.add_argument(
+        "--previous-manifest",
+        type=Path,
+        help="Manifest of the build in Neo4j, to also write the delta files",
+    )
+    parser.add_argument("--partial-update", action="store_true")
+    parser.add_argument("--profile", choices=profiling.PROFILE_MODES)
+    parser.add_argument(
+        "--logging-config", type=Path, default=Path("./configs/logging.yml")
+    )
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    # TODO add argparse to get directory where files are saved,
-    # then parse each file
-    logging_config_file = "./configs/logging.yml"
+    args = parse_args()
 
-    # Important to use "yaml.safe_load()" to prevent possible parsing error attacks
-    with open(logging_config_file, "r") as f:
-        logging_config = yaml.safe_load(f.read())["logging"]
+    if args.logging_config.exists():
+        # Important to use "yaml.safe_load()" to prevent possible parsing error attacks
+        with open(args.logging_config, "r") as f:
+            logging_config = yaml.safe_load(f.read())["logging"]
 
-    logging.config.dictConfig(logging_config)
+        logging.config.dictConfig(logging_config)
+        log_filename = logging_config["handlers"]["file"]["filename"]
+    else:
+        logging.basicConfig(level=logging.INFO)
+        log_filename = "stderr"
     logger = logging.getLogger(
         __name__
     )  # This should match one of the "loggers" in the config file.
@@ -379,6 +1086,24 @@ def group_nodes_by_tty(node_df, tty_type, semantic_type, group):
     when running a script directly.
     """
 
-    log_filename = logging_config["handlers"]["file"]["filename"]
     logger.info(f"Logging here: {log_filename}")
-    main()
+    main(
+        skip=args.skip,
+        focus=args.only,
+        workers=args.workers,
+        compress=args.compress,
+        rows_per_part=args.rows_per_part,
+        encode_workers=args.encode_workers,
+        previous_manifest=args.previous_manifest,
+        partial_update=args.partial_update,
+        graph_dir=args.graph_dir,
+        search_index_dir=None if args.no_search_index else args.search_index_dir,
+        rrf_dir=args.rrf_dir,
+        import_dir=args.import_dir,
+        checkpoint_dir=None if args.no_checkpoints else args.checkpoint_dir,
+        fresh=args.fresh,
+        write_workers=args.write_workers,
+        use_cache=not args.no_cache,
+        cache_dir=args.cache_dir,
+        profile=args.profile,
+    )
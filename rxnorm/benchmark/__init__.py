@@ -0,0 +1,18 @@
+"""
+Benchmarks for the import file build and the webapp, see rxnorm.benchmark.suite
+"""
+
+import importlib
+import sys
+from pathlib import Path
+from types import ModuleType
+
+# The repository root, where generate_neo4j_data.py and webapp.py are
+REPO_DIR = Path(__file__).resolve().parents[2]
+
+
+def import_script(name: str) -> ModuleType:
+    """Imports one of the scripts in the repository root, ie generate_neo4j_data"""
+    if str(REPO_DIR) not in sys.path:
+        sys.path.insert(0, str(REPO_DIR))
+    return importlib.import_module(name)
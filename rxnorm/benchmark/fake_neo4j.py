@@ -0,0 +1,318 @@
+"""
+Stand-in for the Neo4j driver, answering the webapp's queries from a build's import files
+
+Lets the webapp be benchmarked and load tested without a database. FakeGraph loads the
+NDC nodes, their has_active_ingredient relationships and the IN nodes listed in the import
+manifest, and answers each query in rxnorm.queries the way Neo4j would. The webapp's schema
+check at startup sees every index online, and creating the schema succeeds
+without doing anything.
+
+FakeDriver has the parts of the neo4j.Driver API the webapps use, with an optional delay
+per query to stand in for the network and database time of a real server:
+    driver = FakeDriver(FakeGraph.from_import_dir(Path("./import")), latency=0.002)
+    webapp = load_webapp(driver)
+"""
+
+import importlib
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from types import ModuleType
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import neo4j
+from rxnorm import delta, neo4j_import, queries, schema
+from rxnorm.benchmark import import_script
+
+
+class Record(tuple):
+    """Like neo4j.Record, a tuple of the values that can also be read by key"""
+
+    def __new__(cls, data: Dict):
+        record = super().__new__(cls, data.values())
+        record._keys = list(data)
+        return record
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return super().__getitem__(self._keys.index(key))
+        return super().__getitem__(key)
+
+    def get(self, key: str, default=None):
+        return self[key] if key in self._keys else default
+
+    def keys(self) -> List[str]:
+        return list(self._keys)
+
+    def data(self) -> Dict:
+        return dict(zip(self._keys, self))
+
+
+class FakeResult:
+    def __init__(self, records: List[Record]):
+        self.records = records
+
+    def __iter__(self) -> Iterator[Record]:
+        return iter(self.records)
+
+    def single(self) -> Optional[Record]:
+        return self.records[0] if self.records else None
+
+    def data(self) -> List[Dict]:
+        return [record.data() for record in self.records]
+
+    def consume(self):
+        pass
+
+
+class FakeGraph:
+    """
+    The NDC to ingredient part of the graph.
+
+    Args:
+        ndcs: Frame with ndc, rxcui and brand columns, one row per NDC node
+        ingredients: Frame with ndc, rxcui and brand columns, one row per
+                     has_active_ingredient relationship to an IN node
+        version: The BUILD node's version
+    """
+
+    def __init__(
+        self,
+        ndcs: pd.DataFrame,
+        ingredients: pd.DataFrame,
+        version: Optional[str] = None,
+    ):
+        self.version = version
+        # Missing values come back as None, like null properties from the driver
+        ndcs = ndcs.astype(object).where(ndcs.notna(), None)
+        ndcs = ndcs.drop_duplicates(subset="ndc").sort_values("ndc", ignore_index=True)
+        self.ndcs = ndcs.set_index("ndc", drop=False)
+        self._ndc_values = ndcs["ndc"].to_numpy(dtype=str)
+        self._branded = ndcs["brand"].notna().to_numpy()
+        # Ingredients are returned with a brand only, as every query filters on it
+        ingredients = ingredients[ingredients["brand"].notna()].drop_duplicates()
+        self.ingredients: Dict[str, List[Dict]] = {
+            ndc: group[["rxcui", "brand"]].to_dict("records")
+            for ndc, group in ingredients.groupby("ndc", sort=False)
+        }
+        # GRAPH pages through branded NDCs with an ingredient, in NDC order
+        has_ingredients = np.isin(self._ndc_values, list(self.ingredients))
+        self._graph_ndcs = self._ndc_values[self._branded & has_ingredients]
+        self._answers: Dict[str, Callable[[Dict], List[Record]]] = {
+            queries.SEARCH: self.search,
+            queries.INGREDIENTS: self.ingredients_of,
+            queries.GRAPH: self.graph_page,
+            queries.INGREDIENTS_BATCH: self.ingredients_batch,
+            queries.RESOLVE_BATCH: self.resolve_batch,
+            queries.BUILD_VERSION: self.build_version,
+        }
+
+    @classmethod
+    def from_import_dir(cls, import_dir: Path) -> "FakeGraph":
+        """Loads the graph from the files in import_dir's import manifest"""
+        import_dir = Path(import_dir)
+        manifest = neo4j_import.ImportManifest.load(
+            import_dir / neo4j_import.MANIFEST_FILE
+        )
+        entries = {entry["name"]: entry for entry in manifest.entries}
+        for name in ["ndc_nodes", "rel_has_active_ingredient"]:
+            if name not in entries:
+                raise ValueError(f"No {name} in the import manifest in {import_dir}")
+
+        ndcs = delta.read_import_entry(import_dir, entries["ndc_nodes"])
+        ndcs = ndcs.rename(columns={"ndc:ID(NDC)": "ndc"})[["ndc", "rxcui", "brand"]]
+        links = delta.read_import_entry(
+            import_dir, entries["rel_has_active_ingredient"]
+        )
+        links = links.set_axis(["ndc", "rxcui", ":TYPE"], axis=1)
+        ingredient_nodes = pd.concat(
+            [
+                delta.read_import_entry(import_dir, entry)
+                for entry in manifest.entries
+                if entry["kind"] == neo4j_import.NODES
+                and "IN" in (entry["labels"] or [])
+            ],
+            ignore_index=True,
+        ).rename(columns={"rxcui:ID(RXCUI)": "rxcui"})
+        ingredients = links[["ndc", "rxcui"]].merge(
+            ingredient_nodes[["rxcui", "brand"]].drop_duplicates(subset="rxcui"),
+            on="rxcui",
+        )
+
+        version = None
+        if neo4j_import.BUILD_INFO_NAME in entries:
+            build_info = delta.read_import_entry(
+                import_dir, entries[neo4j_import.BUILD_INFO_NAME]
+            )
+            version = build_info["version"].iloc[0] if len(build_info) else None
+        return cls(ndcs, ingredients, version)
+
+    def __len__(self) -> int:
+        return len(self.ndcs)
+
+    def run(self, query: str, params: Dict) -> List[Record]:
+        answer = self._answers.get(query)
+        if answer is not None:
+            return answer(params)
+        if query.startswith("SHOW INDEXES"):
+            return [
+                Record({"name": name, "state": "ONLINE"})
+                for name in schema.expected_indexes()
+            ]
+        # Schema set up and waiting for the indexes
+        if query.startswith(("CREATE ", "CALL db.awaitIndexes")):
+            return []
+        raise ValueError(f"The fake graph can't answer {query}")
+
+    def search(self, params: Dict) -> List[Record]:
+        matches = np.char.find(self._ndc_values, params["ndc1"]) >= 0
+        rows = np.flatnonzero(matches & self._branded)[:7]
+        return [
+            Record({"ndc": ndc, "brand": self.ndcs["brand"].iat[row]})
+            for row, ndc in zip(rows, self._ndc_values[rows])
+        ]
+
+    def ingredients_of(self, params: Dict) -> List[Record]:
+        brands = [
+            ingredient["brand"]
+            for ingredient in self.ingredients.get(params["ndc"], [])
+        ]
+        return [Record({"ingredients": list(dict.fromkeys(brands))})]
+
+    def graph_page(self, params: Dict) -> List[Record]:
+        first = int(np.searchsorted(self._graph_ndcs, params["after"], side="right"))
+        return [
+            Record(
+                {
+                    "ndc": ndc,
+                    "brand": self.ndcs.at[ndc, "brand"],
+                    "rxcui": self.ndcs.at[ndc, "rxcui"],
+                    "ingredients": self.ingredients[ndc],
+                }
+            )
+            for ndc in self._graph_ndcs[first : first + params["limit"]]
+        ]
+
+    def ingredients_batch(self, params: Dict) -> List[Record]:
+        return [
+            Record(
+                {
+                    "ndc": ndc,
+                    "ingredients": list(
+                        dict.fromkeys(
+                            ingredient["brand"]
+                            for ingredient in self.ingredients.get(ndc, [])
+                        )
+                    ),
+                }
+            )
+            for ndc in dict.fromkeys(params["ndcs"])
+            if ndc in self.ndcs.index
+        ]
+
+    def resolve_batch(self, params: Dict) -> List[Record]:
+        return [
+            Record(
+                {
+                    "ndc": ndc,
+                    "rxcui": self.ndcs.at[ndc, "rxcui"],
+                    "brand": self.ndcs.at[ndc, "brand"],
+                }
+            )
+            for ndc in dict.fromkeys(params["ndcs"])
+            if ndc in self.ndcs.index
+        ]
+
+    def build_version(self, params: Dict) -> List[Record]:
+        return [Record({"version": self.version})] if self.version else []
+
+
+class FakeSession:
+    """A session, and the transaction passed to execute_read and execute_write"""
+
+    def __init__(self, driver: "FakeDriver"):
+        self.driver = driver
+
+    def __enter__(self) -> "FakeSession":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def run(
+        self, query: str, parameters: Optional[Dict] = None, **kwargs
+    ) -> FakeResult:
+        return self.driver.run(query, {**(parameters or {}), **kwargs})
+
+    def execute_read(self, work: Callable, *args, **kwargs):
+        return work(self, *args, **kwargs)
+
+    execute_write = execute_read
+
+    def close(self):
+        pass
+
+
+class FakeDriver:
+    """
+    Args:
+        graph: What queries are answered from
+        latency: Seconds each query takes on top of answering it, ie 0.002 for a
+                 database on the local network
+    """
+
+    def __init__(self, graph: FakeGraph, latency: float = 0.0):
+        self.graph = graph
+        self.latency = latency
+        self.query_count = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "FakeDriver":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def run(self, query: str, params: Dict) -> FakeResult:
+        with self._lock:
+            self.query_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return FakeResult(self.graph.run(query, params))
+
+    def session(self, **kwargs) -> FakeSession:
+        return FakeSession(self)
+
+    def verify_connectivity(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@contextmanager
+def patched_driver(driver: FakeDriver) -> Iterator[FakeDriver]:
+    """neo4j.GraphDatabase.driver returns driver inside the with block"""
+    original = neo4j.GraphDatabase.driver
+    neo4j.GraphDatabase.driver = lambda *args, **kwargs: driver
+    try:
+        yield driver
+    finally:
+        neo4j.GraphDatabase.driver = original
+
+
+def load_webapp(driver: FakeDriver) -> ModuleType:
+    """
+    Imports webapp.py with driver in place of Neo4j, or imports it again when it's loaded
+    already. The app reads its settings, ie RESPONSE_CACHE_SIZE and SEARCH_INDEX_DIR, from
+    the environment as it's imported.
+    """
+    with patched_driver(driver):
+        if "webapp" in sys.modules:
+            return importlib.reload(sys.modules["webapp"])
+        return import_script("webapp")
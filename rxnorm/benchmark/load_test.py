@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Load test for the webapp
+
+Replays a mix of webapp queries at a target rate and reports the latency percentiles,
+throughput and error rate of each route. Queries are made up from the NDCs of a build,
+ie the ndc_nodes files in import/:
+    search              /search?q= a partial NDC or the start of a brand name
+    ingredients         /ingredients/<ndc>
+    graph               /graph?after=<ndc>, one page of the D3 graph
+    resolve_batch       POST /resolve/batch with BATCH_NDCS NDCs
+    ingredients_batch   POST /ingredients/batch with BATCH_NDCS NDCs
+
+Requests are sent on a fixed schedule whatever the response times, and latency is
+measured from when each request was due. Once every connection is busy the wait for one
+counts too, so an overloaded server shows up as rising latency rather than a lower rate.
+
+The target is a running webapp (webapp.py, or uvicorn webapp_async:app), or with --fake
+webapp.py is started in this process on the fake driver from rxnorm.benchmark.fake_neo4j,
+answering from an import directory. It shares the CPU with the load generator, so it's for
+comparing changes rather than sizing a server. The webapp's settings, ie RESPONSE_CACHE_SIZE and
+SEARCH_INDEX_DIR, come from the environment as usual, so runs with and without a change
+can be compared.
+
+Usage:
+    python -m rxnorm.benchmark.load_test --url http://127.0.0.1:8088 --ndcs import
+    python -m rxnorm.benchmark.load_test --fake import --rps 200 --duration 60 --connections 16
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from rxnorm import delta, neo4j_import
+from rxnorm.benchmark import fake_neo4j
+from rxnorm.benchmark.suite import latency_summary
+
+logger = logging.getLogger(__name__)
+
+ROUTES = ["search", "ingredients", "graph", "resolve_batch", "ingredients_batch"]
+DEFAULT_MIX = {"search": 0.6, "ingredients": 0.35, "graph": 0.05}
+DEFAULT_RPS = 50.0
+DEFAULT_DURATION = 30.0
+DEFAULT_WARMUP = 2.0
+DEFAULT_CONNECTIONS = 8
+DEFAULT_TIMEOUT = 10.0
+BATCH_NDCS = 1_000
+GRAPH_LIMIT = 700
+
+# (route, method, path, JSON body)
+Query = Tuple[str, str, str, Optional[bytes]]
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """Route weights like "search=0.6,ingredients=0.4", as shares of the requests"""
+    mix = {}
+    for item in value.split(","):
+        route, _, weight = item.partition("=")
+        route = route.strip()
+        if route not in ROUTES:
+            raise ValueError(f"Unknown route {route}, choose from {', '.join(ROUTES)}")
+        try:
+            mix[route] = float(weight)
+        except ValueError:
+            raise ValueError(f"Weight for {route} isn't a number: {weight}")
+    if not mix or min(mix.values()) < 0 or sum(mix.values()) <= 0:
+        raise ValueError("The mix needs a positive weight for at least one route")
+    return mix
+
+
+def load_ndcs(path: Path) -> pd.DataFrame:
+    """
+    The ndc and brand of each NDC node, from an ndc_nodes.csv or the files an import
+    directory's manifest lists for it
+    """
+    path = Path(path)
+    if path.is_dir():
+        manifest = neo4j_import.ImportManifest.load(path / neo4j_import.MANIFEST_FILE)
+        entries = [entry for entry in manifest.entries if entry["name"] == "ndc_nodes"]
+        if not entries:
+            raise ValueError(f"No ndc_nodes in the import manifest in {path}")
+        ndcs = delta.read_import_entry(path, entries[0])
+    else:
+        ndcs = pd.read_csv(path, dtype="string")
+    ndcs = ndcs.rename(columns={ndcs.columns[0]: "ndc"})
+    if "brand" not in ndcs:
+        ndcs["brand"] = None
+    ndcs = ndcs[["ndc", "brand"]].dropna(subset=["ndc"])
+    if ndcs.empty:
+        raise ValueError(f"No NDCs in {path}")
+    return ndcs
+
+
+class QueryMix:
+    """Random queries in the proportions of mix, the same ones for the same seed"""
+
+    def __init__(self, ndcs: pd.DataFrame, mix: Dict[str, float], seed: int = 0):
+        self.rng = np.random.default_rng(seed)
+        self.ndcs = ndcs["ndc"].to_numpy(dtype=str)
+        brands = ndcs["brand"].dropna().astype(str)
+        self.words = (
+            brands.str.split().str[0].str[:4].dropna().to_numpy(dtype=str)
+            if len(brands)
+            else self.ndcs
+        )
+        self.routes = list(mix)
+        weights = np.array(list(mix.values()), dtype=float)
+        self.weights = weights / weights.sum()
+        self._lock = threading.Lock()
+
+    def _ndc(self) -> str:
+        return self.ndcs[self.rng.integers(len(self.ndcs))]
+
+    def next(self) -> Query:
+        with self._lock:
+            route = self.routes[self.rng.choice(len(self.routes), p=self.weights)]
+            if route == "search":
+                # Typeahead sends partial NDCs and names as they're typed
+                if self.rng.random() < 0.5:
+                    q = self._ndc()[: self.rng.integers(3, 9)]
+                else:
+                    q = self.words[self.rng.integers(len(self.words))]
+                return route, "GET", "/search?" + urlencode({"q": q}), None
+            if route == "ingredients":
+                return route, "GET", f"/ingredients/{self._ndc()}", None
+            if route == "graph":
+                params = {"limit": GRAPH_LIMIT, "after": self._ndc()}
+                return route, "GET", "/graph?" + urlencode(params), None
+            batch = self.rng.choice(self.ndcs, BATCH_NDCS).tolist()
+            path = (
+                "/resolve/batch" if route == "resolve_batch" else "/ingredients/batch"
+            )
+            return route, "POST", path, json.dumps(batch).encode("utf-8")
+
+
+class LoadTest:
+    """
+    Args:
+        base_url: The webapp, ie http://127.0.0.1:8088
+        queries: Where the requests come from
+        rps: Requests sent per second
+        duration: Seconds the requests are measured for, after the warmup
+        connections: Requests in flight at most, each on its own kept alive connection
+        warmup: Seconds of requests at the start that aren't measured
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        queries: QueryMix,
+        rps: float = DEFAULT_RPS,
+        duration: float = DEFAULT_DURATION,
+        connections: int = DEFAULT_CONNECTIONS,
+        warmup: float = DEFAULT_WARMUP,
+        timeout: float = DEFAULT_TIMEOUT,
+    ):
+        if rps <= 0 or duration <= 0 or connections < 1:
+            raise ValueError("rps, duration and connections must be positive")
+        url = urlsplit(base_url)
+        if url.scheme not in ("http", "https") or not url.hostname:
+            raise ValueError(f"{base_url} isn't an http(s) URL")
+        self.base_url = base_url
+        self._url = url
+        self.queries = queries
+        self.rps = rps
+        self.duration = duration
+        self.connections = connections
+        self.warmup = warmup
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._timings: Dict[str, List[float]] = {route: [] for route in ROUTES}
+        self._errors: Dict[str, int] = {route: 0 for route in ROUTES}
+        self._error_samples: List[str] = []
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if getattr(self._local, "connection", None) is None:
+            connection_class = (
+                http.client.HTTPSConnection
+                if self._url.scheme == "https"
+                else http.client.HTTPConnection
+            )
+            self._local.connection = connection_class(
+                self._url.hostname, self._url.port, timeout=self.timeout
+            )
+        return self._local.connection
+
+    def _send(self, query: Query, due: float, measured: bool):
+        route, method, path, body = query
+        error = None
+        try:
+            connection = self._connection()
+            headers = {"Content-Type": "application/json"} if body else {}
+            connection.request(method, self._url.path.rstrip("/") + path, body, headers)
+            response = connection.getresponse()
+            # Streamed routes aren't done until the whole body is read
+            response.read()
+            if response.status != 200:
+                error = f"{route} {response.status}"
+        except (OSError, http.client.HTTPException) as send_error:
+            error = f"{route} {type(send_error).__name__}: {send_error}"
+            # Start over on a new connection, this one's state is unknown
+            self._local.connection.close()
+            self._local.connection = None
+        seconds = time.perf_counter() - due
+        if not measured:
+            return
+        with self._lock:
+            if error is None:
+                self._timings[route].append(seconds)
+            else:
+                self._errors[route] += 1
+                if len(self._error_samples) < 10:
+                    self._error_samples.append(error)
+
+    def run(self) -> Dict:
+        total = int((self.warmup + self.duration) * self.rps)
+        warmup_requests = int(self.warmup * self.rps)
+        logger.info(
+            f"Sending {total - warmup_requests} requests at {self.rps:g}/s to "
+            f"{self.base_url} after a {self.warmup:g}s warmup"
+        )
+        with ThreadPoolExecutor(
+            max_workers=self.connections, thread_name_prefix="load"
+        ) as pool:
+            started = time.perf_counter()
+            for num in range(total):
+                due = started + num / self.rps
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(
+                    self._send, self.queries.next(), due, num >= warmup_requests
+                )
+        elapsed = time.perf_counter() - started - self.warmup
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> Dict:
+        routes = {}
+        for route in ROUTES:
+            timings, errors = self._timings[route], self._errors[route]
+            if not timings and not errors:
+                continue
+            routes[route] = latency_summary(timings, errors)
+            routes[route]["throughput_rps"] = round(len(timings) / elapsed, 2)
+        timings = [seconds for route in ROUTES for seconds in self._timings[route]]
+        overall = latency_summary(timings, sum(self._errors.values()))
+        overall["throughput_rps"] = round(len(timings) / elapsed, 2)
+        return {
+            "url": self.base_url,
+            "target_rps": self.rps,
+            "duration": self.duration,
+            "connections": self.connections,
+            "elapsed": round(elapsed, 3),
+            "routes": routes,
+            "all": overall,
+            "error_samples": self._error_samples,
+        }
+
+
+@contextmanager
+def fake_webapp(graph: fake_neo4j.FakeGraph, latency: float = 0.0) -> Iterator[str]:
+    """
+    Serves webapp.py on the fake driver on a free local port, threaded like the Flask
+    development server. Yields its URL.
+    """
+    from werkzeug.serving import make_server
+
+    webapp = fake_neo4j.load_webapp(fake_neo4j.FakeDriver(graph, latency))
+    # A line per request would drown out the report
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, webapp.app, threaded=True)
+    thread = threading.Thread(
+        target=server.serve_forever, name="fake-webapp", daemon=True
+    )
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+def format_report(report: Dict) -> str:
+    """The report as a table, one line per route"""
+    columns = ["requests", "error_rate", "throughput_rps", "p50_ms", "p95_ms", "p99_ms"]
+    lines = [f"{'route':<18}" + "".join(f"{column:>16}" for column in columns)]
+    for route, summary in [*report["routes"].items(), ("all", report["all"])]:
+        lines.append(
+            f"{route:<18}"
+            + "".join(f"{str(summary.get(column, '-')):>16}" for column in columns)
+        )
+    return "\n".join(lines)
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Load test the webapp and report latency percentiles per route"
+    )
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="A running webapp, ie http://127.0.0.1:8088")
+    target.add_argument(
+        "--fake",
+        type=Path,
+        metavar="IMPORT_DIR",
+        help="Serve webapp.py here on the fake driver, answering from these import files",
+    )
+    parser.add_argument(
+        "--ndcs",
+        type=Path,
+        help="ndc_nodes.csv or an import directory the queries are made from, "
+        "defaults to the NDCs in IMPORT_DIR",
+    )
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=DEFAULT_MIX,
+        help="Share of each route, ie search=0.6,ingredients=0.35,graph=0.05. "
+        f"Routes are {', '.join(ROUTES)}",
+    )
+    parser.add_argument("--rps", type=float, default=DEFAULT_RPS)
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION)
+    parser.add_argument("--warmup", type=float, default=DEFAULT_WARMUP)
+    parser.add_argument("--connections", type=int, default=DEFAULT_CONNECTIONS)
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds the fake driver adds to each query",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Also save the report as JSON")
+    parsed = parser.parse_args(args)
+
+    if parsed.url and not parsed.ndcs:
+        parser.error("--ndcs is needed with --url")
+    graph = parsed.fake and fake_neo4j.FakeGraph.from_import_dir(parsed.fake)
+    ndcs = load_ndcs(parsed.ndcs) if parsed.ndcs else graph.ndcs
+    queries = QueryMix(ndcs, parsed.mix, parsed.seed)
+
+    def load_test(base_url: str) -> Dict:
+        return LoadTest(
+            base_url,
+            queries,
+            rps=parsed.rps,
+            duration=parsed.duration,
+            connections=parsed.connections,
+            warmup=parsed.warmup,
+            timeout=parsed.timeout,
+        ).run()
+
+    if parsed.fake:
+        with fake_webapp(graph, parsed.latency) as base_url:
+            report = load_test(base_url)
+    else:
+        report = load_test(parsed.url)
+
+    print(format_report(report))
+    for error in report["error_samples"]:
+        logger.warning(error)
+    if parsed.output:
+        parsed.output.write_text(json.dumps(report, indent=2))
+        logger.info(f"Saved the report to {parsed.output}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
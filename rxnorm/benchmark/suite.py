@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the import file build and the webapp
+
+Each scale gets a synthetic release (see rxnorm.benchmark.synthetic), generated once and
+kept in the work directory, and is timed in three parts:
+    rrf         Each RRF file read in full by rxnorm.rrf, without the Parquet cache
+    pipeline    A whole build_import_files run, timed per stage by rxnorm.profiling, ie
+                process_generic_meds, create_ndc_nodes_and_relationships and every
+                save_*_csv_file
+    webapp      Requests to each webapp.py route through Flask's test client, with the
+                fake driver in rxnorm.benchmark.fake_neo4j answering from the new import
+                files. The response cache is off, so every request does the work.
+
+Every run is appended to a JSON history. A timing more than the threshold slower than the
+median of the last few runs at the same scale is reported as a regression, so slowdowns
+show up before the monthly build runs into them.
+
+Usage:
+    python -m rxnorm.benchmark.suite --scale 1% --scale 10%
+    python -m rxnorm.benchmark.suite --scale 100% --repeat 1 --fail-on-regression
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from statistics import median
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from rxnorm import profiling, rrf
+from rxnorm.benchmark import REPO_DIR, fake_neo4j, import_script, synthetic
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORK_DIR = Path("./bench")
+DEFAULT_HISTORY_FILE = Path("./benchmark_history.json")
+DEFAULT_REPEAT = 3
+DEFAULT_WEBAPP_REQUESTS = 200
+# Slower than the recent median by this share is a regression
+DEFAULT_THRESHOLD = 0.25
+# Previous runs at the same scale the median is taken over
+HISTORY_WINDOW = 5
+# Differences smaller than this are timer noise, whatever the share
+MIN_REGRESSION_SECONDS = 0.02
+BATCH_NDCS = 1_000
+PARTS = ["rrf", "pipeline", "webapp"]
+
+
+def latency_summary(seconds: List[float], errors: int = 0) -> Dict:
+    """Request count, error rate and latency percentiles in milliseconds"""
+    requests = len(seconds) + errors
+    summary = {
+        "requests": requests,
+        "errors": errors,
+        "error_rate": round(errors / requests, 4) if requests else 0.0,
+    }
+    if seconds:
+        p50, p95, p99 = np.percentile(np.asarray(seconds) * 1000, [50, 95, 99])
+        summary.update(
+            {
+                "p50_ms": round(float(p50), 3),
+                "p95_ms": round(float(p95), 3),
+                "p99_ms": round(float(p99), 3),
+                "max_ms": round(max(seconds) * 1000, 3),
+            }
+        )
+    return summary
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_rrf_reads(rrf_files: Dict[str, Path], repeat: int) -> Dict[str, Dict]:
+    results = {}
+    for filepath in rrf_files.values():
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows = len(rrf.read_rrf(filepath))
+            timings.append(time.perf_counter() - started)
+        seconds = median(timings)
+        results[filepath.name] = {
+            "seconds": round(seconds, 3),
+            "rows": rows,
+            "rows_per_second": round(rows / seconds) if seconds else None,
+        }
+        logger.info(f"Read {filepath.name}, {rows} rows in {seconds:.2f}s")
+    return results
+
+
+def bench_pipeline(
+    rrf_dir: Path,
+    import_dir: Path,
+    search_index_dir: Path,
+    repeat: int,
+    workers: Optional[int] = None,
+) -> Dict[str, Dict]:
+    """
+    Stage timings of build_import_files, the median of each over the runs. The rows and
+    peak RSS are the last run's.
+    """
+    generate_neo4j_data = import_script("generate_neo4j_data")
+    runs: List[Dict[str, Dict]] = []
+    for _ in range(repeat):
+        profiler = profiling.RunProfiler()
+        with profiler:
+            generate_neo4j_data.build_import_files(
+                rrf_dir=rrf_dir,
+                import_dir=import_dir,
+                search_index_dir=search_index_dir,
+                checkpoint_dir=None,
+                use_cache=False,
+                workers=workers,
+            )
+        report = profiler.report()
+        stages = {stage["name"]: stage for stage in report["stages"]}
+        stages["total"] = {
+            "seconds": report["seconds"],
+            "rss_peak_mb": report["peak_rss_mb"],
+        }
+        runs.append(stages)
+
+    results = {}
+    for name, stage in runs[-1].items():
+        timings = [run[name]["seconds"] for run in runs if name in run]
+        results[name] = {
+            "seconds": round(median(timings), 3),
+            "rows_in": stage.get("rows_in"),
+            "rows_out": stage.get("rows_out"),
+            "rss_peak_mb": stage.get("rss_peak_mb"),
+        }
+    return results
+
+
+def _time_requests(send: Callable[[], object], count: int) -> Dict:
+    timings = []
+    errors = 0
+    for _ in range(count):
+        started = time.perf_counter()
+        response = send()
+        # Streamed routes only do their work as the body is read
+        response.get_data()
+        if response.status_code == 200:
+            timings.append(time.perf_counter() - started)
+        else:
+            errors += 1
+    summary = latency_summary(timings, errors)
+    if timings:
+        summary["requests_per_second"] = round(len(timings) / sum(timings), 1)
+    return summary
+
+
+def bench_webapp(
+    import_dir: Path,
+    search_index_dir: Path,
+    requests: int,
+    latency: float = 0.0,
+    seed: int = 0,
+) -> Dict[str, Dict]:
+    """Latency of each webapp.py route, one request at a time"""
+    graph = fake_neo4j.FakeGraph.from_import_dir(import_dir)
+    if not len(graph):
+        raise ValueError(f"No NDCs in {import_dir} to send to the webapp")
+    settings = {"RESPONSE_CACHE_SIZE": "0", "SEARCH_INDEX_DIR": str(search_index_dir)}
+    saved_env = {name: os.environ.get(name) for name in settings}
+    os.environ.update(settings)
+    try:
+        webapp = fake_neo4j.load_webapp(fake_neo4j.FakeDriver(graph, latency))
+    finally:
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    client = webapp.app.test_client()
+
+    rng = np.random.default_rng(seed)
+    ndcs = graph.ndcs["ndc"].to_numpy(dtype=str)
+    words = [
+        brand.split()[0][:4]
+        for brand in graph.ndcs["brand"]
+        .dropna()
+        .sample(100, replace=True, random_state=seed)
+    ]
+
+    def any_ndc() -> str:
+        return ndcs[rng.integers(len(ndcs))]
+
+    routes = {
+        "search_ndc": lambda: client.get("/search", query_string={"q": any_ndc()[:6]}),
+        "search_name": lambda: client.get(
+            "/search", query_string={"q": words[rng.integers(len(words))]}
+        ),
+        "ingredients": lambda: client.get(f"/ingredients/{any_ndc()}"),
+        "graph": lambda: client.get(
+            "/graph", query_string={"limit": 700, "after": any_ndc()}
+        ),
+        "resolve_batch": lambda: client.post(
+            "/resolve/batch", json=list(rng.choice(ndcs, BATCH_NDCS))
+        ),
+        "ingredients_batch": lambda: client.post(
+            "/ingredients/batch", json=list(rng.choice(ndcs, BATCH_NDCS))
+        ),
+    }
+    results = {}
+    for route, send in routes.items():
+        # Batches are a thousand lookups each, fewer of them take as long
+        count = max(requests // 10, 1) if route.endswith("_batch") else requests
+        results[route] = _time_requests(send, count)
+        logger.info(f"{route}: {results[route]}")
+    return results
+
+
+def run_metrics(run: Dict) -> Dict[str, float]:
+    """The timings of a run compared between runs, all in seconds"""
+    metrics = {}
+    for filename, result in run.get("rrf", {}).items():
+        metrics[f"rrf:{filename}"] = result["seconds"]
+    for stage_name, result in run.get("pipeline", {}).items():
+        metrics[f"pipeline:{stage_name}"] = result["seconds"]
+    for route, result in run.get("webapp", {}).items():
+        if "p95_ms" in result:
+            metrics[f"webapp:{route}:p95"] = result["p95_ms"] / 1000
+    return metrics
+
+
+def load_history(history_file: Path) -> List[Dict]:
+    if not Path(history_file).exists():
+        return []
+    return json.loads(Path(history_file).read_text())
+
+
+def save_history(history_file: Path, history: List[Dict]):
+    history_file = Path(history_file)
+    history_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = history_file.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(history, indent=2))
+    tmp_path.replace(history_file)
+
+
+def find_regressions(
+    history: List[Dict],
+    run: Dict,
+    threshold: float = DEFAULT_THRESHOLD,
+    window: int = HISTORY_WINDOW,
+) -> List[Dict]:
+    """
+    Timings of run slower than the median of the last window runs of the same scale and
+    seed by more than threshold
+    """
+    previous = [
+        past["metrics"]
+        for past in history
+        if past["scale"] == run["scale"] and past["seed"] == run["seed"]
+    ][-window:]
+    regressions = []
+    for name, seconds in run["metrics"].items():
+        timings = [metrics[name] for metrics in previous if name in metrics]
+        if not timings:
+            continue
+        baseline = median(timings)
+        if (
+            seconds > baseline * (1 + threshold)
+            and seconds - baseline > MIN_REGRESSION_SECONDS
+        ):
+            regressions.append(
+                {
+                    "metric": name,
+                    "seconds": seconds,
+                    "baseline_seconds": round(baseline, 3),
+                    "slower_by": round(seconds / baseline - 1, 3) if baseline else None,
+                }
+            )
+    return regressions
+
+
+def run_scale(
+    scale: float,
+    seed: int,
+    work_dir: Path,
+    parts: List[str],
+    repeat: int = DEFAULT_REPEAT,
+    workers: Optional[int] = None,
+    webapp_requests: int = DEFAULT_WEBAPP_REQUESTS,
+    latency: float = 0.0,
+) -> Dict:
+    """Benchmarks the parts for one scale, returns the run as it's saved in the history"""
+    scale_dir = Path(work_dir) / f"scale_{scale:g}_seed_{seed}"
+    rrf_dir = scale_dir / "rrf"
+    import_dir = scale_dir / "import"
+    search_index_dir = scale_dir / "search_index"
+    release = synthetic.ensure_release(rrf_dir, scale, seed)
+
+    run = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "scale": scale,
+        "seed": seed,
+        "repeat": repeat,
+        "release_rows": release["rows"],
+    }
+    if "rrf" in parts:
+        run["rrf"] = bench_rrf_reads(synthetic.release_files(rrf_dir), repeat)
+    if "pipeline" in parts:
+        run["pipeline"] = bench_pipeline(
+            rrf_dir, import_dir, search_index_dir, repeat, workers
+        )
+    if "webapp" in parts:
+        run["webapp"] = bench_webapp(
+            import_dir, search_index_dir, webapp_requests, latency, seed
+        )
+    run["metrics"] = run_metrics(run)
+    return run
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the import file build and the webapp on synthetic releases"
+    )
+    parser.add_argument(
+        "--scale",
+        action="append",
+        help=f"Share of a full release, {', '.join(synthetic.SCALES)} or a fraction. "
+        "Repeat for several, defaults to 1%%",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--part",
+        action="append",
+        choices=PARTS,
+        help="Only benchmark these parts, repeat for several. The webapp uses the "
+        "import files of the last pipeline run at the same scale.",
+    )
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--workers", type=int, help="Processes reading the RRF files")
+    parser.add_argument("--webapp-requests", type=int, default=DEFAULT_WEBAPP_REQUESTS)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds the fake driver adds to each query",
+    )
+    parser.add_argument("--work-dir", type=Path, default=DEFAULT_WORK_DIR)
+    parser.add_argument("--history", type=Path, default=DEFAULT_HISTORY_FILE)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument(
+        "--fail-on-regression",
+        action="store_true",
+        help="Exit with status 1 when a timing regressed",
+    )
+    parsed = parser.parse_args(args)
+    try:
+        scales = [synthetic.parse_scale(scale) for scale in parsed.scale or ["1%"]]
+    except ValueError as error:
+        parser.error(str(error))
+
+    history = load_history(parsed.history)
+    regressed = False
+    for scale in scales:
+        run = run_scale(
+            scale,
+            parsed.seed,
+            parsed.work_dir,
+            parsed.part or PARTS,
+            repeat=parsed.repeat,
+            workers=parsed.workers,
+            webapp_requests=parsed.webapp_requests,
+            latency=parsed.latency,
+        )
+        run["regressions"] = find_regressions(history, run, parsed.threshold)
+        history.append(run)
+        save_history(parsed.history, history)
+
+        for name, seconds in run["metrics"].items():
+            logger.info(f"{synthetic.format_scale(scale)} {name}: {seconds:.3f}s")
+        for regression in run["regressions"]:
+            regressed = True
+            logger.warning(
+                f"{synthetic.format_scale(scale)} {regression['metric']} regressed: "
+                f"{regression['seconds']:.3f}s against {regression['baseline_seconds']:.3f}s"
+            )
+    logger.info(f"Saved the results to {parsed.history}")
+    if regressed and parsed.fail_on_regression:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
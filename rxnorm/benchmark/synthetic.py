@@ -0,0 +1,762 @@
+#!/usr/bin/env python3
+"""
+Synthetic RxNorm releases for benchmarking
+
+Writes RXNCONSO, RXNREL, RXNSAT and RXNSTY .RRF.gz files shaped like a full monthly
+release, scaled down by a factor, so the pipeline can be timed without shipping the real
+files. The RxNorm concepts follow the release's structure:
+    IN, PIN, MIN    ingredients, with a few ingredients in most of the drugs
+    SCDC, SCD       clinical drug components and drugs, consisting of 1-3 components
+    BN, SBDC, SBD   brands of the ingredients and drugs, linked by has_tradename
+    GPCK, BPCK      packs containing 2-4 drugs
+    SCDF, SBDF, SCDG, SBDG, DF, DFG   dose forms and groups
+with both directions of each relationship, NDCs on the drugs and packs, and the other
+sources' atoms, relationships and attributes filling the files out to the row counts of
+a full release. Fixed seeds give the same files every time.
+
+Usage:
+    python -m rxnorm.benchmark.synthetic ./bench/rrf --scale 10%
+"""
+
+import argparse
+import csv
+import gzip
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from rxnorm import rrf
+
+logger = logging.getLogger(__name__)
+
+# Named scales, as a fraction of a full release
+SCALES = {"1%": 0.01, "10%": 0.1, "100%": 1.0}
+RELEASE_INFO_FILE = "synthetic_release.json"
+# Bump when the generated files change, so releases written by older versions are redone
+GENERATOR_VERSION = 1
+
+# Active RxNorm concepts in a full release by TTY
+FULL_RELEASE_CONCEPTS = {
+    "IN": 14_000,
+    "PIN": 3_000,
+    "MIN": 5_500,
+    "BN": 11_500,
+    "SCDC": 27_000,
+    "SCD": 21_000,
+    "SBDC": 20_000,
+    "SBD": 12_500,
+    "GPCK": 600,
+    "BPCK": 900,
+    "SCDF": 15_000,
+    "SBDF": 13_000,
+    "SCDG": 5_000,
+    "SBDG": 10_000,
+    "DF": 130,
+    "DFG": 40,
+}
+# Concepts that only have atoms from other sources
+FULL_RELEASE_SOURCE_CONCEPTS = 230_000
+# NDC attributes with SAB RXNORM
+FULL_RELEASE_NDCS = 850_000
+# Rows in each file of a full release
+FULL_RELEASE_ROWS = {"conso": 1_150_000, "rel": 6_600_000, "sat": 7_700_000}
+# Share of SCD, SBD and pack concepts that are obsolete, and of NDCs no longer active
+OBSOLETE_SHARE = 0.08
+
+# Rows generated at a time for the filler rows, so a full release fits in memory
+CHUNK_ROWS = 500_000
+
+_SYLLABLES = np.array(
+    "ace al am an ar ben car cef cil clo dex di dol dro en fen flu gen hy ib in "
+    "ka lam lin lo ma met mi mo na nol o pan pra pro ra ri sar so ta ter to tri "
+    "va ven vir xa zep zo".split()
+)
+_STRENGTHS = np.array(
+    ["0.5 MG", "1 MG", "2.5 MG", "5 MG", "10 MG", "20 MG", "25 MG", "40 MG", "50 MG"]
+    + ["100 MG", "200 MG", "250 MG", "500 MG", "1000 MG", "5 MG/ML", "100 UNT/ML"]
+)
+_DOSE_FORMS = np.array(
+    ["Oral Tablet", "Oral Capsule", "Extended Release Oral Tablet", "Oral Solution"]
+    + ["Injectable Solution", "Topical Cream", "Ophthalmic Solution", "Nasal Spray"]
+    + ["Transdermal System", "Chewable Tablet", "Oral Suspension", "Rectal Suppository"]
+)
+_DOSE_FORM_GROUPS = np.array(
+    [
+        "Pill",
+        "Oral Product",
+        "Injectable Product",
+        "Topical Product",
+        "Ophthalmic Product",
+    ]
+    + ["Nasal Product", "Oral Liquid Product", "Rectal Product", "Transdermal Product"]
+)
+# Atom TTYs of the other sources, and their share of the other sources' atoms
+_SOURCE_TTYS = {
+    "SNOMEDCT_US": (["PT", "FN", "SY"], 0.24),
+    "MTHSPL": (["DP", "SU", "MTH_RXN_DP"], 0.22),
+    "NDDF": (["CDC", "CDD", "CDA", "IN", "DF"], 0.14),
+    "MMSL": (["CD", "BD", "BN", "GN", "SY"], 0.12),
+    "GS": (["CD", "BD", "BN", "MTH_RXN_BD"], 0.09),
+    "VANDF": (["CD", "PT", "IN", "AB"], 0.07),
+    "DRUGBANK": (["IN", "SY", "FN"], 0.05),
+    "ATC": (["IN", "RXN_IN", "PT"], 0.03),
+    "USP": (["IN", "CD"], 0.02),
+    "MTHCMSFRF": (["CD"], 0.02),
+}
+_SOURCE_RELAS = (
+    ["isa", "inverse_isa", "mapped_to", "mapped_from", "has_form", "form_of"]
+    + ["member_of", "has_member", "may_treat", "may_be_treated_by", "has_active_moiety"]
+    + ["active_moiety_of", "has_mechanism_of_action", "has_part", "part_of", ""]
+)
+_SOURCE_ATNS = (
+    ["DM_SPL_ID", "SPL_SET_ID", "RXN_HUMAN_DRUG", "RXN_AVAILABLE_STRENGTH"]
+    + ["RXN_STRENGTH", "RXN_BN_CARDINALITY", "RXTERM_FORM", "DCSA", "NDA", "LABELER"]
+    + ["MARKETING_CATEGORY", "MARKETING_STATUS", "COLOR", "SHAPE", "IMPRINT_CODE"]
+)
+_CLINICAL_TTYS = ["SCDC", "SCD", "SBDC", "SBD", "GPCK", "BPCK"]
+_SEMANTIC_TYPES = {
+    "T121": ("A1.4.1.1.1", "Pharmacologic Substance"),
+    "T109": ("A1.4.1.2.1", "Organic Chemical"),
+    "T200": ("A1.3.3", "Clinical Drug"),
+    "T195": ("A1.4.1.1.1.1", "Antibiotic"),
+    "T197": ("A1.4.1.2.2", "Inorganic Chemical"),
+    "T116": ("A1.4.1.2.1.7", "Amino Acid, Peptide, or Protein"),
+    "T129": ("A1.4.1.1.4", "Immunologic Factor"),
+}
+
+
+def parse_scale(value: str) -> float:
+    """A named scale like "10%", or a fraction of a full release like "0.25" """
+    value = str(value).strip()
+    try:
+        scale = float(value[:-1]) / 100 if value.endswith("%") else float(value)
+    except ValueError:
+        raise ValueError(f"Scale {value} isn't a percentage or a fraction")
+    if not 0 < scale <= 1:
+        raise ValueError(f"Scale {value} must be more than 0% and at most 100%")
+    return scale
+
+
+def format_scale(scale: float) -> str:
+    """Scale as a percentage for logs, ie 0.005 is "0.5%" """
+    return f"{scale * 100:g}%"
+
+
+def release_files(rrf_dir: Path) -> Dict[str, Path]:
+    return {
+        "conso": Path(rrf_dir) / "RXNCONSO.RRF.gz",
+        "rel": Path(rrf_dir) / "RXNREL.RRF.gz",
+        "sat": Path(rrf_dir) / "RXNSAT.RRF.gz",
+        "sty": Path(rrf_dir) / "RXNSTY.RRF.gz",
+    }
+
+
+def release_info(rrf_dir: Path) -> Optional[Dict]:
+    """What generate_release wrote to rrf_dir, or None when it's not a synthetic release"""
+    info_path = Path(rrf_dir) / RELEASE_INFO_FILE
+    if not info_path.exists():
+        return None
+    return json.loads(info_path.read_text())
+
+
+def _scaled(full_count: int, scale: float, minimum: int = 2) -> int:
+    return max(int(round(full_count * scale)), minimum)
+
+
+def _names(rng: np.random.Generator, count: int, syllables: int) -> np.ndarray:
+    names = _SYLLABLES[rng.integers(len(_SYLLABLES), size=count)]
+    for _ in range(syllables - 1):
+        names = np.char.add(
+            names, _SYLLABLES[rng.integers(len(_SYLLABLES), size=count)]
+        )
+    return names
+
+
+def _join(*parts) -> np.ndarray:
+    joined = parts[0]
+    for part in parts[1:]:
+        joined = np.char.add(joined, part)
+    return joined
+
+
+def _popular(rng: np.random.Generator, population: int, size: int) -> np.ndarray:
+    """Picks with a long tail, a few ingredients are in thousands of drugs"""
+    weights = 1 / np.arange(1, population + 1) ** 0.8
+    return rng.choice(population, size=size, p=weights / weights.sum())
+
+
+def _ids(prefix: str, start: int, count: int) -> np.ndarray:
+    return np.char.add(prefix, np.arange(start, start + count).astype(str))
+
+
+class _RRFWriter:
+    """Appends columns to a pipe delimited, gzipped RRF file"""
+
+    def __init__(self, filepath: Path, headers: List[str]):
+        self.filepath = filepath
+        self.headers = headers
+        self.rows = 0
+        # Speed matters more than size for throwaway benchmark inputs
+        self._handle = gzip.open(filepath, "wt", compresslevel=1, newline="")
+
+    def write(self, columns: Dict[str, object]):
+        count = max(len(value) for value in columns.values() if np.ndim(value))
+        frame = pd.DataFrame(
+            {header: columns.get(header, "") for header in self.headers}
+        )
+        if len(frame) != count:
+            raise ValueError(f"Columns for {self.filepath.name} have different lengths")
+        # Every RRF line ends with a delimiter
+        frame[""] = ""
+        frame.to_csv(
+            self._handle,
+            sep="|",
+            header=False,
+            index=False,
+            quoting=csv.QUOTE_NONE,
+            escapechar="\\",
+            lineterminator="\n",
+        )
+        self.rows += count
+
+    def close(self):
+        self._handle.close()
+
+
+def _chunks(total: int) -> Iterator[Tuple[int, int]]:
+    for start in range(0, total, CHUNK_ROWS):
+        yield start, min(CHUNK_ROWS, total - start)
+
+
+class _Release:
+    """Concepts and atoms of one synthetic release, and the writers for its files"""
+
+    def __init__(self, scale: float, seed: int):
+        self.scale = scale
+        self.rng = np.random.default_rng(seed)
+        self.counts = {
+            tty: _scaled(full_count, scale)
+            for tty, full_count in FULL_RELEASE_CONCEPTS.items()
+        }
+        self.source_concepts = _scaled(FULL_RELEASE_SOURCE_CONCEPTS, scale)
+        total = sum(self.counts.values()) + self.source_concepts
+        # RXCUIs are sparse and in no particular order, like a release's
+        rxcuis = self.rng.permutation(total * 8)[:total] + 1
+        self.rxcui: Dict[str, np.ndarray] = {}
+        start = 0
+        for tty, count in self.counts.items():
+            self.rxcui[tty] = rxcuis[start : start + count]
+            start += count
+        self.source_rxcuis = rxcuis[start:]
+        self.all_rxcuis = rxcuis
+        self.names: Dict[str, np.ndarray] = {}
+        # RXAUI of each concept's RxNorm atom, the other atoms are numbered after these
+        self.rxaui = {tty: self.rxcui[tty] + 10_000_000 for tty in self.counts}
+        self.next_rxaui = int(rxcuis.max()) + 20_000_000
+        self.relationships: List[Tuple[str, np.ndarray, str, np.ndarray, str]] = []
+
+    def link(self, tty1: str, rows1, tty2: str, rows2, rela: str, inverse: str):
+        """
+        rxcui2 has rela to rxcui1, as in RXNREL, rows index the concepts of each TTY.
+        The inverse relationship is added too.
+        """
+        self.relationships.append(
+            (tty1, np.asarray(rows1), tty2, np.asarray(rows2), rela)
+        )
+        self.relationships.append(
+            (tty2, np.asarray(rows2), tty1, np.asarray(rows1), inverse)
+        )
+
+    def build_concepts(self):
+        rng, counts = self.rng, self.counts
+        names = self.names
+        names["IN"] = _names(rng, counts["IN"], 3)
+        pin_in = rng.integers(counts["IN"], size=counts["PIN"])
+        names["PIN"] = np.char.add(names["IN"][pin_in], " hydrochloride")
+        self.link("IN", pin_in, "PIN", np.arange(counts["PIN"]), "form_of", "has_form")
+        min_in = rng.integers(counts["IN"], size=(counts["MIN"], 2))
+        names["MIN"] = _join(
+            names["IN"][min_in[:, 0]], " / ", names["IN"][min_in[:, 1]]
+        )
+        for part in range(2):
+            self.link(
+                "IN",
+                min_in[:, part],
+                "MIN",
+                np.arange(counts["MIN"]),
+                "part_of",
+                "has_part",
+            )
+        names["BN"] = np.char.capitalize(_names(rng, counts["BN"], 2))
+        bn_in = _popular(rng, counts["IN"], counts["BN"])
+        self.link(
+            "BN", np.arange(counts["BN"]), "IN", bn_in, "has_tradename", "tradename_of"
+        )
+
+        names["DF"] = _DOSE_FORMS[np.arange(counts["DF"]) % len(_DOSE_FORMS)]
+        names["DFG"] = _DOSE_FORM_GROUPS[
+            np.arange(counts["DFG"]) % len(_DOSE_FORM_GROUPS)
+        ]
+
+        scdc_in = _popular(rng, counts["IN"], counts["SCDC"])
+        names["SCDC"] = _join(
+            names["IN"][scdc_in],
+            " ",
+            _STRENGTHS[rng.integers(len(_STRENGTHS), size=counts["SCDC"])],
+        )
+        self.link(
+            "IN",
+            scdc_in,
+            "SCDC",
+            np.arange(counts["SCDC"]),
+            "has_ingredient",
+            "ingredient_of",
+        )
+
+        # Drugs consist of one component, or two or three for combination products
+        scd_rows = np.arange(counts["SCD"])
+        scd_scdc = rng.integers(counts["SCDC"], size=counts["SCD"])
+        scd_df = rng.integers(counts["DF"], size=counts["SCD"])
+        names["SCD"] = _join(names["SCDC"][scd_scdc], " ", names["DF"][scd_df])
+        self.link("SCDC", scd_scdc, "SCD", scd_rows, "consists_of", "constitutes")
+        for share in [0.18, 0.05]:
+            combos = scd_rows[rng.random(counts["SCD"]) < share]
+            other_scdc = rng.integers(counts["SCDC"], size=len(combos))
+            self.link("SCDC", other_scdc, "SCD", combos, "consists_of", "constitutes")
+        self.link("DF", scd_df, "SCD", scd_rows, "has_dose_form", "dose_form_of")
+        scd_scdf = rng.integers(counts["SCDF"], size=counts["SCD"])
+        self.link("SCDF", scd_scdf, "SCD", scd_rows, "isa", "inverse_isa")
+        scdf_in = _popular(rng, counts["IN"], counts["SCDF"])
+        names["SCDF"] = _join(
+            names["IN"][scdf_in],
+            " ",
+            _DOSE_FORMS[rng.integers(len(_DOSE_FORMS), size=counts["SCDF"])],
+        )
+        self.link(
+            "IN",
+            scdf_in,
+            "SCDF",
+            np.arange(counts["SCDF"]),
+            "has_ingredient",
+            "ingredient_of",
+        )
+        scdg_in = _popular(rng, counts["IN"], counts["SCDG"])
+        names["SCDG"] = _join(
+            names["IN"][scdg_in],
+            " ",
+            names["DFG"][rng.integers(counts["DFG"], size=counts["SCDG"])],
+        )
+        self.link(
+            "IN",
+            scdg_in,
+            "SCDG",
+            np.arange(counts["SCDG"]),
+            "has_ingredient",
+            "ingredient_of",
+        )
+
+        # Branded drugs are a tradename of a clinical drug, under a brand of its ingredient
+        sbd_rows = np.arange(counts["SBD"])
+        sbd_scd = rng.integers(counts["SCD"], size=counts["SBD"])
+        sbd_bn = self._brand_of(scdc_in[scd_scdc[sbd_scd]], bn_in)
+        names["SBD"] = _join(names["SCD"][sbd_scd], " [", names["BN"][sbd_bn], "]")
+        self.link("SBD", sbd_rows, "SCD", sbd_scd, "has_tradename", "tradename_of")
+        self.link("BN", sbd_bn, "SBD", sbd_rows, "has_ingredient", "ingredient_of")
+        self.link(
+            "DF", scd_df[sbd_scd], "SBD", sbd_rows, "has_dose_form", "dose_form_of"
+        )
+        sbdc_sbd = rng.integers(counts["SBD"], size=counts["SBDC"])
+        names["SBDC"] = _join(
+            names["SCDC"][scd_scdc[sbd_scd[sbdc_sbd]]],
+            " [",
+            names["BN"][sbd_bn[sbdc_sbd]],
+            "]",
+        )
+        self.link(
+            "SBDC",
+            np.arange(counts["SBDC"]),
+            "SBD",
+            sbdc_sbd,
+            "consists_of",
+            "constitutes",
+        )
+        self.link(
+            "SBDC",
+            np.arange(counts["SBDC"]),
+            "SCDC",
+            scd_scdc[sbd_scd[sbdc_sbd]],
+            "has_tradename",
+            "tradename_of",
+        )
+        self.link(
+            "BN",
+            sbd_bn[sbdc_sbd],
+            "SBDC",
+            np.arange(counts["SBDC"]),
+            "has_ingredient",
+            "ingredient_of",
+        )
+        for tty, group in [("SBDF", _DOSE_FORMS), ("SBDG", names["DFG"])]:
+            brand = rng.integers(counts["BN"], size=counts[tty])
+            names[tty] = _join(
+                names["IN"][bn_in[brand]],
+                " ",
+                group[rng.integers(len(group), size=counts[tty])],
+                " [",
+                names["BN"][brand],
+                "]",
+            )
+            self.link(
+                "BN",
+                brand,
+                tty,
+                np.arange(counts[tty]),
+                "has_ingredient",
+                "ingredient_of",
+            )
+
+        # Packs contain two to four drugs
+        for pack, drug in [("GPCK", "SCD"), ("BPCK", "SBD")]:
+            size = rng.integers(2, 5, size=counts[pack])
+            packs = np.repeat(np.arange(counts[pack]), size)
+            drugs = rng.integers(counts[drug], size=len(packs))
+            self.link(drug, drugs, pack, packs, "contains", "contained_in")
+            first = names[drug][drugs[np.cumsum(size) - size]]
+            names[pack] = _join("{", size.astype(str), " (", first, ") } Pack")
+
+    def _brand_of(self, ingredients: np.ndarray, bn_in: np.ndarray) -> np.ndarray:
+        """A brand of each ingredient, or any brand for ingredients without one"""
+        order = np.argsort(bn_in, kind="stable")
+        first = np.searchsorted(bn_in[order], ingredients, side="left")
+        last = np.searchsorted(bn_in[order], ingredients, side="right")
+        picks = first + (self.rng.random(len(ingredients)) * (last - first)).astype(
+            np.int64
+        )
+        has_brand = last > first
+        return np.where(
+            has_brand,
+            order[np.minimum(picks, len(order) - 1)],
+            self.rng.integers(len(bn_in), size=len(ingredients)),
+        )
+
+    def _suppress(self, tty: str, count: int) -> np.ndarray:
+        suppress = np.full(count, "N", dtype=object)
+        if tty in _CLINICAL_TTYS:
+            suppress[self.rng.random(count) < OBSOLETE_SHARE] = "O"
+        return suppress
+
+    def _new_rxauis(self, count: int) -> np.ndarray:
+        rxauis = np.arange(self.next_rxaui, self.next_rxaui + count)
+        self.next_rxaui += count
+        return rxauis
+
+    def write_conso(self, filepath: Path) -> int:
+        writer = _RRFWriter(filepath, rrf.CONSO_HEADERS)
+        for tty, count in self.counts.items():
+            writer.write(
+                {
+                    "rxcui": self.rxcui[tty],
+                    "lat": "ENG",
+                    "ts": "P",
+                    "lui": "",
+                    "stt": "",
+                    "sui": "",
+                    "ispref": "",
+                    "rxaui": self.rxaui[tty],
+                    "saui": "",
+                    "scui": "",
+                    "sdui": "",
+                    "sab": "RXNORM",
+                    "tty": tty,
+                    "code": self.rxcui[tty],
+                    "str": self.names[tty],
+                    "srl": "0",
+                    "suppress": self._suppress(tty, count),
+                    "cvf": np.where(self.rng.random(count) < 0.6, "4096", ""),
+                }
+            )
+        # Prescribable and tall man synonyms of the drugs
+        for tty, synonym_tty in [
+            ("SCD", "PSN"),
+            ("SBD", "PSN"),
+            ("SCD", "SY"),
+            ("IN", "TMSY"),
+        ]:
+            rows = np.flatnonzero(self.rng.random(self.counts[tty]) < 0.5)
+            writer.write(
+                {
+                    "rxcui": self.rxcui[tty][rows],
+                    "lat": "ENG",
+                    "ts": "S",
+                    "rxaui": self._new_rxauis(len(rows)),
+                    "sab": "RXNORM",
+                    "tty": synonym_tty,
+                    "code": self.rxcui[tty][rows],
+                    "str": np.char.upper(self.names[tty][rows]),
+                    "srl": "0",
+                    "suppress": "N",
+                    "cvf": "4096",
+                }
+            )
+
+        # Every other source concept gets an atom, then the rest are spread over them all
+        sabs = list(_SOURCE_TTYS)
+        sab_share = np.array([share for _, share in _SOURCE_TTYS.values()])
+        fill_rows = max(FULL_RELEASE_ROWS["conso"] * self.scale - writer.rows, 0)
+        fill_rows = max(int(fill_rows), self.source_concepts)
+        # Other sources' ingredient atoms sit on ingredients, like the RxNorm ones
+        ingredient_rxcuis = np.concatenate([self.rxcui["IN"], self.source_rxcuis])
+        for start, count in _chunks(fill_rows):
+            sab = self.rng.choice(len(sabs), size=count, p=sab_share / sab_share.sum())
+            tty = np.empty(count, dtype=object)
+            for sab_num, sab_name in enumerate(sabs):
+                rows = sab == sab_num
+                ttys = _SOURCE_TTYS[sab_name][0]
+                tty[rows] = np.array(ttys)[
+                    self.rng.integers(len(ttys), size=rows.sum())
+                ]
+            rxcuis = np.where(
+                tty == "IN",
+                self.rng.choice(ingredient_rxcuis, size=count),
+                self.rng.choice(self.all_rxcuis, size=count),
+            )
+            if start < self.source_concepts:
+                own = min(count, self.source_concepts - start)
+                rxcuis[:own] = self.source_rxcuis[start : start + own]
+            codes = self.rng.integers(1, 10_000_000, size=count).astype(str)
+            writer.write(
+                {
+                    "rxcui": rxcuis,
+                    "lat": "ENG",
+                    "ts": np.where(self.rng.random(count) < 0.5, "P", "S"),
+                    "lui": _ids("L", start, count),
+                    "stt": "PF",
+                    "sui": _ids("S", start, count),
+                    "ispref": "Y",
+                    "rxaui": self._new_rxauis(count),
+                    "saui": codes,
+                    "scui": codes,
+                    "sab": np.array(sabs, dtype=object)[sab],
+                    "tty": tty,
+                    "code": codes,
+                    "str": _join(
+                        _names(self.rng, count, 3),
+                        " ",
+                        _STRENGTHS[sab % len(_STRENGTHS)],
+                    ),
+                    "srl": np.where(sab % 3 == 0, "9", "0"),
+                    "suppress": np.where(self.rng.random(count) < 0.03, "E", "N"),
+                }
+            )
+        writer.close()
+        return writer.rows
+
+    def write_rel(self, filepath: Path) -> int:
+        writer = _RRFWriter(filepath, rrf.REL_HEADERS)
+        for rel_num, (tty1, rows1, tty2, rows2, rela) in enumerate(self.relationships):
+            writer.write(
+                {
+                    "rxcui1": self.rxcui[tty1][rows1],
+                    "rxaui1": self.rxaui[tty1][rows1],
+                    "stype1": "AUI",
+                    "rel": "RO",
+                    "rxcui2": self.rxcui[tty2][rows2],
+                    "rxaui2": self.rxaui[tty2][rows2],
+                    "stype2": "AUI",
+                    "rela": rela,
+                    "rui": _ids("R", rel_num * 1_000_000, len(rows1)),
+                    "sab": "RXNORM",
+                    "suppress": "N",
+                }
+            )
+        fill_rows = int(max(FULL_RELEASE_ROWS["rel"] * self.scale - writer.rows, 0))
+        relas = np.array(_SOURCE_RELAS, dtype=object)
+        sabs = np.array(list(_SOURCE_TTYS), dtype=object)
+        for start, count in _chunks(fill_rows):
+            writer.write(
+                {
+                    "rxcui1": self.rng.choice(self.all_rxcuis, size=count),
+                    "stype1": "CUI",
+                    "rel": np.array(["RO", "RB", "RN", "SY"])[
+                        self.rng.integers(4, size=count)
+                    ],
+                    "rxcui2": self.rng.choice(self.all_rxcuis, size=count),
+                    "stype2": "CUI",
+                    "rela": relas[self.rng.integers(len(relas), size=count)],
+                    "rui": _ids("R", 900_000_000 + start, count),
+                    "sab": sabs[self.rng.integers(len(sabs), size=count)],
+                    "suppress": "N",
+                }
+            )
+        writer.close()
+        return writer.rows
+
+    def write_sat(self, filepath: Path) -> Tuple[int, int]:
+        writer = _RRFWriter(filepath, rrf.SAT_HEADERS)
+        # NDCs go on drugs and packs, a few popular ones have hundreds of packagers
+        owners = np.concatenate(
+            [self.rxcui[tty] for tty in ["SCD", "SBD", "GPCK", "BPCK"]]
+        )
+        owner_rxauis = np.concatenate(
+            [self.rxaui[tty] for tty in ["SCD", "SBD", "GPCK", "BPCK"]]
+        )
+        ndc_count = _scaled(FULL_RELEASE_NDCS, self.scale)
+        weights = self.rng.lognormal(sigma=1.2, size=len(owners))
+        owner = self.rng.choice(len(owners), size=ndc_count, p=weights / weights.sum())
+        ndc_values = np.unique(
+            self.rng.integers(10**9, 10**11, size=int(ndc_count * 1.05))
+        )
+        ndc_values = self.rng.permutation(ndc_values)[:ndc_count]
+        ndc_count = len(ndc_values)
+        ndcs = np.char.zfill(ndc_values.astype(str), 11)
+        writer.write(
+            {
+                "rxcui": owners[owner[:ndc_count]],
+                "rxaui": owner_rxauis[owner[:ndc_count]],
+                "stype": "AUI",
+                "code": owners[owner[:ndc_count]],
+                "atui": _ids("AT", 0, ndc_count),
+                "atn": "NDC",
+                "sab": "RXNORM",
+                "atv": ndcs,
+                "suppress": np.where(
+                    self.rng.random(ndc_count) < OBSOLETE_SHARE, "O", "N"
+                ),
+                "cvf": "4096",
+            }
+        )
+        # The same NDCs as the labelers' sources list them, 5-4-2 with hyphens
+        source_rows = np.flatnonzero(self.rng.random(ndc_count) < 0.9)
+        hyphenated = [f"{ndc[:5]}-{ndc[5:9]}-{ndc[9:]}" for ndc in ndcs[source_rows]]
+        sabs = np.array(["MTHSPL", "VANDF", "GS", "MMSL", "NDDF"], dtype=object)
+        writer.write(
+            {
+                "rxcui": owners[owner[source_rows]],
+                "rxaui": self._new_rxauis(len(source_rows)),
+                "stype": "AUI",
+                "atui": _ids("AT", ndc_count, len(source_rows)),
+                "atn": "NDC",
+                "sab": sabs[self.rng.integers(len(sabs), size=len(source_rows))],
+                "atv": hyphenated,
+                "suppress": "N",
+            }
+        )
+        fill_rows = int(max(FULL_RELEASE_ROWS["sat"] * self.scale - writer.rows, 0))
+        atns = np.array(_SOURCE_ATNS, dtype=object)
+        sabs = np.array(["RXNORM", "MTHSPL", "VANDF", "NDDF", "MMSL"], dtype=object)
+        for start, count in _chunks(fill_rows):
+            writer.write(
+                {
+                    "rxcui": self.rng.choice(self.all_rxcuis, size=count),
+                    "stype": "AUI",
+                    "atui": _ids("AT", 100_000_000 + start, count),
+                    "atn": atns[self.rng.integers(len(atns), size=count)],
+                    "sab": sabs[self.rng.integers(len(sabs), size=count)],
+                    "atv": _names(self.rng, count, 2),
+                    "suppress": "N",
+                }
+            )
+        writer.close()
+        return writer.rows, ndc_count
+
+    def write_sty(self, filepath: Path) -> int:
+        writer = _RRFWriter(filepath, rrf.STY_HEADERS)
+        tuis = np.array(list(_SEMANTIC_TYPES), dtype=object)
+        for tty, rxcuis in [*self.rxcui.items(), ("", self.source_rxcuis)]:
+            if tty in ["IN", "PIN", "MIN", "BN"]:
+                tui = np.where(self.rng.random(len(rxcuis)) < 0.7, "T121", "T109")
+            elif tty:
+                tui = np.full(len(rxcuis), "T200", dtype=object)
+            else:
+                tui = tuis[self.rng.integers(len(tuis), size=len(rxcuis))]
+            writer.write(
+                {
+                    "rxcui": rxcuis,
+                    "tui": tui,
+                    "stn": [_SEMANTIC_TYPES[code][0] for code in tui],
+                    "sty": [_SEMANTIC_TYPES[code][1] for code in tui],
+                    "atui": _ids("AT", 500_000_000 + writer.rows, len(rxcuis)),
+                }
+            )
+        writer.close()
+        return writer.rows
+
+
+def generate_release(rrf_dir: Path, scale: float = 0.01, seed: int = 0) -> Dict:
+    """
+    Writes a synthetic release to rrf_dir.
+
+    Args:
+        rrf_dir: Where the RXN*.RRF.gz files are written
+        scale: Fraction of a full release, see parse_scale
+        seed: Releases with the same scale and seed are the same
+
+    Returns:
+        Dict: The release info, also saved to synthetic_release.json, with the rows written
+    """
+    rrf_dir = Path(rrf_dir)
+    rrf_dir.mkdir(parents=True, exist_ok=True)
+    filepaths = release_files(rrf_dir)
+    release = _Release(scale, seed)
+    release.build_concepts()
+    rows = {
+        "conso": release.write_conso(filepaths["conso"]),
+        "rel": release.write_rel(filepaths["rel"]),
+    }
+    rows["sat"], ndcs = release.write_sat(filepaths["sat"])
+    rows["sty"] = release.write_sty(filepaths["sty"])
+    info = {
+        "generator_version": GENERATOR_VERSION,
+        "scale": scale,
+        "seed": seed,
+        "rows": rows,
+        "concepts": release.counts,
+        "ndcs": ndcs,
+    }
+    (rrf_dir / RELEASE_INFO_FILE).write_text(json.dumps(info, indent=2))
+    logger.info(f"Wrote a {format_scale(scale)} synthetic release to {rrf_dir}: {rows}")
+    return info
+
+
+def ensure_release(rrf_dir: Path, scale: float = 0.01, seed: int = 0) -> Dict:
+    """The release in rrf_dir, generated first unless it's already there"""
+    info = release_info(rrf_dir)
+    filepaths = release_files(rrf_dir)
+    if (
+        info is not None
+        and info["generator_version"] == GENERATOR_VERSION
+        and info["scale"] == scale
+        and info["seed"] == seed
+        and all(filepath.exists() for filepath in filepaths.values())
+    ):
+        logger.info(f"Using the {format_scale(scale)} synthetic release in {rrf_dir}")
+        return info
+    return generate_release(rrf_dir, scale, seed)
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Write a synthetic RxNorm release for benchmarking"
+    )
+    parser.add_argument("rrf_dir", type=Path)
+    parser.add_argument(
+        "--scale",
+        default="1%",
+        help=f"Share of a full release, {', '.join(SCALES)} or a fraction",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parsed = parser.parse_args(args)
+    try:
+        scale = parse_scale(parsed.scale)
+    except ValueError as error:
+        parser.error(str(error))
+    generate_release(parsed.rrf_dir, scale, parsed.seed)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+On-disk Parquet cache for parsed RRF tables
+
+Each RRF file is parsed once and stored as a Parquet dataset under
+<cache_dir>/<TABLE>/<release>_<digest>_v<schema version>/. A new release, a changed source
+file or a schema change all produce a new key, so stale entries are never read and are
+removed the next time the table is warmed.
+
+Large tables are partitioned on the column they are usually filtered by (RXNSAT by atn,
+RXNREL by rela) so later runs only open the partitions they need.
+
+Usage:
+    python -m rxnorm.cache warm ./rrf
+    python -m rxnorm.cache clear
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import re
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from rxnorm import rrf
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = Path("./rrf_cache")
+
+PARTITION_COLUMNS = {
+    "RXNSAT": "atn",
+    "RXNREL": "rela",
+}
+
+# Leading underscore so pyarrow skips it when reading the dataset
+ENTRY_INFO_FILE = "_cache_entry.json"
+
+
+def file_digest(filepath: Path, block_size: int = 1 << 20) -> str:
+    """SHA-256 of the source file, shortened for use in directory names."""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as source_file:
+        for block in iter(lambda: source_file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def release_date(filepath: Path) -> Optional[str]:
+    """
+    Release date for an RRF file, taken from the release folder name
+    (ie RxNorm_full_03062023/rrf/RXNSAT.RRF), or None when the path doesn't name one.
+    """
+    for parent in Path(filepath).resolve().parents:
+        found = re.search(r"RxNorm_\w+?_(\d{2})(\d{2})(\d{4})", parent.name, re.I)
+        if found:
+            month, day, year = found.groups()
+            return f"{year}-{month}-{day}"
+    return None
+
+
+def cache_key(release: Optional[str], digest: str) -> str:
+    """Keyed on the contents alone without a release, a touched file is still current"""
+    if release is None:
+        return f"{digest}_v{rrf.SCHEMA_VERSION}"
+    return f"{release}_{digest}_v{rrf.SCHEMA_VERSION}"
+
+
+def _to_arrow(chunk: pd.DataFrame) -> pa.Table:
+    # Categories differ between chunks, so store plain strings and restore the dtype on load
+    categoricals = [
+        col_name
+        for col_name, dtype in chunk.dtypes.items()
+        if isinstance(dtype, pd.CategoricalDtype)
+    ]
+    chunk = chunk.astype({col_name: "string" for col_name in categoricals})
+    return pa.Table.from_pandas(chunk, preserve_index=False)
+
+
+def _source_stat(filepath: Path) -> Dict:
+    stat = Path(filepath).stat()
+    return {"source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns}
+
+
+def _read_entry_info(entry_dir: Path) -> Optional[Dict]:
+    info_path = entry_dir / ENTRY_INFO_FILE
+    if not info_path.exists():
+        return None
+    return json.loads(info_path.read_text())
+
+
+def _unchanged_entry(
+    table_dir: Path, release: Optional[str], source_stat: Dict
+) -> Optional[Path]:
+    """
+    The entry made from a source file with the same size and modified time, which is
+    taken as the same file without hashing it again
+    """
+    if not table_dir.exists():
+        return None
+    for entry_dir in table_dir.glob(f"*_v{rrf.SCHEMA_VERSION}"):
+        entry_info = _read_entry_info(entry_dir)
+        if (
+            entry_info
+            and entry_info.get("release") == release
+            and all(entry_info.get(key) == value for key, value in source_stat.items())
+        ):
+            return entry_dir
+    return None
+
+
+def warm(
+    filepath: Path,
+    cache_dir: Path = DEFAULT_CACHE_DIR,
+    chunksize: int = rrf.DEFAULT_CHUNKSIZE,
+) -> Path:
+    """
+    Parses an RRF file into the cache unless a current entry already exists.
+    The file is streamed in chunks, so warming never holds the whole table in memory.
+    The source is only hashed when its size or modified time differ from the entry's,
+    hashing RXNSAT takes about as long as reading it.
+
+    Returns:
+        Path: Directory of the cache entry
+    """
+    filepath = Path(filepath)
+    table_name = rrf.rrf_table_name(filepath)
+    release = release_date(filepath)
+    source_stat = _source_stat(filepath)
+    table_dir = Path(cache_dir) / table_name
+    entry_dir = _unchanged_entry(table_dir, release, source_stat)
+    if entry_dir is not None:
+        logger.info(f"Cache is current for {filepath}: {entry_dir}")
+        return entry_dir
+
+    digest = file_digest(filepath)
+    entry_dir = table_dir / cache_key(release, digest)
+    entry_info = _read_entry_info(entry_dir)
+    if entry_info is not None:
+        # Same contents with a new modified time, ie copied or touched
+        entry_info.update(source_stat)
+        (entry_dir / ENTRY_INFO_FILE).write_text(json.dumps(entry_info, indent=2))
+        logger.info(f"Cache is current for {filepath}: {entry_dir}")
+        return entry_dir
+
+    # Only one entry per table is kept, anything else is stale
+    if table_dir.exists():
+        for stale_dir in table_dir.iterdir():
+            logger.info(f"Removing stale cache entry {stale_dir}")
+            shutil.rmtree(stale_dir)
+
+    partition_col = PARTITION_COLUMNS.get(table_name)
+    tmp_dir = entry_dir.with_name(f"{entry_dir.name}.tmp")
+    tmp_dir.mkdir(parents=True)
+    rows = 0
+    for chunk_num, chunk in enumerate(rrf.iter_rrf(filepath, chunksize=chunksize)):
+        table = _to_arrow(chunk)
+        if partition_col:
+            pq.write_to_dataset(
+                table,
+                root_path=str(tmp_dir),
+                partition_cols=[partition_col],
+                basename_template=f"part-{chunk_num:05d}-{{i}}.parquet",
+            )
+        else:
+            pq.write_table(table, tmp_dir / f"part-{chunk_num:05d}.parquet")
+        rows += len(chunk)
+
+    entry_info = {
+        "source": str(filepath.resolve()),
+        "table": table_name,
+        "release": release,
+        "digest": digest,
+        **source_stat,
+        "schema_version": rrf.SCHEMA_VERSION,
+        "partition_col": partition_col,
+        "rows": rows,
+    }
+    (tmp_dir / ENTRY_INFO_FILE).write_text(json.dumps(entry_info, indent=2))
+    tmp_dir.rename(entry_dir)
+    logger.info(f"Cached {rows} rows of {filepath} in {entry_dir}")
+    return entry_dir
+
+
+def _parquet_filters(filters: Optional[rrf.RowFilters]) -> Optional[List]:
+    if not filters:
+        return None
+    return [
+        (
+            (col_name, "==", value)
+            if isinstance(value, str)
+            else (col_name, "in", list(value))
+        )
+        for col_name, value in filters.items()
+    ]
+
+
+def load(
+    filepath: Path,
+    columns: Optional[List[str]] = None,
+    filters: Optional[rrf.RowFilters] = None,
+    cache_dir: Path = DEFAULT_CACHE_DIR,
+) -> pd.DataFrame:
+    """
+    Loads an RRF table from the cache, warming it first if needed.
+    Filters on the partition column only open the matching partitions, and the Parquet
+    files are memory-mapped rather than read into buffers.
+
+    Args:
+        filepath: Location of the source RRF(.gz) file
+        columns: Columns to keep, defaults to all of them
+        filters: Mapping of column name to a required value or collection of values
+
+    Returns:
+        pd.DataFrame: The table with the same columns and dtypes as rrf.read_rrf would
+            return. Entries keep every column, without requested columns the empty ones
+            are dropped here as the filters decide which are empty.
+    """
+    entry_dir = warm(filepath, cache_dir)
+    df = pd.read_parquet(
+        entry_dir,
+        columns=columns,
+        filters=_parquet_filters(filters),
+        memory_map=True,
+    )
+    # Partition columns come back last, so put everything back in the requested order
+    table_name = rrf.rrf_table_name(filepath)
+    headers, _ = rrf.RRF_TABLES[table_name]
+    df = df[columns or [col_name for col_name in headers if col_name in df.columns]]
+    df = rrf.apply_dtypes(df, table_name)
+    return df if columns is not None else rrf.drop_empty_columns(df)
+
+
+def clear(cache_dir: Path = DEFAULT_CACHE_DIR, table_name: Optional[str] = None):
+    """Removes every cache entry, or only the entries for one table."""
+    target = Path(cache_dir) / table_name.upper() if table_name else Path(cache_dir)
+    if target.exists():
+        shutil.rmtree(target)
+        logger.info(f"Removed cache {target}")
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Warm or clear the RRF Parquet cache")
+    parser.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    warm_parser = commands.add_parser("warm", help="Parse RRF files into the cache")
+    warm_parser.add_argument(
+        "rrf_paths",
+        type=Path,
+        nargs="+",
+        help="RRF(.gz) files, or directories containing them",
+    )
+
+    clear_parser = commands.add_parser("clear", help="Remove cached tables")
+    clear_parser.add_argument("--table", choices=list(rrf.RRF_TABLES), default=None)
+
+    parsed = parser.parse_args(args)
+    if parsed.command == "clear":
+        clear(parsed.cache_dir, parsed.table)
+        return
+
+    for rrf_path in parsed.rrf_paths:
+        if rrf_path.is_dir():
+            rrf_files = [
+                filepath
+                for filepath in sorted(rrf_path.iterdir())
+                if ".RRF" in filepath.name.upper()
+                and filepath.name.split(".")[0].upper() in rrf.RRF_TABLES
+            ]
+        else:
+            rrf_files = [rrf_path]
+        for filepath in rrf_files:
+            warm(filepath, parsed.cache_dir)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,172 @@
+"""
+Per stage checkpoints for generate_neo4j_data.py
+
+A build is a few expensive preparation steps (reading the RRF files, partitioning RXNREL,
+joining generic meds and brands) followed by stages that each write some of the import
+files. The checkpoint directory keeps:
+    frames      The prepared DataFrames as Parquet, so a stage can be rerun without
+                reading or joining anything again
+    stages      For each finished stage, the manifest entries of the files it wrote, so
+                the manifest of a resumed build still lists every file, a fingerprint
+                of those entries and the fingerprints of the stages it was built from
+
+Everything is tied to a fingerprint of the input files and build options. Opening the
+checkpoints with a different fingerprint, ie a new release, discards the old ones. A stage
+built from other stages is out of date once any of them is rebuilt with different files.
+"""
+
+import hashlib
+import json
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT_DIR = Path("./checkpoints")
+STATE_FILE = "checkpoint_state.json"
+# Bump when the prepared frames change shape, so older checkpoints aren't reused
+CHECKPOINT_VERSION = 1
+
+
+def input_fingerprint(filepaths: Iterable[Path], **options) -> str:
+    """
+    Identifies a build by the size and modified time of each input file and the options
+    that change its output. Cheap enough to check on every run, unlike hashing the RRF
+    files.
+    """
+    inputs = []
+    for filepath in map(Path, filepaths):
+        stat = filepath.stat() if filepath.exists() else None
+        inputs.append([filepath.name, stat and stat.st_size, stat and stat.st_mtime_ns])
+    fingerprint = json.dumps(
+        {"version": CHECKPOINT_VERSION, "inputs": inputs, "options": options},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:16]
+
+
+class CheckpointStore:
+    def __init__(self, checkpoint_dir: Path, fingerprint: str):
+        self.checkpoint_dir = Path(checkpoint_dir)
+        self.fingerprint = fingerprint
+        self.state = self._read_state()
+        if self.state.get("fingerprint") != fingerprint:
+            if self.state:
+                logger.info(
+                    f"Inputs changed, discarding checkpoints in {checkpoint_dir}"
+                )
+            self.clear()
+
+    def _read_state(self) -> Dict:
+        state_path = self.checkpoint_dir / STATE_FILE
+        if not state_path.exists():
+            return {}
+        try:
+            return json.loads(state_path.read_text())
+        except json.JSONDecodeError:
+            logger.warning(f"Unreadable {state_path}, starting over")
+            return {}
+
+    def _write_state(self):
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        # Written to a temporary file first so a crash never leaves half a state file
+        tmp_path = self.checkpoint_dir / f"{STATE_FILE}.tmp"
+        tmp_path.write_text(json.dumps(self.state, indent=2))
+        tmp_path.replace(self.checkpoint_dir / STATE_FILE)
+
+    def clear(self):
+        # Only the files written here, the directory could be shared with anything
+        for frame_path in self.checkpoint_dir.glob("*.parquet*"):
+            frame_path.unlink()
+        self.state = {"fingerprint": self.fingerprint, "frames": [], "stages": {}}
+        self._write_state()
+
+    def _frame_path(self, name: str) -> Path:
+        return self.checkpoint_dir / f"{name}.parquet"
+
+    def has_frames(self, names: Iterable[str]) -> bool:
+        return all(
+            name in self.state["frames"] and self._frame_path(name).exists()
+            for name in names
+        )
+
+    def save_frame(self, name: str, df: pd.DataFrame):
+        frame_path = self._frame_path(name)
+        tmp_path = frame_path.with_suffix(".parquet.tmp")
+        # The index isn't used by any stage, positions are enough
+        df.to_parquet(tmp_path, index=False)
+        tmp_path.replace(frame_path)
+        if name not in self.state["frames"]:
+            self.state["frames"].append(name)
+            self._write_state()
+
+    def load_frame(self, name: str) -> pd.DataFrame:
+        if not self.has_frames([name]):
+            raise ValueError(f"No {name} checkpoint in {self.checkpoint_dir}")
+        return pd.read_parquet(self._frame_path(name))
+
+    def stage_fingerprint(self, stage: str) -> Optional[str]:
+        """Fingerprint of the files a finished stage wrote, None when it hasn't finished"""
+        stage_state = self.state["stages"].get(stage)
+        return stage_state.get("fingerprint") if stage_state else None
+
+    def upstream(self, dependencies: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Fingerprints of the stages another stage is built from, to check or finish it"""
+        return {stage: self.stage_fingerprint(stage) for stage in dependencies}
+
+    def outdated(self, stage: str, upstream: Dict[str, Optional[str]]) -> bool:
+        """A finished stage was built from different files of the stages it depends on"""
+        stage_state = self.state["stages"].get(stage)
+        return stage_state is not None and stage_state.get("upstream", {}) != upstream
+
+    def finished(
+        self,
+        stage: str,
+        import_dir: Path,
+        upstream: Optional[Dict[str, Optional[str]]] = None,
+    ) -> Optional[List[Dict]]:
+        """
+        Manifest entries of a finished stage, or None when it hasn't finished, it's
+        outdated against the upstream fingerprints or any of its files are gone from
+        import_dir
+        """
+        stage_state = self.state["stages"].get(stage)
+        if stage_state is None:
+            return None
+        if self.outdated(stage, upstream or {}):
+            return None
+        entries = stage_state["entries"]
+        for entry in entries:
+            paths = [entry["header"]] if entry["header"] else []
+            paths += [file_info["path"] for file_info in entry["files"]]
+            if not all((Path(import_dir) / path).exists() for path in paths):
+                logger.warning(f"Files of the {stage} stage are missing, rebuilding it")
+                return None
+        return entries
+
+    def finish(
+        self,
+        stage: str,
+        entries: List[Dict],
+        upstream: Optional[Dict[str, Optional[str]]] = None,
+    ):
+        """
+        Records a finished stage, its entries and the upstream fingerprints it was built
+        from. Rebuilding a stage with the same files keeps its fingerprint, so the stages
+        that depend on it are still current.
+        """
+        fingerprint = hashlib.sha256(
+            json.dumps(entries, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:16]
+        self.state["stages"][stage] = {
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "fingerprint": fingerprint,
+            "upstream": upstream or {},
+            "entries": entries,
+        }
+        self._write_state()
@@ -0,0 +1,389 @@
+"""
+In-memory RxNorm graph for batch traversals without Neo4j
+
+The relationship maps from generate_neo4j_data.partition_relationship_maps and the NDC to
+RXCUI links are stored as a compressed sparse row (CSR) adjacency. RXCUIs and NDCs are
+interned to int32 node IDs, RXCUIs first and then NDCs, each block sorted so keys are
+looked up with a binary search. Every relationship is stored from both ends with a flag for whether it
+points away from the node, so traversals can follow either direction.
+
+The arrays are saved as .npy files and memory-mapped on load, so workers sharing a graph
+start instantly and share pages through the OS cache:
+    graph = CSRGraph.build(rel_maps, ndc_links, concepts)
+    graph.save(Path("./rxgraph"))
+    graph = CSRGraph.load(Path("./rxgraph"))
+    query_num, ingredient = graph.ingredients(claims["ndc"], kind=NDC)
+
+Queries take many start nodes at once and return (query number, node ID) pairs, so a
+million claims are answered with a handful of NumPy operations per hop.
+"""
+
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+RXCUI = "RXCUI"
+NDC = "NDC"
+NDC_RELA = "aka"
+
+# Directions a traversal step can follow
+OUT = "out"
+IN = "in"
+BOTH = "both"
+
+GRAPH_INFO_FILE = "graph.json"
+ARRAYS = [
+    "rxcui_keys",
+    "ndc_keys",
+    "indptr",
+    "indices",
+    "edge_types",
+    "edge_out",
+    "node_tty",
+]
+
+# A traversal step is a relationship type, or a (type, direction) pair
+PathStep = Union[str, Tuple[str, str]]
+
+
+class CSRGraph:
+    """
+    Args:
+        rxcui_keys: Sorted RXCUIs, node ID i for i < len(rxcui_keys)
+        ndc_keys: Sorted NDCs, node ID len(rxcui_keys) + i
+        indptr: Edges of node i are indices[indptr[i]:indptr[i + 1]]
+        indices: Node at the other end of each edge
+        edge_types: Code of each edge's relationship type, see rela_types
+        edge_out: True where the edge points from the node to indices
+        node_tty: Code of each node's term type, see ttys, -1 when unknown
+    """
+
+    def __init__(
+        self,
+        rxcui_keys: np.ndarray,
+        ndc_keys: np.ndarray,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        edge_types: np.ndarray,
+        edge_out: np.ndarray,
+        node_tty: np.ndarray,
+        rela_types: List[str],
+        ttys: List[str],
+    ):
+        self.rxcui_keys = rxcui_keys
+        self.ndc_keys = ndc_keys
+        self.indptr = indptr
+        self.indices = indices
+        self.edge_types = edge_types
+        self.edge_out = edge_out
+        self.node_tty = node_tty
+        self.rela_types = rela_types
+        self.ttys = ttys
+
+    @property
+    def node_count(self) -> int:
+        return len(self.rxcui_keys) + len(self.ndc_keys)
+
+    @property
+    def edge_count(self) -> int:
+        """Relationships in the graph, each is stored once from each end"""
+        return len(self.indices) // 2
+
+    @classmethod
+    def build(
+        cls,
+        rel_maps: Union[Dict[str, pd.DataFrame], Iterable[pd.DataFrame]],
+        ndc_links: Optional[pd.DataFrame] = None,
+        concepts: Optional[pd.DataFrame] = None,
+    ) -> "CSRGraph":
+        """
+        Builds the graph with relationships pointing from rxcui2 to rxcui1 and from NDC to
+        RXCUI, the same as the import files.
+
+        Args:
+            rel_maps: Relationship type mapped to a frame with rxcui1 and rxcui2 columns,
+                      or frames with a :TYPE or rela column as well
+            ndc_links: Frame with ndc and rxcui columns, stored as aka relationships
+            concepts: Frame with rxcui and tty columns, used to find ingredients
+        """
+        if isinstance(rel_maps, dict):
+            rel_maps = [
+                rel_map.assign(**{":TYPE": rela_type})
+                for rela_type, rel_map in rel_maps.items()
+            ]
+        rels = pd.concat(
+            [
+                rel_map.rename(columns={"rela": ":TYPE"})[["rxcui2", "rxcui1", ":TYPE"]]
+                for rel_map in rel_maps
+            ],
+            ignore_index=True,
+        ).astype("string")
+        rels = rels.dropna().set_axis(["start", "end", "type"], axis=1)
+        links = (
+            ndc_links[["ndc", "rxcui"]].astype("string").dropna()
+            if ndc_links is not None
+            else pd.DataFrame({"ndc": [], "rxcui": []}, dtype="string")
+        )
+
+        rxcui_values = [rels["start"], rels["end"], links["rxcui"]]
+        if concepts is not None:
+            rxcui_values.append(concepts["rxcui"].dropna().astype("string"))
+        rxcui_keys = _sorted_keys(pd.concat(rxcui_values, ignore_index=True))
+        ndc_keys = _sorted_keys(links["ndc"])
+        graph = cls(rxcui_keys, ndc_keys, *(np.empty(0),) * 5, rela_types=[], ttys=[])
+
+        starts = np.concatenate(
+            [graph.node_ids(rels["start"]), graph.node_ids(links["ndc"], kind=NDC)]
+        )
+        ends = np.concatenate(
+            [graph.node_ids(rels["end"]), graph.node_ids(links["rxcui"])]
+        )
+        type_codes, rela_types = pd.factorize(
+            pd.concat(
+                [rels["type"], pd.Series(NDC_RELA, index=links.index, dtype="string")],
+                ignore_index=True,
+            )
+        )
+        graph.rela_types = [str(rela_type) for rela_type in rela_types]
+
+        # Keep one of each relationship, then store it from both ends
+        edges = pd.DataFrame({"start": starts, "end": ends, "type": type_codes})
+        edges = edges.drop_duplicates()
+        source = np.concatenate([edges["start"], edges["end"]]).astype(np.int32)
+        target = np.concatenate([edges["end"], edges["start"]]).astype(np.int32)
+        edge_types = np.concatenate([edges["type"], edges["type"]]).astype(np.int8)
+        edge_out = np.repeat([True, False], len(edges))
+        order = np.lexsort((target, edge_types, source))
+        graph.indices = target[order]
+        graph.edge_types = edge_types[order]
+        graph.edge_out = edge_out[order]
+        graph.indptr = np.zeros(graph.node_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(source, minlength=graph.node_count), out=graph.indptr[1:])
+
+        graph.node_tty = np.full(graph.node_count, -1, dtype=np.int8)
+        if concepts is not None:
+            tty = concepts[["rxcui", "tty"]].dropna().astype("string")
+            tty = tty.drop_duplicates(subset="rxcui")
+            tty_codes, ttys = pd.factorize(tty["tty"])
+            graph.node_tty[graph.node_ids(tty["rxcui"])] = tty_codes
+            graph.ttys = [str(tty_name) for tty_name in ttys]
+
+        logger.info(
+            f"Built graph with {len(rxcui_keys)} RXCUIs, {len(ndc_keys)} NDCs "
+            f"and {graph.edge_count} relationships"
+        )
+        return graph
+
+    def save(self, graph_dir: Path) -> Path:
+        graph_dir = Path(graph_dir)
+        graph_dir.mkdir(parents=True, exist_ok=True)
+        for array_name in ARRAYS:
+            np.save(graph_dir / f"{array_name}.npy", getattr(self, array_name))
+        graph_info = {
+            "rela_types": self.rela_types,
+            "ttys": self.ttys,
+            "nodes": self.node_count,
+            "relationships": self.edge_count,
+        }
+        (graph_dir / GRAPH_INFO_FILE).write_text(json.dumps(graph_info, indent=2))
+        logger.info(f"Saved graph to {graph_dir}")
+        return graph_dir
+
+    @classmethod
+    def load(cls, graph_dir: Path, mmap: bool = True) -> "CSRGraph":
+        """Loads a saved graph, memory-mapping the arrays unless mmap is False."""
+        graph_dir = Path(graph_dir)
+        graph_info = json.loads((graph_dir / GRAPH_INFO_FILE).read_text())
+        arrays = {
+            array_name: np.load(
+                graph_dir / f"{array_name}.npy", mmap_mode="r" if mmap else None
+            )
+            for array_name in ARRAYS
+        }
+        return cls(
+            **arrays, rela_types=graph_info["rela_types"], ttys=graph_info["ttys"]
+        )
+
+    def node_ids(self, keys: Iterable, kind: str = RXCUI) -> np.ndarray:
+        """Node IDs for RXCUIs or NDCs, -1 for keys that aren't in the graph."""
+        if kind not in (RXCUI, NDC):
+            raise ValueError(f"Node kind must be {RXCUI} or {NDC}")
+        key_array = self.rxcui_keys if kind == RXCUI else self.ndc_keys
+        offset = 0 if kind == RXCUI else len(self.rxcui_keys)
+        keys = pd.Series(keys, dtype="string").fillna("").to_numpy(dtype=str)
+        positions = np.searchsorted(key_array, keys)
+        positions = np.minimum(positions, max(len(key_array) - 1, 0))
+        found = (
+            key_array[positions] == keys
+            if len(key_array)
+            else np.zeros(len(keys), dtype=bool)
+        )
+        return np.where(found, positions + offset, -1).astype(np.int32)
+
+    def node_keys(self, node_ids: np.ndarray) -> np.ndarray:
+        """RXCUI or NDC for each node ID"""
+        node_ids = np.asarray(node_ids)
+        rxcui_count = len(self.rxcui_keys)
+        is_rxcui = node_ids < rxcui_count
+        keys = np.empty(len(node_ids), dtype=object)
+        keys[is_rxcui] = self.rxcui_keys[node_ids[is_rxcui]]
+        keys[~is_rxcui] = self.ndc_keys[node_ids[~is_rxcui] - rxcui_count]
+        return keys
+
+    def is_ndc(self, node_ids: np.ndarray) -> np.ndarray:
+        return np.asarray(node_ids) >= len(self.rxcui_keys)
+
+    def has_tty(self, node_ids: np.ndarray, tty: str) -> np.ndarray:
+        if tty not in self.ttys:
+            return np.zeros(len(node_ids), dtype=bool)
+        return self.node_tty[np.asarray(node_ids)] == self.ttys.index(tty)
+
+    def _expand(
+        self,
+        query_nums: np.ndarray,
+        node_ids: np.ndarray,
+        rela_types: Optional[Sequence[str]] = None,
+        direction: str = BOTH,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """One hop from every (query, node) pair along the matching edges."""
+        starts = self.indptr[node_ids]
+        counts = (self.indptr[node_ids + 1] - starts).astype(np.int64)
+        total = int(counts.sum())
+        # Position of every edge of every node, without a Python loop over nodes
+        edge_pos = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(
+            total
+        )
+        query_nums = np.repeat(query_nums, counts)
+
+        keep = np.ones(total, dtype=bool)
+        if rela_types is not None:
+            type_codes = [
+                self.rela_types.index(rela_type)
+                for rela_type in rela_types
+                if rela_type in self.rela_types
+            ]
+            keep &= np.isin(self.edge_types[edge_pos], type_codes)
+        if direction == OUT:
+            keep &= self.edge_out[edge_pos]
+        elif direction == IN:
+            keep &= ~self.edge_out[edge_pos]
+        elif direction != BOTH:
+            raise ValueError(f"Direction must be {OUT}, {IN} or {BOTH}")
+        return query_nums[keep], self.indices[edge_pos[keep]]
+
+    def _unique_pairs(
+        self, query_nums: np.ndarray, node_ids: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        pair_keys = np.unique(
+            query_nums.astype(np.int64) * self.node_count + node_ids.astype(np.int64)
+        )
+        return pair_keys // self.node_count, (pair_keys % self.node_count).astype(
+            np.int32
+        )
+
+    def _start(self, start_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        start_ids = np.asarray(start_ids, dtype=np.int32)
+        query_nums = np.arange(len(start_ids), dtype=np.int64)
+        known = start_ids >= 0
+        return query_nums[known], start_ids[known]
+
+    def k_hop(
+        self,
+        start_ids: np.ndarray,
+        k: int,
+        rela_types: Optional[Sequence[str]] = None,
+        direction: str = BOTH,
+        include_start: bool = False,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Every node within k hops of each start node.
+
+        Args:
+            start_ids: Node IDs, one per query. -1 finds nothing.
+            k: Most hops to take
+            rela_types: Relationship types to follow, defaults to all of them
+            direction: Follow relationships OUT of, IN to, or BOTH ways from each node
+            include_start: Also return each start node itself
+
+        Returns:
+            Query number (position in start_ids) and node ID arrays, sorted by query
+        """
+        query_nums, node_ids = self._start(start_ids)
+        seen_keys = query_nums * self.node_count + node_ids
+        frontier = (query_nums, node_ids)
+        for _ in range(k):
+            next_nums, next_ids = self._expand(*frontier, rela_types, direction)
+            next_nums, next_ids = self._unique_pairs(next_nums, next_ids)
+            next_keys = next_nums * self.node_count + next_ids
+            new = ~np.isin(next_keys, seen_keys, assume_unique=True)
+            frontier = (next_nums[new], next_ids[new])
+            if not len(frontier[0]):
+                break
+            seen_keys = np.union1d(seen_keys, next_keys[new])
+
+        if not include_start:
+            start_keys = query_nums * self.node_count + node_ids
+            seen_keys = np.setdiff1d(seen_keys, start_keys, assume_unique=True)
+        seen_keys = np.sort(seen_keys)
+        return seen_keys // self.node_count, (seen_keys % self.node_count).astype(
+            np.int32
+        )
+
+    def typed_path(
+        self, start_ids: np.ndarray, path: Sequence[PathStep]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Nodes at the end of a path of relationship types from each start node, ie
+        [("aka", OUT), ("has_ingredient", BOTH)] from NDCs. A plain type follows both
+        directions.
+
+        Returns:
+            Query number and node ID arrays, sorted by query
+        """
+        query_nums, node_ids = self._start(start_ids)
+        for step in path:
+            rela_type, direction = (step, BOTH) if isinstance(step, str) else step
+            query_nums, node_ids = self._expand(
+                query_nums, node_ids, [rela_type], direction
+            )
+            query_nums, node_ids = self._unique_pairs(query_nums, node_ids)
+        return query_nums, node_ids
+
+    def ingredients(
+        self, keys: Iterable, kind: str = RXCUI, hops: int = 3
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        IN concepts within hops of each RXCUI or NDC, the same as the import's
+        has_active_ingredient relationships for NDCs.
+
+        Returns:
+            Query number (position in keys) and ingredient RXCUI arrays
+        """
+        query_nums, node_ids = self.k_hop(
+            self.node_ids(keys, kind), hops, include_start=True
+        )
+        found = self.has_tty(node_ids, "IN")
+        return query_nums[found], self.node_keys(node_ids[found])
+
+    def ndcs(self, rxcuis: Iterable, hops: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        NDCs within hops of each RXCUI.
+
+        Returns:
+            Query number (position in rxcuis) and NDC arrays
+        """
+        query_nums, node_ids = self.k_hop(self.node_ids(rxcuis), hops)
+        found = self.is_ndc(node_ids)
+        return query_nums[found], self.node_keys(node_ids[found])
+
+
+def _sorted_keys(keys: pd.Series) -> np.ndarray:
+    # Fixed width unicode so the keys can be memory-mapped and binary searched
+    unique_keys = np.unique(keys.dropna().to_numpy(dtype=str))
+    return unique_keys if len(unique_keys) else np.array([], dtype="<U1")
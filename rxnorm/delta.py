@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+"""
+Delta builds between two sets of Neo4j import files
+
+Compares the files listed in a previous build's import manifest with a new build and
+writes only the nodes and relationships that were added, changed or retired, plus a
+delta manifest. The applier sends those rows to a running database in UNWIND batches,
+so an update doesn't need a full fill_db.sh reimport.
+
+Nodes are matched on their ID across every file of their ID space, so a concept that moved
+between rxcui_<TTY>_nodes files keeps its node and relationships and only swaps labels.
+Relationships are matched on their start ID, end ID and type, any other column changing
+makes them "changed". The BUILD node is updated last, once the rest of the graph is current.
+
+Weekly RxNorm updates only contain the concepts that changed, so a build from one is
+partial. Use partial=True for those, which skips retiring anything that isn't in the update.
+
+Usage:
+    python -m rxnorm.delta diff import_prev/import_manifest.json import/import_manifest.json
+    python -m rxnorm.delta apply import/delta/delta_manifest.json --uri bolt://127.0.0.1:7687
+"""
+
+import argparse
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import pandas as pd
+
+import neo4j
+from rxnorm import graph, neo4j_import
+
+logger = logging.getLogger(__name__)
+
+DELTA_MANIFEST_FILE = "delta_manifest.json"
+DEFAULT_BATCH_SIZE = graph.DEFAULT_BATCH_SIZE
+ADDED = "added"
+CHANGED = "changed"
+RETIRED = "retired"
+# Node rows now in another file of the same ID space, with the labels they no longer have
+MOVED = "moved"
+LABEL_HEADER = ":LABEL"
+TYPE_HEADER = ":TYPE"
+
+
+def read_import_entry(
+    import_dir: Path, entry: Dict, columns: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """
+    Reads the header and data files of a manifest entry back into one string frame,
+    optionally only some of its columns.
+    """
+    import_dir = Path(import_dir)
+    header = None
+    if entry["header"]:
+        header = pd.read_csv(import_dir / entry["header"], dtype="string").columns
+    frames = [
+        pd.read_csv(
+            import_dir / file_info["path"],
+            dtype="string",
+            header=None if header is not None else "infer",
+            names=header,
+            usecols=columns,
+        )
+        for file_info in entry["files"]
+        # Files written from an empty frame have no header to read
+        if file_info["rows"] or header is None and _has_header(import_dir, file_info)
+    ]
+    if not frames:
+        if columns is not None:
+            return pd.DataFrame(columns=columns)
+        return pd.DataFrame(columns=header if header is not None else [])
+    return pd.concat(frames, ignore_index=True)
+
+
+def _has_header(import_dir: Path, file_info: Dict) -> bool:
+    try:
+        pd.read_csv(import_dir / file_info["path"], nrows=0)
+    except pd.errors.EmptyDataError:
+        return False
+    return True
+
+
+def _key_headers(df: pd.DataFrame, kind: str) -> List[str]:
+    if kind == neo4j_import.NODES:
+        return [header for header in df.columns if ":ID(" in header]
+    return [
+        header
+        for header in df.columns
+        if ":START_ID(" in header or ":END_ID(" in header or header == TYPE_HEADER
+    ]
+
+
+def _id_header(headers) -> Optional[str]:
+    return next((header for header in headers if ":ID(" in header), None)
+
+
+def _labels(df: pd.DataFrame, entry: Dict) -> pd.Series:
+    """Label set of each node row, from its :LABEL column or else the manifest entry"""
+    if LABEL_HEADER in df.columns:
+        return df[LABEL_HEADER].fillna("")
+    return pd.Series(";".join(entry["labels"] or []), index=df.index, dtype="string")
+
+
+def _entry_headers(import_dir: Path, entry: Dict) -> List[str]:
+    """Every column of an entry's files, the manifest's headers leave out :LABEL"""
+    if entry["header"]:
+        return list(pd.read_csv(Path(import_dir) / entry["header"], nrows=0).columns)
+    for file_info in entry["files"]:
+        if _has_header(import_dir, file_info):
+            return list(
+                pd.read_csv(Path(import_dir) / file_info["path"], nrows=0).columns
+            )
+    return []
+
+
+def _node_labels(manifest: neo4j_import.ImportManifest) -> Dict[str, pd.Series]:
+    """
+    Labels of every node in a build by ID space, indexed by node ID. Only the ID and label
+    columns are read.
+    """
+    node_labels: Dict[str, List[pd.Series]] = {}
+    for entry in manifest.entries:
+        id_header = _id_header(entry["headers"])
+        if entry["kind"] != neo4j_import.NODES or id_header is None:
+            continue
+        columns = [id_header]
+        if LABEL_HEADER in _entry_headers(manifest.import_dir, entry):
+            columns.append(LABEL_HEADER)
+        df = read_import_entry(manifest.import_dir, entry, columns).dropna(
+            subset=[id_header]
+        )
+        node_labels.setdefault(entry["id_spaces"]["ID"], []).append(
+            pd.Series(_labels(df, entry).to_numpy(), index=df[id_header].to_numpy())
+        )
+    return {
+        id_space: pd.concat(labels) if len(labels) > 1 else labels[0]
+        for id_space, labels in node_labels.items()
+    }
+
+
+def _moved_nodes(
+    previous_df: pd.DataFrame,
+    current_df: pd.DataFrame,
+    previous_entry: Dict,
+    current_labels: pd.Series,
+) -> pd.DataFrame:
+    """
+    Rows of a previous node file whose ID is now in another file of the same ID space,
+    with :LABEL set to the labels the node no longer has
+    """
+    id_header = _id_header(previous_df.columns)
+    if id_header is None:
+        return pd.DataFrame(columns=[LABEL_HEADER])
+    ids = previous_df[id_header]
+    moved = ids.isin(current_labels.index).to_numpy()
+    if id_header in current_df.columns:
+        moved &= ~ids.isin(current_df[id_header]).to_numpy()
+    old_labels = _labels(previous_df, previous_entry)[moved]
+    new_labels = current_labels[~current_labels.index.duplicated()].reindex(ids[moved])
+    dropped = [
+        ";".join(
+            label for label in old.split(";") if label and label not in new.split(";")
+        )
+        for old, new in zip(old_labels, new_labels.fillna(""))
+    ]
+    moved_rows = pd.DataFrame(
+        {id_header: ids[moved].to_numpy(), LABEL_HEADER: dropped}, dtype="string"
+    )
+    return moved_rows[moved_rows[LABEL_HEADER] != ""].reset_index(drop=True)
+
+
+def diff_entry(previous: pd.DataFrame, current: pd.DataFrame, kind: str, partial=False):
+    """
+    Splits the rows of one import file set into added, changed and retired.
+
+    Returns:
+        Dict: "added", "changed" and "retired" frames with the import headers
+    """
+    columns = list(dict.fromkeys([*current.columns, *previous.columns]))
+    previous = previous.reindex(columns=columns)
+    current = current.reindex(columns=columns)
+    key_headers = _key_headers(current if len(current.columns) else previous, kind)
+    if not key_headers:
+        # Only header-less, empty files have no key columns
+        return {
+            ADDED: current,
+            CHANGED: current.iloc[0:0],
+            RETIRED: previous.iloc[0:0] if partial else previous,
+        }
+    value_headers = [header for header in columns if header not in key_headers]
+
+    previous_keys = pd.MultiIndex.from_frame(previous[key_headers].fillna(""))
+    current_keys = pd.MultiIndex.from_frame(current[key_headers].fillna(""))
+    in_previous = current_keys.isin(previous_keys)
+    in_current = previous_keys.isin(current_keys)
+
+    changed = pd.Series(False, index=current.index)
+    if value_headers and in_previous.any():
+        # Hash the non-key columns so rows only need comparing once per side
+        previous_hashes = pd.Series(
+            pd.util.hash_pandas_object(
+                previous[value_headers].fillna(""), index=False
+            ).to_numpy(),
+            index=previous_keys,
+        )
+        previous_hashes = previous_hashes[~previous_hashes.index.duplicated()]
+        current_hashes = pd.util.hash_pandas_object(
+            current[value_headers].fillna(""), index=False
+        ).to_numpy()
+        matched = previous_hashes.reindex(current_keys).to_numpy()
+        changed = pd.Series(
+            in_previous & (matched != current_hashes), index=current.index
+        )
+
+    return {
+        ADDED: current[~in_previous],
+        CHANGED: current[changed.to_numpy()],
+        RETIRED: previous.iloc[0:0] if partial else previous[~in_current],
+    }
+
+
+def write_delta(
+    previous_manifest_path: Path,
+    current_manifest_path: Path,
+    out_dir: Optional[Path] = None,
+    partial: bool = False,
+) -> Path:
+    """
+    Compares two builds and writes the delta files and delta manifest.
+
+    Args:
+        previous_manifest_path: Import manifest of the build loaded in the database
+        current_manifest_path: Import manifest of the new build
+        out_dir: Where the delta is written, defaults to <current import dir>/delta
+        partial: The new build only covers part of the data, ie a weekly update,
+                 so nothing is retired
+
+    Returns:
+        Path: Delta manifest
+    """
+    previous = neo4j_import.ImportManifest.load(previous_manifest_path)
+    current = neo4j_import.ImportManifest.load(current_manifest_path)
+    out_dir = Path(out_dir or current.import_dir / "delta")
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    previous_entries = {entry["name"]: entry for entry in previous.entries}
+    current_entries = {entry["name"]: entry for entry in current.entries}
+    # A node ID is unique in its ID space rather than its file, so a node is only retired
+    # once its ID is gone from every current file
+    current_labels = _node_labels(current)
+    delta_entries = []
+    for name in dict.fromkeys([*current_entries, *previous_entries]):
+        current_entry = current_entries.get(name)
+        previous_entry = previous_entries.get(name)
+        entry = current_entry or previous_entry
+        # Nodes of a file left out of a partial build could still have moved elsewhere
+        if current_entry is None and partial and entry["kind"] != neo4j_import.NODES:
+            continue
+        current_df = (
+            read_import_entry(current.import_dir, current_entry)
+            if current_entry
+            else pd.DataFrame()
+        )
+        previous_df = (
+            read_import_entry(previous.import_dir, previous_entry)
+            if previous_entry
+            else pd.DataFrame()
+        )
+
+        delta_entry = {
+            "name": name,
+            "kind": entry["kind"],
+            "id_spaces": (current_entry or {}).get("id_spaces")
+            or (previous_entry or {}).get("id_spaces"),
+        }
+        changes = diff_entry(previous_df, current_df, entry["kind"], partial)
+        if entry["kind"] == neo4j_import.NODES:
+            id_space = delta_entry["id_spaces"]["ID"]
+            space_labels = current_labels.get(id_space, pd.Series(dtype="string"))
+            retired = changes[RETIRED]
+            id_header = _id_header(retired.columns)
+            if id_header is not None:
+                changes[RETIRED] = retired[~retired[id_header].isin(space_labels.index)]
+            changes[MOVED] = _moved_nodes(
+                previous_df, current_df, previous_entry or entry, space_labels
+            )
+        for change, changed_rows in changes.items():
+            delta_path = out_dir / f"{name}.{change}.csv"
+            changed_rows.to_csv(delta_path, index=False)
+            delta_entry[change] = {"path": delta_path.name, "rows": len(changed_rows)}
+        delta_entries.append(delta_entry)
+        logger.info(
+            f"Delta for {name}: "
+            + ", ".join(f"{delta_entry[change]['rows']} {change}" for change in changes)
+        )
+
+    delta_manifest_path = out_dir / DELTA_MANIFEST_FILE
+    delta_manifest_path.write_text(
+        json.dumps(
+            {
+                "previous": str(Path(previous_manifest_path).resolve()),
+                "current": str(Path(current_manifest_path).resolve()),
+                "partial": partial,
+                "id_properties": _id_properties(current.entries + previous.entries),
+                "entries": delta_entries,
+            },
+            indent=2,
+        )
+    )
+    logger.info(f"Saved delta manifest {delta_manifest_path}")
+    return delta_manifest_path
+
+
+def _id_properties(entries: List[Dict]) -> Dict[str, str]:
+    """
+    Node property holding the ID for each ID space. neo4j-admin stores an
+    'rxcui:ID(RXCUI)' column as the rxcui property on nodes in the RXCUI space.
+    """
+    id_properties = {}
+    for entry in entries:
+        if entry["kind"] != neo4j_import.NODES or "ID" not in entry["id_spaces"]:
+            continue
+        for header in entry["headers"]:
+            if ":ID(" in header:
+                id_properties.setdefault(entry["id_spaces"]["ID"], header.split(":")[0])
+    return id_properties
+
+
+def _batches(rows: List[Dict], batch_size: int) -> Iterator[List[Dict]]:
+    for start in range(0, len(rows), batch_size):
+        yield rows[start : start + batch_size]
+
+
+def _records(df: pd.DataFrame) -> List[Dict]:
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+def _node_queries(df: pd.DataFrame, id_property: str, id_space: str, change: str):
+    """Yields (query, rows) pairs for one node delta file, grouped by label set."""
+    id_header = next(header for header in df.columns if ":ID(" in header)
+    property_headers = {
+        header: header.split(":")[0]
+        for header in df.columns
+        if header not in (id_header, LABEL_HEADER)
+    }
+    node_match = f"(n:{graph.cypher_name(id_space)} {{{graph.cypher_name(id_property)}: row.id}})"
+
+    if change == RETIRED:
+        rows = [{"id": node_id} for node_id in df[id_header].dropna()]
+        yield f"UNWIND $rows AS row MATCH {node_match} DETACH DELETE n", rows
+        return
+
+    if change == MOVED:
+        for label_value, label_rows in df.groupby(LABEL_HEADER, sort=False):
+            labels = "".join(
+                f":{graph.cypher_name(label)}" for label in label_value.split(";")
+            )
+            rows = [{"id": node_id} for node_id in label_rows[id_header].dropna()]
+            yield f"UNWIND $rows AS row MATCH {node_match} REMOVE n{labels}", rows
+        return
+
+    if LABEL_HEADER in df.columns:
+        labels = df[LABEL_HEADER].fillna("")
+    else:
+        labels = pd.Series("", index=df.index)
+    for label_value, label_rows in df.groupby(labels, sort=False):
+        label_set = "".join(
+            f":{graph.cypher_name(label)}" for label in label_value.split(";") if label
+        )
+        set_labels = f" SET n{label_set}" if label_set else ""
+        rows = [
+            {
+                "id": record[id_header],
+                "props": {
+                    property_headers[header]: record[header]
+                    for header in property_headers
+                },
+            }
+            for record in _records(label_rows)
+        ]
+        yield (
+            f"UNWIND $rows AS row MERGE {node_match} SET n += row.props{set_labels}",
+            rows,
+        )
+
+
+def _relationship_queries(df: pd.DataFrame, id_properties: Dict[str, str], change: str):
+    """Yields (query, rows) pairs for one relationship delta file, grouped by type."""
+    start_header = next(header for header in df.columns if ":START_ID(" in header)
+    end_header = next(header for header in df.columns if ":END_ID(" in header)
+    start_space = start_header.split("(")[1].rstrip(")")
+    end_space = end_header.split("(")[1].rstrip(")")
+    property_headers = {
+        header: header.split(":")[0]
+        for header in df.columns
+        if header not in (start_header, end_header, TYPE_HEADER)
+    }
+    start_match = f"(a:{graph.cypher_name(start_space)} {{{graph.cypher_name(id_properties[start_space])}: row.start}})"
+    end_match = f"(b:{graph.cypher_name(end_space)} {{{graph.cypher_name(id_properties[end_space])}: row.end}})"
+
+    for rela_type, type_rows in df.groupby(TYPE_HEADER, sort=False):
+        rows = [
+            {
+                "start": record[start_header],
+                "end": record[end_header],
+                "props": {
+                    property_headers[header]: record[header]
+                    for header in property_headers
+                },
+            }
+            for record in _records(type_rows)
+        ]
+        rel = f"[r:{graph.cypher_name(rela_type)}]"
+        if change == RETIRED:
+            query = (
+                f"UNWIND $rows AS row MATCH {start_match}-{rel}->{end_match} DELETE r"
+            )
+        else:
+            query = (
+                f"UNWIND $rows AS row MATCH {start_match} MATCH {end_match} "
+                f"MERGE (a)-{rel}->(b) SET r += row.props"
+            )
+        yield query, rows
+
+
+def delta_queries(delta_manifest_path: Path) -> Iterator:
+    """
+    Yields (query, rows) pairs that apply a delta. Nodes are upserted first and moved nodes
+    lose the labels of their old file, then relationships are upserted, retired
+    relationships and then retired nodes are deleted. The BUILD node goes last, so its new
+    version, which the webapp caches responses under, never comes before the graph it
+    describes.
+    """
+    delta_manifest_path = Path(delta_manifest_path)
+    delta_manifest = json.loads(delta_manifest_path.read_text())
+    delta_dir = delta_manifest_path.parent
+    id_properties = delta_manifest["id_properties"]
+    steps = [
+        (neo4j_import.NODES, (ADDED, CHANGED), False),
+        (neo4j_import.NODES, (MOVED,), False),
+        (neo4j_import.RELATIONSHIPS, (ADDED, CHANGED), False),
+        (neo4j_import.RELATIONSHIPS, (RETIRED,), False),
+        (neo4j_import.NODES, (RETIRED,), False),
+        (neo4j_import.NODES, (ADDED, CHANGED, RETIRED), True),
+    ]
+    for kind, changes, build_info in steps:
+        for entry in delta_manifest["entries"]:
+            if entry["kind"] != kind:
+                continue
+            if (entry["name"] == neo4j_import.BUILD_INFO_NAME) != build_info:
+                continue
+            for change in changes:
+                # Older delta manifests have no moved files
+                if not entry.get(change, {}).get("rows"):
+                    continue
+                df = pd.read_csv(delta_dir / entry[change]["path"], dtype="string")
+                if kind == neo4j_import.NODES:
+                    id_space = entry["id_spaces"]["ID"]
+                    yield from _node_queries(
+                        df, id_properties[id_space], id_space, change
+                    )
+                else:
+                    yield from _relationship_queries(df, id_properties, change)
+
+
+def apply_delta(
+    driver: neo4j.Driver,
+    delta_manifest_path: Path,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    database: Optional[str] = None,
+) -> int:
+    """Applies a delta to a running database in UNWIND batches. Returns the rows sent."""
+    rows_sent = 0
+    with driver.session(database=database) as session:
+        for query, rows in delta_queries(delta_manifest_path):
+            rows_sent += graph.run_unwind_batches(
+                session, query, _batches(rows, batch_size)
+            )
+    return rows_sent
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Build or apply a delta between builds"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    diff_parser = commands.add_parser("diff", help="Write the delta between two builds")
+    diff_parser.add_argument("previous_manifest", type=Path)
+    diff_parser.add_argument("current_manifest", type=Path)
+    diff_parser.add_argument("--out-dir", type=Path, default=None)
+    diff_parser.add_argument(
+        "--partial", action="store_true", help="New build is from a weekly update"
+    )
+
+    apply_parser = commands.add_parser("apply", help="Apply a delta to Neo4j")
+    apply_parser.add_argument("delta_manifest", type=Path)
+    apply_parser.add_argument(
+        "--uri", default=os.getenv("NEO4J_URI", "bolt://127.0.0.1:7687")
+    )
+    apply_parser.add_argument("--user", default=os.getenv("NEO4J_USER", "neo4j"))
+    apply_parser.add_argument("--database", default=os.getenv("NEO4J_DATABASE"))
+    apply_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+
+    parsed = parser.parse_args(args)
+    if parsed.command == "diff":
+        write_delta(
+            parsed.previous_manifest,
+            parsed.current_manifest,
+            parsed.out_dir,
+            parsed.partial,
+        )
+        return
+
+    password = os.getenv("NEO4J_PASSWORD", "neo4j")
+    with neo4j.GraphDatabase.driver(parsed.uri, auth=(parsed.user, password)) as driver:
+        rows_sent = apply_delta(
+            driver, parsed.delta_manifest, parsed.batch_size, parsed.database
+        )
+    logger.info(f"Delta applied, {rows_sent} rows sent")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -1,15 +1,28 @@
 import copy
 import logging
-import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional
 
+import numpy as np
 import pandas as pd
 
 import neo4j
+from rxnorm import ndc, neo4j_import, profiling
 
 logger = logging.getLogger(__name__)
 
+# Rows sent per UNWIND statement for online loads
+DEFAULT_BATCH_SIZE = 10_000
+
+# Property holding the ID for each node ID space, matching the import CSV ID columns
+ID_PROPERTIES = {
+    "RXCUI": "rxcui",
+    "NDC": "ndc",
+    "STY": "tui",
+}
+
 
 class RRFNode:
     def __init(self, labels: List, properties: Dict):
@@ -20,8 +33,18 @@ def __init(self, labels: List, properties: Dict):
 class NeoRRF:
     driver = None
 
-    def __init__(self, uri, user, password, run_db_test=True):
+    def __init__(
+        self,
+        uri,
+        user,
+        password,
+        run_db_test=True,
+        database: Optional[str] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ):
         self.driver = neo4j.GraphDatabase.driver(uri, auth=(user, password))
+        self.database = database
+        self.batch_size = batch_size
         if run_db_test:
             try:
                 self.driver.verify_connectivity()
@@ -35,8 +58,108 @@ def close(self):
         # Don't forget to close the driver connection when you are finished with it
         self.driver.close()
 
+    def create_constraints(self, id_properties: Optional[Dict[str, str]] = None):
+        """
+        Creates a uniqueness constraint for each node ID space so MERGE on the ID
+        property uses an index lookup instead of a label scan.
+        """
+        id_properties = id_properties or ID_PROPERTIES
+        with self.driver.session(database=self.database) as session:
+            for label, id_property in id_properties.items():
+                session.run(constraint_query(label, id_property)).consume()
+                logger.info(f"Constraint ready for {label}.{id_property}")
+
+    def write_batches(self, query: str, batches: Iterable[List[Dict]]) -> int:
+        """Runs an UNWIND $rows query once per batch. Returns the rows sent."""
+        with self.driver.session(database=self.database) as session:
+            return run_unwind_batches(session, query, batches)
+
+    def merge_nodes(
+        self,
+        df: pd.DataFrame,
+        id_col: str,
+        label: str,
+        extra_labels: Optional[List[str]] = None,
+        property_cols: Optional[List[str]] = None,
+    ) -> int:
+        """
+        Upserts nodes in UNWIND batches, merging on the ID property of the label and
+        setting every other column as a property. Missing values aren't set.
+
+        Args:
+            df: One row per node
+            id_col: Column holding the node ID, ie rxcui
+            label: Label the node is merged on, ie RXCUI
+            extra_labels: Other labels added to every node, ie ["RXAUI", "IN"]
+            property_cols: Columns set as properties, defaults to all but the ID
+
+        Returns:
+            int: Number of rows sent
+        """
+        if id_col not in df.columns:
+            raise ValueError(f"No {id_col} column for the node IDs")
+        if property_cols is None:
+            property_cols = [col_name for col_name in df.columns if col_name != id_col]
+        nodes = id_strings(
+            df.loc[df[id_col].notna(), [id_col, *property_cols]], [id_col]
+        )
+        nodes = nodes.drop_duplicates(subset=id_col)
+
+        label_set = "".join(
+            f":{cypher_name(node_label.upper())}" for node_label in extra_labels or []
+        )
+        set_labels = f" SET n{label_set}" if label_set else ""
+        query = (
+            f"UNWIND $rows AS row "
+            f"MERGE (n:{cypher_name(label.upper())} {{{cypher_name(id_col)}: row.id}}) "
+            f"SET n += row.props{set_labels}"
+        )
+        batches = (
+            [
+                {"id": record[id_col], "props": _present(record, property_cols)}
+                for record in records
+            ]
+            for records in iter_record_batches(nodes, self.batch_size)
+        )
+        return self.write_batches(query, batches)
+
+    def merge_rel_connections(
+        self,
+        rel: pd.DataFrame,
+        start_col: str = "rxcui2",
+        end_col: str = "rxcui1",
+        rela_col: str = "rela",
+        start_label: str = "RXCUI",
+        end_label: str = "RXCUI",
+        property_cols: Optional[List[str]] = None,
+    ) -> int:
+        """
+        Merges relationships between existing nodes in UNWIND batches, one query per
+        relationship type. Defaults follow the import CSVs, where RXNREL's rxcui2 is the
+        start node and rxcui1 the end node.
+
+        Returns:
+            int: Number of rows sent
+        """
+        property_cols = property_cols or []
+        rel = prepare_relationships(rel, start_col, end_col, rela_col, property_cols)
+        rows_sent = 0
+        for rela_type, type_rows in rel.groupby(rela_col, sort=False, observed=True):
+            query = rel_merge_query(str(rela_type), start_label, end_label)
+            batches = rel_record_batches(
+                type_rows, start_col, end_col, property_cols, self.batch_size
+            )
+            rows_sent += self.write_batches(query, batches)
+        return rows_sent
+
     def create_conso_nodes_by_tty(
-        self, node_df, out_dir=Path("./neo4j_import"), compress=False
+        self,
+        node_df,
+        out_dir=Path("./import"),
+        compress=False,
+        manifest: Optional[neo4j_import.ImportManifest] = None,
+        rows_per_part: Optional[int] = None,
+        workers: Optional[int] = None,
     ):
         """
         Thread safe. Creates a session and uses Neo4j MERGE to create nodes for RXCUI
@@ -60,7 +183,15 @@ def create_conso_nodes_by_tty(
 
             nodes_filename = Path(f"rxcui_{label}_nodes.csv")
             save_node_csv_file(
-                nodes_by_label, nodes_filename, id_col=rxcui, node_label=escaped_label
+                nodes_by_label,
+                nodes_filename,
+                basedir=out_dir,
+                id_col=rxcui,
+                node_label=escaped_label,
+                compress=compress,
+                rows_per_part=rows_per_part,
+                workers=workers,
+                manifest=manifest,
             )
 
     def _set_up_path_merge_queries(self, node1, node2, relation):
@@ -103,6 +234,165 @@ def _merge_and_return_relationship_single(self, session, node1, node2, relation)
         )
 
 
+def cypher_name(name: str) -> str:
+    """Backtick quotes a label, type or property name for Cypher."""
+    return "`" + name.replace("`", "``") + "`"
+
+
+def constraint_name(label: str, id_property: str) -> str:
+    return f"{label}_{id_property}".lower()
+
+
+def constraint_query(label: str, id_property: str) -> str:
+    return (
+        f"CREATE CONSTRAINT {cypher_name(constraint_name(label, id_property))} "
+        f"IF NOT EXISTS FOR (n:{cypher_name(label)}) "
+        f"REQUIRE n.{cypher_name(id_property)} IS UNIQUE"
+    )
+
+
+def id_strings(df: pd.DataFrame, col_names: List[str]) -> pd.DataFrame:
+    """
+    Casts ID columns to strings, the way neo4j-admin import stores :ID properties. RXCUIs
+    load as Int64, and an integer never matches the string ID of an imported node.
+    """
+    return df.astype({col_name: "string" for col_name in col_names})
+
+
+def check_written(
+    result: neo4j.Result, rows: int, query: str, strict: bool = True
+) -> int:
+    """
+    Fails when an UNWIND query returning "written" wrote fewer rows than it was sent, ie
+    relationships whose nodes didn't match. Raised inside the transaction, so the batch is
+    rolled back. With strict=False the rows written are only returned.
+    """
+    record = result.single()
+    if record is None or "written" not in record.keys():
+        return rows
+    if strict and record["written"] < rows:
+        raise ValueError(
+            f"Only {record['written']} of {rows} rows were written, "
+            f"the rest matched no nodes: {query}"
+        )
+    return record["written"]
+
+
+def iter_record_batches(df: pd.DataFrame, batch_size: int) -> Iterator[List[Dict]]:
+    """
+    Yields the rows of a frame as lists of dicts, batch_size rows at a time, with missing
+    values as None. Only one batch is converted at a time.
+    """
+    for start in range(0, len(df), batch_size):
+        block = df.iloc[start : start + batch_size].astype(object)
+        yield block.where(block.notna(), None).to_dict("records")
+
+
+def prepare_relationships(
+    rel: pd.DataFrame,
+    start_col: str,
+    end_col: str,
+    rela_col: str,
+    property_cols: List[str],
+) -> pd.DataFrame:
+    """
+    Keeps the needed columns with the IDs as strings, and drops rows with missing IDs or
+    types and duplicates.
+    """
+    check_cols = [start_col, end_col, rela_col]
+    missing = [col_name for col_name in check_cols if col_name not in rel.columns]
+    if missing:
+        raise ValueError(f"Missing relationship columns: {', '.join(missing)}")
+    rel = rel.loc[rel[check_cols].notna().all(axis=1), [*check_cols, *property_cols]]
+    rel = id_strings(rel, [start_col, end_col])
+    return rel.drop_duplicates(subset=check_cols)
+
+
+def rel_merge_query(
+    rela_type: str, start_label: str = "RXCUI", end_label: str = "RXCUI"
+) -> str:
+    """
+    UNWIND query merging relationships of one type between existing nodes. Returns the
+    number merged as "written", see check_written.
+    """
+    start_label = start_label.upper()
+    end_label = end_label.upper()
+    start_match = (
+        f"(a:{cypher_name(start_label)} "
+        f"{{{cypher_name(ID_PROPERTIES.get(start_label, start_label.lower()))}: row.start}})"
+    )
+    end_match = (
+        f"(b:{cypher_name(end_label)} "
+        f"{{{cypher_name(ID_PROPERTIES.get(end_label, end_label.lower()))}: row.end}})"
+    )
+    return (
+        f"UNWIND $rows AS row MATCH {start_match} MATCH {end_match} "
+        f"MERGE (a)-[r:{cypher_name(rela_type.lower().strip())}]->(b) "
+        f"SET r += row.props "
+        f"RETURN count(r) AS written"
+    )
+
+
+def rel_record_batches(
+    rel: pd.DataFrame,
+    start_col: str,
+    end_col: str,
+    property_cols: List[str],
+    batch_size: int,
+) -> Iterator[List[Dict]]:
+    """Yields the start, end and properties of each relationship, one batch at a time."""
+    for records in iter_record_batches(rel, batch_size):
+        yield [
+            {
+                "start": record[start_col],
+                "end": record[end_col],
+                "props": _present(record, property_cols),
+            }
+            for record in records
+        ]
+
+
+def _present(record: Dict, col_names: List[str]) -> Dict:
+    return {
+        col_name: record[col_name]
+        for col_name in col_names
+        if record[col_name] is not None
+    }
+
+
+def run_unwind_batches(
+    session: neo4j.Session, query: str, batches: Iterable[List[Dict]]
+) -> int:
+    """
+    Runs an UNWIND $rows query in one write transaction per batch. The next batch is built
+    on a helper thread while the current one is in flight, so converting rows overlaps
+    the round trip to the server. Queries returning "written" fail when any row of a batch
+    wasn't written. Returns the rows sent.
+    """
+    batches = iter(batches)
+    rows_sent = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=1) as prefetch:
+        next_batch = prefetch.submit(next, batches, None)
+        while True:
+            batch = next_batch.result()
+            if batch is None:
+                break
+            next_batch = prefetch.submit(next, batches, None)
+            if not batch:
+                continue
+            session.execute_write(
+                lambda tx: check_written(tx.run(query, rows=batch), len(batch), query)
+            )
+            rows_sent += len(batch)
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Sent {rows_sent} rows in {elapsed:.1f}s "
+        f"({rows_sent / max(elapsed, 1e-9):,.0f} rows/s): {query}"
+    )
+    return rows_sent
+
+
 def save_node_csv_file(
     df: pd.DataFrame,
     filename: Path,
@@ -110,56 +400,80 @@ def save_node_csv_file(
     id_col: Optional[str] = None,
     node_label: Optional[str] = None,
     compress=False,
+    rows_per_part: Optional[int] = None,
+    workers: Optional[int] = None,
+    manifest: Optional[neo4j_import.ImportManifest] = None,
 ) -> Path:
     """
     Helps to make sure names and column usage are standardized to fit the Neo4j CSV format guidance.
+    The frame isn't copied, the ID column is renamed in the header only and duplicates are
+    skipped while the file is streamed out.
+    When rows_per_part is set, writes a header file and data parts and returns the header file.
+    Adds the written files to the manifest when one is given.
     """
-    save_df = df.copy()
     filename = Path(filename)
     if basedir:
-        basedir.mkdir(parents=True, exist_ok=True)
         filename = Path(basedir) / filename
     label_str = ":LABEL"
 
-    if id_col and id_col in save_df.columns:
-        new_id_col = id_col
-        if isinstance(node_label, str):
-            new_id_col = f"{id_col}:ID({node_label.upper()})"
-        else:
-            new_id_col = f"{id_col}:ID({node_label[0].upper()})"
-        save_df.rename(columns={id_col: new_id_col}, inplace=True)
-
-    # Ensure ID is unique!!!!
-    original_len = len(save_df)
-    for col_name in save_df.columns:
-        if ":ID" in col_name:
-            save_df.drop_duplicates(subset=col_name, inplace=True)
-    new_len = len(save_df)
-    len_change = original_len - new_len
-    if len_change != 0:
-        logger.warning(
-            f"Dropped {len_change} rows from data going into {filename}. {new_len} records left."
-        )
+    with profiling.stage(
+        f"save_node_csv_file:{filename.name}", rows_in=len(df)
+    ) as stage:
+        headers = {col_name: col_name for col_name in df.columns}
+        if id_col and id_col in df.columns:
+            if isinstance(node_label, str):
+                headers[id_col] = f"{id_col}:ID({node_label.upper()})"
+            else:
+                headers[id_col] = f"{id_col}:ID({node_label[0].upper()})"
+
+        # Ensure ID is unique!!!!
+        keep = np.ones(len(df), dtype=bool)
+        for col_name, header in headers.items():
+            if ":ID" in header:
+                positions = np.flatnonzero(keep)
+                dupes = df[col_name].iloc[positions].duplicated().to_numpy()
+                keep[positions[dupes]] = False
+        if not any(":ID" in header for header in headers.values()):
+            keep = ~df.duplicated().to_numpy()
+        new_len = int(keep.sum())
+        len_change = len(df) - new_len
+        if len_change != 0:
+            logger.warning(
+                f"Dropped {len_change} rows from data going into {filename}. {new_len} records left."
+            )
 
-    if all(label_str not in column_name for column_name in save_df.columns):
-        if node_label:
+        constants = {}
+        if all(label_str not in header for header in headers.values()):
+            if not node_label:
+                logger.error("No label for the nodes provided")
+                raise ValueError("No label for the nodes provided")
             if isinstance(node_label, list):
                 node_label = ";".join(node_label)
-            save_df[label_str] = node_label.upper()
-        else:
-            errors.append("No label for the nodes provided")
-
-    compression = None
-    if compress:
-        compression = "gzip"
-        filename = Path(f"{str(filename)}.gz")
-    save_df.dropna(how="all", axis=1).drop_duplicates().to_csv(
-        filename, compression=compression, index=False
-    )
-
-    if filename.exists():
-        logger.info(f"Saved {filename}.")
-        return filename
+            constants[label_str] = node_label.upper()
+
+        columns = _non_empty_headers(df, headers)
+        written = neo4j_import.write_import_csv(
+            neo4j_import.iter_blocks(
+                df, keep, block_rows=rows_per_part or neo4j_import.DEFAULT_BLOCK_ROWS
+            ),
+            filename,
+            columns=columns,
+            constants=constants,
+            rows_per_part=rows_per_part,
+            compress=compress,
+            workers=workers,
+        )
+        if manifest is not None:
+            manifest.add(
+                neo4j_import.NODES,
+                written,
+                headers=list(columns.values()),
+                labels=_listed_values(df, headers, constants, label_str),
+            )
+        stage.rows_out = written.rows
+        saved_path = written.header or written.parts[0]
+        logger.info(f"Saved {saved_path}.")
+        return saved_path
 
 
 def save_relationship_csv_file(
@@ -172,88 +486,114 @@ def save_relationship_csv_file(
     end_label: Optional[str] = "RXCUI",
     rela_type: Optional[str] = None,
     compress: Optional[bool] = False,
+    rows_per_part: Optional[int] = None,
+    workers: Optional[int] = None,
+    manifest: Optional[neo4j_import.ImportManifest] = None,
 ) -> Path:
     """
     Helps to make sure names and column usage are standardized to fit the Neo4j CSV format guidance.
+    The frame isn't copied, ID columns are renamed in the header only and duplicate rows are
+    skipped while the file is streamed out.
+    When rows_per_part is set, writes a header file and data parts and returns the header file.
+    Adds the written files to the manifest when one is given.
     """
-    save_df = df.copy()
     filename = Path(filename)
     if basedir:
         filename = Path(basedir) / filename
 
-    start_id = ":START_ID"
-    end_id = ":END_ID"
-    type_str = ":TYPE"
-
-    _standardize_rel_label(save_df)
-    if start_col and start_col in save_df.columns:
-        new_start_col = f"{start_col}:START_ID({start_label.upper()})"
-        save_df.rename(
-            columns={start_col: new_start_col},
-            inplace=True,
-        )
-
-    if end_col and end_col in save_df.columns:
-        new_end_col = f"{end_col}:END_ID({end_label.upper()})"
-        save_df.rename(columns={end_col: new_end_col}, inplace=True)
-
-    errors = []
-    if all(start_id not in column_name for column_name in save_df.columns):
-        errors.append("No starting Node ID provided")
-
-    if all(end_id not in column_name for column_name in save_df.columns):
-        errors.append("No ending Node ID provided")
+    with profiling.stage(
+        f"save_relationship_csv_file:{filename.name}", rows_in=len(df)
+    ) as stage:
+        start_id = ":START_ID"
+        end_id = ":END_ID"
+        type_str = ":TYPE"
 
-    if errors:
-        msg = ""
-        for error in errors:
-            logger.error(error)
-            msg = msg + " " + error
+        headers = {col_name: col_name for col_name in df.columns}
+        if start_col and start_col in df.columns:
+            headers[start_col] = f"{start_col}:START_ID({start_label.upper()})"
 
-        raise ValueError(msg.strip())
+        if end_col and end_col in df.columns:
+            headers[end_col] = f"{end_col}:END_ID({end_label.upper()})"
 
-    if all(type_str not in column_name for column_name in save_df.columns):
-        if rela_type:
-            save_df[type_str] = rela_type.lower().strip()
-        else:
-            errors.append("No type for the relationships provided")
+        errors = []
+        if all(start_id not in header for header in headers.values()):
+            errors.append("No starting Node ID provided")
 
-    compression = None
-    if compress:
-        compression = "gzip"
-        filename = Path(f"{str(filename)}.gz")
+        if all(end_id not in header for header in headers.values()):
+            errors.append("No ending Node ID provided")
 
-    save_df.dropna(how="all", axis=1).drop_duplicates().to_csv(
-        filename, compression=compression, index=False
-    )
-
-    if filename.exists():
-        logger.info(f"Saved {filename}.")
-        return filename
+        constants = {}
+        if all(type_str not in header for header in headers.values()):
+            if rela_type:
+                constants[type_str] = rela_type.lower().strip()
+            else:
+                errors.append("No type for the relationships provided")
+
+        if errors:
+            msg = ""
+            for error in errors:
+                logger.error(error)
+                msg = msg + " " + error
+
+            raise ValueError(msg.strip())
+
+        columns = _non_empty_headers(df, headers)
+        keep = ~df.duplicated(subset=list(columns)).to_numpy()
+        written = neo4j_import.write_import_csv(
+            neo4j_import.iter_blocks(
+                df, keep, block_rows=rows_per_part or neo4j_import.DEFAULT_BLOCK_ROWS
+            ),
+            filename,
+            columns=columns,
+            constants=constants,
+            rows_per_part=rows_per_part,
+            compress=compress,
+            workers=workers,
+        )
+        if manifest is not None:
+            manifest.add(
+                neo4j_import.RELATIONSHIPS,
+                written,
+                headers=list(columns.values()),
+                rela_type=";".join(_listed_values(df, headers, constants, type_str))
+                or None,
+            )
+        stage.rows_out = written.rows
+        saved_path = written.header or written.parts[0]
+        logger.info(f"Saved {saved_path}.")
+        return saved_path
+
+
+def _listed_values(
+    df: pd.DataFrame, headers: Dict[str, str], constants: Dict[str, str], header: str
+) -> List[str]:
+    """Distinct labels or types for a :LABEL or :TYPE header, whether constant or in the data"""
+    if header in constants:
+        return constants[header].split(";")
+    values = set()
+    for col_name, col_header in headers.items():
+        if col_header == header:
+            for value in df[col_name].dropna().unique():
+                values.update(str(value).split(";"))
+    return sorted(values)
+
+
+def _non_empty_headers(df: pd.DataFrame, headers: Dict[str, str]) -> Dict[str, str]:
+    # Columns with no values at all are left out of the import files
+    return {
+        col_name: header
+        for col_name, header in headers.items()
+        if df[col_name].notna().any()
+    }
 
 
 def _standardize_ndc_11(ndc_orig: str) -> str:
     """
     # NDC must match a "5-4-2" pattern ie '[0-9]{5}-[0-9]{4}-[0-9]{2}' pattern to be valid
-    # Common formats are 6-4-1, 6-3-2, 5-3-2, etc.
+    # Common formats are 4-4-2, 5-3-2, 5-4-1, etc.
+    # Kept for single values, use ndc.normalize_ndcs for a whole Series.
     """
-    # Be sure to not replace '-'
-    ndc = re.sub(r"[_+\(\)* ]", "", ndc_orig)
-    if "-" in ndc:
-        digit_strings = ndc.split("-")
-        valid = [5, 4, 2]
-        for idx, digit_str in enumerate(digit_strings):
-            ds_len = len(digit_str)
-            v_len = valid[idx]
-            if ds_len == v_len:
-                continue
-            elif ds_len < v_len:
-                digit_strings[idx] = "0" + digit_str
-            else:
-                digit_str = digit_str[1:]
-
-        ndc = "".join(digit_strings)
-    return ndc.replace("-", "").zfill(11)[-11:]
+    return ndc.standardize_ndc_11(ndc_orig)
 
 
 def _standardize_node_label_list(labels: List) -> List:
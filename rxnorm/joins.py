@@ -0,0 +1,105 @@
+"""
+Integer keyed joins for building the import files
+
+RXCUIs are interned once per build to dense integer codes by RxcuiKeys. Every lookup built
+on those codes is a plain array, so enriching a frame is a gather by code rather than a
+pandas merge, which hashes both frames and copies every column of the result:
+    RxcuiKeys       RXCUI to code, and code back to RXCUI. Unknown and missing RXCUIs
+                    get code -1.
+    RxcuiLookup     One value per RXCUI, ie its brand, as an array indexed by code
+    RxcuiAdjacency  The rows of a frame grouped by an RXCUI column, CSR style, for one to
+                    many joins that only produce the rows they're asked for
+"""
+
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.api.extensions import take
+
+
+class RxcuiKeys:
+    def __init__(self, rxcuis: pd.Series):
+        self.index = pd.Index(pd.unique(rxcuis.dropna()))
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def codes(self, rxcuis: pd.Series) -> np.ndarray:
+        return self.index.get_indexer(rxcuis)
+
+    def rxcuis(self, codes: np.ndarray):
+        """RXCUIs for codes, NA for -1"""
+        return take(self.index.array, codes, allow_fill=True)
+
+    def member_mask(self, rxcuis: pd.Series) -> np.ndarray:
+        """
+        Membership of every code in rxcuis, for isin. The extra last slot stays False,
+        so code -1 is never a member.
+        """
+        mask = np.zeros(len(self) + 1, dtype=bool)
+        mask[self.codes(rxcuis)] = True
+        mask[-1] = False
+        return mask
+
+    def isin(self, rxcuis: pd.Series, members: np.ndarray) -> np.ndarray:
+        """Series.isin against a member_mask, without hashing the members again"""
+        return members[self.codes(rxcuis)]
+
+
+class RxcuiLookup:
+    """The first value of each RXCUI, like a merge against drop_duplicates(subset=rxcui)"""
+
+    def __init__(self, keys: RxcuiKeys, rxcuis: pd.Series, values: pd.Series):
+        self.keys = keys
+        codes = keys.codes(rxcuis)
+        found_codes, first_rows = np.unique(codes, return_index=True)
+        positions = np.full(len(keys), -1, dtype=np.int64)
+        known = found_codes >= 0
+        positions[found_codes[known]] = first_rows[known]
+        self.values = take(values.array, positions, allow_fill=True)
+
+    def take(self, codes: np.ndarray):
+        """Values for codes, NA for -1"""
+        return take(self.values, codes, allow_fill=True)
+
+    def get(self, rxcuis: pd.Series):
+        return self.take(self.keys.codes(rxcuis))
+
+
+class RxcuiAdjacency:
+    """Row positions of a frame grouped by the RXCUI in one of its columns"""
+
+    def __init__(self, keys: RxcuiKeys, codes: np.ndarray):
+        """codes: The frame's RXCUI column interned with keys"""
+        self.keys = keys
+        known = np.flatnonzero(codes >= 0)
+        # Stable, so the rows of each RXCUI keep the frame's order like a merge does
+        self.rows = known[np.argsort(codes[known], kind="stable")]
+        self.indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes[known], minlength=len(keys)), out=self.indptr[1:])
+
+    def counts(self, codes: np.ndarray) -> np.ndarray:
+        """Rows for each code, 0 for -1"""
+        safe = np.maximum(codes, 0)
+        return np.where(codes >= 0, self.indptr[safe + 1] - self.indptr[safe], 0)
+
+    def left_join(self, codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Row positions of a left join of the codes against this frame, in the same order
+        as pandas: each left row in turn, then its matches in frame order.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Left positions, and right positions with -1
+                where a left row has no match
+        """
+        counts = self.counts(codes)
+        repeats = np.maximum(counts, 1)
+        left = np.repeat(np.arange(len(codes)), repeats)
+        output_starts = np.cumsum(repeats) - repeats
+        offsets = np.arange(len(left)) - np.repeat(output_starts, repeats)
+        slots = np.repeat(self.indptr[np.maximum(codes, 0)], repeats) + offsets
+        matched = np.repeat(counts > 0, repeats)
+        right = np.full(len(left), -1, dtype=np.int64)
+        right[matched] = self.rows[slots[matched]]
+        return left, right
@@ -0,0 +1,134 @@
+"""
+NDC normalization to the 11 digit "5-4-2" format used by RxNorm and most claims data.
+
+Hyphenated NDCs come in 4-4-2, 5-3-2 and 5-4-1 layouts, each of which is converted by
+left padding the short segment with a zero. Unhyphenated NDCs are assumed to already be
+in 11 digit form and are only zero filled.
+"""
+
+import re
+from typing import Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Segment lengths for the labeler, product and package codes
+NDC_SEGMENTS = (5, 4, 2)
+NDC_LENGTH = sum(NDC_SEGMENTS)
+
+# Characters that show up around NDCs in source data. Hyphens are kept for the layout.
+_NDC_NOISE = r"[_+\(\)* ]"
+_NDC_NOISE_RE = re.compile(_NDC_NOISE)
+
+
+def standardize_ndc_11(ndc_orig: str) -> str:
+    """Converts a single NDC to 11 digits. See normalize_ndcs for whole Series."""
+    return _standardize_ndc(ndc_orig)[0]
+
+
+def is_valid_ndc(ndc_orig: str) -> bool:
+    return _standardize_ndc(ndc_orig)[1]
+
+
+def _standardize_ndc(ndc_orig: str) -> Tuple[str, bool]:
+    ndc = _NDC_NOISE_RE.sub("", ndc_orig)
+    if "-" not in ndc:
+        return (
+            ndc.zfill(NDC_LENGTH)[-NDC_LENGTH:],
+            ndc.isdigit() and len(ndc) == NDC_LENGTH,
+        )
+
+    digit_strings = ndc.split("-")
+    if len(digit_strings) != len(NDC_SEGMENTS):
+        return "".join(digit_strings).zfill(NDC_LENGTH)[-NDC_LENGTH:], False
+
+    valid = True
+    short_segments = 0
+    for idx, (digit_str, v_len) in enumerate(zip(digit_strings, NDC_SEGMENTS)):
+        ds_len = len(digit_str)
+        if ds_len > v_len:
+            # Only extra leading zeros can be dropped without changing the code
+            valid &= digit_str[:-v_len].strip("0") == ""
+            digit_str = digit_str[-v_len:]
+        elif ds_len < v_len:
+            short_segments += 1
+            valid &= ds_len == v_len - 1
+        digit_strings[idx] = digit_str.zfill(v_len)
+        valid &= digit_str.isdigit()
+
+    ndc = "".join(digit_strings)
+    return ndc, valid and short_segments <= 1
+
+
+def normalize_ndcs(ndcs: pd.Series) -> pd.DataFrame:
+    """
+    Converts a Series of raw NDCs to 11 digits in one vectorized pass with Arrow compute
+    kernels. Gives the same results as standardize_ndc_11 for every value.
+
+    Values that are already 11 digits, which is nearly all of RxNorm and most claims,
+    are passed through after a single regex match. Only the rest go through the full
+    segment padding.
+
+    Args:
+        ndcs: Raw NDC values, hyphenated or not
+
+    Returns:
+        pd.DataFrame: Same index as ndcs with columns
+            ndc - the 11 digit NDC, or NA where the input is NA
+            ndc_valid - False where the input doesn't match a known NDC layout
+    """
+    ndc = ndcs.astype("string")
+    raw = pa.array(ndc.to_numpy(dtype=object, na_value=None), type=pa.string())
+    valid = pc.fill_null(
+        pc.match_substring_regex(raw, pattern=rf"^\d{{{NDC_LENGTH}}}$"), False
+    ).to_numpy(zero_copy_only=False)
+
+    if not valid.all():
+        ndc = ndc.copy()
+        needs_work = ~valid
+        digits, digits_valid = _normalize_arrow(raw.filter(pa.array(needs_work)))
+        ndc[needs_work] = digits.to_pandas().to_numpy()
+        valid[needs_work] = digits_valid.to_numpy(zero_copy_only=False)
+
+    return pd.DataFrame({"ndc": ndc, "ndc_valid": valid}, index=ndcs.index)
+
+
+def _normalize_arrow(raw: pa.Array) -> Tuple[pa.Array, pa.Array]:
+    ndc = pc.replace_substring_regex(raw, pattern=_NDC_NOISE, replacement="")
+
+    # Anything that isn't exactly three segments is treated as a bare digit string
+    bare = pc.replace_substring(ndc, pattern="-", replacement="")
+    valid = pc.match_substring_regex(ndc, pattern=rf"^\d{{{NDC_LENGTH}}}$")
+
+    segments = pc.extract_regex(
+        ndc, pattern=r"^(?P<s0>[^-]*)-(?P<s1>[^-]*)-(?P<s2>[^-]*)$"
+    )
+    three_part = pc.fill_null(pc.is_valid(segments), False)
+    padded = []
+    segments_valid = three_part
+    short_segments = pa.scalar(0, pa.int8())
+    for idx, v_len in enumerate(NDC_SEGMENTS):
+        digit_str = pc.struct_field(segments, [idx])
+        # Digits only, with at most one missing digit or any number of extra leading zeros
+        segments_valid = pc.and_kleene(
+            segments_valid,
+            pc.match_substring_regex(
+                digit_str, pattern=rf"^0*\d{{{v_len - 1},{v_len}}}$"
+            ),
+        )
+        short_segments = pc.add(
+            short_segments,
+            pc.cast(pc.less(pc.utf8_length(digit_str), v_len), pa.int8()),
+        )
+        trimmed = pc.utf8_slice_codeunits(digit_str, start=-v_len)
+        padded.append(pc.utf8_lpad(trimmed, width=v_len, padding="0"))
+    segments_valid = pc.and_kleene(segments_valid, pc.less_equal(short_segments, 1))
+
+    joined = pc.binary_join_element_wise(*padded, "")
+    digits = pc.if_else(three_part, joined, bare)
+    digits = pc.utf8_slice_codeunits(
+        pc.utf8_lpad(digits, width=NDC_LENGTH, padding="0"), start=-NDC_LENGTH
+    )
+    valid = pc.fill_null(pc.if_else(three_part, segments_valid, valid), False)
+    return digits, valid
@@ -0,0 +1,386 @@
+"""
+Streaming writer for neo4j-admin import CSV files
+
+Frames are written in blocks straight from the caller's data. Columns are renamed only in
+the header and constant columns such as :LABEL or :TYPE are added one block at a time, so
+the full frame is never copied. Blocks are serialized and gzipped on a thread pool; zlib
+releases the GIL, so compression runs in parallel.
+
+Output is either one file with the header inline, or a separate header file plus numbered
+data parts, ie ndc_nodes_header.csv, ndc_nodes_part0001.csv.gz, ndc_nodes_part0002.csv.gz.
+neo4j-admin accepts both, and reads gzip files made of several gzip members.
+
+Every file set written can be recorded in an ImportManifest, which fill_db.sh uses to
+build the neo4j-admin command line:
+    python -m rxnorm.neo4j_import import/import_manifest.json verify
+    python -m rxnorm.neo4j_import import/import_manifest.json args
+"""
+
+import argparse
+import csv
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import shlex
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import (
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Rows serialized and compressed per task when writing a single file
+DEFAULT_BLOCK_ROWS = 250_000
+
+NODES = "nodes"
+RELATIONSHIPS = "relationships"
+MANIFEST_FILE = "import_manifest.json"
+
+# Single node recording which build is loaded, read by the webapps to invalidate caches
+BUILD_INFO_NAME = "build_info_nodes"
+BUILD_LABEL = "BUILD"
+
+# neo4j-admin import only reads gzip and zip, so zstd and friends aren't an option here
+GZIP_SUFFIX = ".gz"
+
+
+class ImportFiles(NamedTuple):
+    header: Optional[Path]
+    parts: List[Path]
+    rows: int
+    part_rows: List[int]
+    checksums: List[str]
+
+
+def iter_blocks(
+    df: pd.DataFrame,
+    keep: Optional[np.ndarray] = None,
+    block_rows: int = DEFAULT_BLOCK_ROWS,
+) -> Iterator[pd.DataFrame]:
+    """
+    Yields row slices of a frame, applying a positional boolean mask one slice at a time.
+    Only a block's worth of rows is ever copied.
+    """
+    if keep is not None:
+        keep = np.asarray(keep, dtype=bool)
+    for start in range(0, len(df), block_rows):
+        block = df.iloc[start : start + block_rows]
+        if keep is not None:
+            block = block[keep[start : start + block_rows]]
+        yield block
+
+
+def _header_line(header: List[str]) -> str:
+    header_text = io.StringIO()
+    csv.writer(header_text, lineterminator="\n").writerow(header)
+    return header_text.getvalue()
+
+
+def _encode_block(
+    block: pd.DataFrame,
+    columns: List[str],
+    constants: Dict[str, str],
+    compress: bool,
+    compresslevel: int,
+) -> bytes:
+    if constants:
+        block = block.assign(**constants)
+    text = block.to_csv(
+        columns=[*columns, *constants], header=False, index=False, lineterminator="\n"
+    )
+    data = text.encode("utf-8")
+    # No timestamp in the gzip header, so the same rows always give the same checksum
+    return gzip.compress(data, compresslevel, mtime=0) if compress else data
+
+
+def _write_part(part_path: Path, block: pd.DataFrame, *encode_args) -> Tuple[int, str]:
+    data = _encode_block(block, *encode_args)
+    part_path.write_bytes(data)
+    return len(block), hashlib.sha256(data).hexdigest()
+
+
+def write_import_csv(
+    data: Union[pd.DataFrame, Iterable[pd.DataFrame]],
+    filename: Path,
+    columns: Dict[str, str],
+    constants: Optional[Dict[str, str]] = None,
+    rows_per_part: Optional[int] = None,
+    compress: bool = False,
+    workers: Optional[int] = None,
+    compresslevel: int = 6,
+) -> ImportFiles:
+    """
+    Streams a frame, or an iterator of frames, into neo4j-admin import CSV files.
+    The data should already be deduplicated.
+
+    Args:
+        data: DataFrame or iterator of DataFrame chunks to write
+        filename: Output file, ie import/ndc_nodes.csv. Part files are named after it.
+        columns: Source column name mapped to its import header, ie {"ndc": "ndc:ID(NDC)"}
+        constants: Import header mapped to a value repeated on every row, ie {":LABEL": "NDC"}
+        rows_per_part: When set, writes a separate header file and data parts of at most
+                       this many rows. Otherwise writes one file with the header inline.
+        compress: Gzip the data
+        workers: Threads used to serialize and compress, defaults to the CPU count
+
+    Returns:
+        ImportFiles: Header file (None when inline), the data files and the rows written
+    """
+    constants = constants or {}
+    filename = Path(filename)
+    filename.parent.mkdir(parents=True, exist_ok=True)
+    suffix = GZIP_SUFFIX if compress else ""
+    header = _header_line([*columns.values(), *constants])
+    encode_args = (list(columns), constants, compress, compresslevel)
+    frames = [data] if isinstance(data, pd.DataFrame) else data
+
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * 2
+    pending: Deque[Future] = deque()
+    rows = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        if rows_per_part:
+            header_path = filename.with_name(f"{filename.stem}_header.csv")
+            header_path.write_text(header)
+            parts = []
+            part_rows = []
+            checksums = []
+
+            def collect(part_job: Future):
+                block_rows, checksum = part_job.result()
+                part_rows.append(block_rows)
+                checksums.append(checksum)
+
+            for frame in frames:
+                for block in iter_blocks(frame, block_rows=rows_per_part):
+                    if block.empty:
+                        continue
+                    part_path = filename.with_name(
+                        f"{filename.stem}_part{len(parts) + 1:04d}.csv{suffix}"
+                    )
+                    parts.append(part_path)
+                    pending.append(
+                        pool.submit(_write_part, part_path, block, *encode_args)
+                    )
+                    while len(pending) >= max_pending:
+                        collect(pending.popleft())
+            while pending:
+                collect(pending.popleft())
+            return ImportFiles(header_path, parts, sum(part_rows), part_rows, checksums)
+
+        # One file: blocks are encoded in parallel and written in order. Compressed blocks
+        # are separate gzip members, which concatenate into a valid gzip file.
+        out_path = Path(f"{filename}{suffix}")
+        checksum = hashlib.sha256()
+        with open(out_path, "wb") as out_file:
+
+            def write(data: bytes):
+                checksum.update(data)
+                out_file.write(data)
+
+            header_bytes = header.encode("utf-8")
+            write(gzip.compress(header_bytes, mtime=0) if compress else header_bytes)
+            for frame in frames:
+                for block in iter_blocks(frame):
+                    pending.append(pool.submit(_encode_block, block, *encode_args))
+                    rows += len(block)
+                    while len(pending) >= max_pending:
+                        write(pending.popleft().result())
+            while pending:
+                write(pending.popleft().result())
+        return ImportFiles(None, [out_path], rows, [rows], [checksum.hexdigest()])
+
+
+def id_spaces(headers: Iterable[str]) -> Dict[str, str]:
+    """
+    Finds the ID spaces used in import headers,
+    ie {"ID": "NDC"} for ndc:ID(NDC) or {"START_ID": "NDC", "END_ID": "RXCUI"}
+    """
+    spaces = {}
+    for header in headers:
+        found = re.search(r":(ID|START_ID|END_ID)\((.+)\)", header)
+        if found:
+            spaces[found.group(1)] = found.group(2)
+    return spaces
+
+
+class ImportManifest:
+    """
+    Machine readable list of the files written for neo4j-admin import.
+    Each entry records whether it holds nodes or relationships, its labels or type, ID
+    spaces, header file and data files with their row counts and SHA-256 checksums.
+    Paths are stored relative to the import directory.
+    """
+
+    def __init__(
+        self, import_dir: Path = Path("./import"), entries: Optional[List[Dict]] = None
+    ):
+        self.import_dir = Path(import_dir)
+        self.entries = entries or []
+
+    def add(
+        self,
+        kind: str,
+        written: ImportFiles,
+        headers: List[str],
+        labels: Optional[List[str]] = None,
+        rela_type: Optional[str] = None,
+    ):
+        if kind not in (NODES, RELATIONSHIPS):
+            raise ValueError(f"Import files must be {NODES} or {RELATIONSHIPS}")
+
+        def relative(path: Path) -> str:
+            return Path(path).relative_to(self.import_dir).as_posix()
+
+        name = Path(written.header or written.parts[0]).name.split(".")[0]
+        name = name.removesuffix("_header")
+        self.entries = [entry for entry in self.entries if entry["name"] != name]
+        self.entries.append(
+            {
+                "name": name,
+                "kind": kind,
+                "labels": labels,
+                "type": rela_type,
+                "id_spaces": id_spaces(headers),
+                "headers": headers,
+                "header": relative(written.header) if written.header else None,
+                "files": [
+                    {"path": relative(part), "rows": rows, "sha256": checksum}
+                    for part, rows, checksum in zip(
+                        written.parts, written.part_rows, written.checksums
+                    )
+                ],
+                "rows": written.rows,
+            }
+        )
+
+    def build_version(self) -> str:
+        """
+        Short digest of every data file's checksum. Builds from the same RRF files get the
+        same version, anything that changes the import files changes it.
+        """
+        digest = hashlib.sha256()
+        for entry in sorted(self.entries, key=lambda entry: entry["name"]):
+            if entry["name"] == BUILD_INFO_NAME:
+                continue
+            for file_info in entry["files"]:
+                digest.update(f"{entry['name']}:{file_info['sha256']}\n".encode())
+        return digest.hexdigest()[:16]
+
+    def write(self, filename: str = MANIFEST_FILE) -> Path:
+        manifest_path = self.import_dir / filename
+        manifest_path.write_text(
+            json.dumps(
+                {"build_version": self.build_version(), "entries": self.entries},
+                indent=2,
+            )
+        )
+        logger.info(f"Saved import manifest {manifest_path}")
+        return manifest_path
+
+    @classmethod
+    def load(cls, manifest_path: Path) -> "ImportManifest":
+        manifest_path = Path(manifest_path)
+        entries = json.loads(manifest_path.read_text())["entries"]
+        return cls(manifest_path.parent, entries)
+
+    def verify(self) -> List[str]:
+        """
+        Checks every listed file exists with the recorded checksum, and that no import
+        CSV in the directory is missing from the manifest. Returns the problems found.
+        """
+        problems = []
+        listed = set()
+        for entry in self.entries:
+            if entry["header"]:
+                listed.add(entry["header"])
+            for file_info in entry["files"]:
+                listed.add(file_info["path"])
+                file_path = self.import_dir / file_info["path"]
+                if not file_path.exists():
+                    problems.append(f"Missing {file_path}")
+                elif _file_sha256(file_path) != file_info["sha256"]:
+                    problems.append(f"Checksum mismatch for {file_path}")
+        for file_path in sorted(self.import_dir.glob("*.csv*")):
+            if file_path.relative_to(self.import_dir).as_posix() not in listed:
+                problems.append(f"{file_path} isn't in the manifest")
+        return problems
+
+    def import_args(self, import_dir: str = "import") -> List[str]:
+        """
+        Builds the --nodes and --relationships arguments for neo4j-admin database import,
+        using import_dir as the location of the files inside the Neo4j container.
+        """
+        args = []
+        for kind in (NODES, RELATIONSHIPS):
+            for entry in self.entries:
+                if entry["kind"] != kind or not entry["files"]:
+                    continue
+                files = [entry["header"]] if entry["header"] else []
+                files += [file_info["path"] for file_info in entry["files"]]
+                file_list = ",".join(f"{import_dir}/{file_path}" for file_path in files)
+                args.append(f"--{kind}={file_list}")
+        return args
+
+
+def _file_sha256(file_path: Path, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as import_file:
+        for block in iter(lambda: import_file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Check an import manifest and build the neo4j-admin import arguments"
+    )
+    parser.add_argument("manifest", type=Path, help="Path to import_manifest.json")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    args_parser = commands.add_parser(
+        "args", help="Print the neo4j-admin database import full arguments"
+    )
+    args_parser.add_argument(
+        "--import-dir",
+        default="import",
+        help="Import directory as seen by neo4j-admin",
+    )
+    args_parser.add_argument("--threads", type=int, default=None)
+    commands.add_parser("verify", help="Check files and checksums")
+
+    parsed = parser.parse_args(args)
+    manifest = ImportManifest.load(parsed.manifest)
+    problems = manifest.verify()
+    for problem in problems:
+        logger.error(problem)
+    if problems:
+        raise SystemExit(1)
+    if parsed.command == "args":
+        import_args = manifest.import_args(parsed.import_dir)
+        if parsed.threads:
+            import_args.append(f"--threads={parsed.threads}")
+        print(shlex.join(import_args))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
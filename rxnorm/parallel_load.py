@@ -0,0 +1,202 @@
+"""
+Parallel online loads of relationships into a running Neo4j server
+
+Relationships of all types are split into disjoint ranges of the start node's RXCUI. Each
+range is written by one worker thread with its own session, one type after another, so
+workers never merge relationships onto the same start nodes at the same time. End nodes
+such as shared ingredients can still be locked by two workers at once, so deadlocks and
+other transient errors are retried with backoff.
+
+Meant for corrections to a loaded database, ie applying a fix to a few relationship types
+without a full fill_db.sh rebuild.
+"""
+
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+
+import neo4j
+from rxnorm import graph
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_RETRIES = 5
+
+
+class WorkerStats(NamedTuple):
+    worker: str
+    partitions: int
+    batches: int
+    rows: int
+    seconds: float
+    retries: int
+    skipped: int = 0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def partition_relationships(
+    rel: pd.DataFrame,
+    start_col: str = "rxcui2",
+    ranges: int = DEFAULT_WORKERS,
+) -> List[pd.DataFrame]:
+    """
+    Splits relationships of all types into at most `ranges` disjoint ranges of the start
+    ID, each holding roughly the same number of start nodes. All rows of a start node are
+    in the same range.
+    """
+    if rel.empty:
+        return []
+    # RXCUIs are numeric strings, anything else sorts after them in the last range
+    start_ids = pd.to_numeric(rel[start_col], errors="coerce")
+    range_count = max(1, min(ranges, start_ids.nunique()))
+    if range_count == 1:
+        return [rel]
+    range_nums = pd.qcut(start_ids.rank(method="dense"), range_count, labels=False)
+    range_nums = range_nums.fillna(range_count - 1).astype(int)
+    return [range_rows for _, range_rows in rel.groupby(range_nums, sort=True)]
+
+
+def _write_batch(
+    session: neo4j.Session,
+    query: str,
+    batch: List[Dict],
+    max_retries: int,
+    strict: bool = True,
+) -> Tuple[int, int]:
+    """
+    Writes one batch in its own transaction. Returns the number of retries needed and the
+    rows written. With strict, a batch where any relationship didn't match its nodes is
+    rolled back and fails.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            with session.begin_transaction() as tx:
+                written = graph.check_written(
+                    tx.run(query, rows=batch), len(batch), query, strict
+                )
+                tx.commit()
+            return attempt, written
+        except neo4j.exceptions.TransientError as error:
+            if attempt == max_retries:
+                raise
+            # Jittered backoff so deadlocked workers don't collide again
+            delay = min(0.1 * 2**attempt, 5.0) * random.uniform(0.5, 1.5)
+            logger.debug(f"Retrying batch in {delay:.2f}s after {error.code}")
+            time.sleep(delay)
+    return max_retries, 0
+
+
+def load_relationships_parallel(
+    neo_rrf: graph.NeoRRF,
+    rel: pd.DataFrame,
+    workers: int = DEFAULT_WORKERS,
+    start_col: str = "rxcui2",
+    end_col: str = "rxcui1",
+    rela_col: str = "rela",
+    start_label: str = "RXCUI",
+    end_label: str = "RXCUI",
+    property_cols: Optional[List[str]] = None,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    strict: bool = True,
+) -> List[WorkerStats]:
+    """
+    Merges relationships on a pool of worker threads, each with its own session.
+    The nodes must already exist, see NeoRRF.merge_nodes.
+
+    Args:
+        neo_rrf: Connection to write with, its batch_size sets the rows per transaction
+        rel: Relationships, one row each, with the same columns as merge_rel_connections
+        workers: Number of threads and sessions
+        max_retries: Times a batch is retried after a deadlock or other transient error
+        strict: Fail the load on the first relationship that matched no nodes, else skip
+                those and count them in WorkerStats.skipped
+
+    Returns:
+        List[WorkerStats]: Rows, batches, time, retries and skipped rows for each worker
+    """
+    property_cols = property_cols or []
+    rel = graph.prepare_relationships(rel, start_col, end_col, rela_col, property_cols)
+    partitions = partition_relationships(rel, start_col, ranges=workers)
+    logger.info(
+        f"Loading {len(rel)} relationships in {len(partitions)} partitions "
+        f"on {workers} workers"
+    )
+
+    local = threading.local()
+    stats: Dict[str, Dict] = {}
+    stats_lock = threading.Lock()
+    sessions: List[neo4j.Session] = []
+
+    def load_partition(rows: pd.DataFrame):
+        if not hasattr(local, "session"):
+            local.session = neo_rrf.driver.session(database=neo_rrf.database)
+            with stats_lock:
+                sessions.append(local.session)
+        worker = threading.current_thread().name
+        batches = 0
+        retries = 0
+        skipped = 0
+        started = time.perf_counter()
+        for rela_type, type_rows in rows.groupby(rela_col, sort=True, observed=True):
+            query = graph.rel_merge_query(str(rela_type), start_label, end_label)
+            for batch in graph.rel_record_batches(
+                type_rows, start_col, end_col, property_cols, neo_rrf.batch_size
+            ):
+                batch_retries, written = _write_batch(
+                    local.session, query, batch, max_retries, strict
+                )
+                retries += batch_retries
+                skipped += len(batch) - written
+                batches += 1
+        elapsed = time.perf_counter() - started
+        with stats_lock:
+            worker_stats = stats.setdefault(
+                worker,
+                {
+                    "partitions": 0,
+                    "batches": 0,
+                    "rows": 0,
+                    "seconds": 0.0,
+                    "retries": 0,
+                    "skipped": 0,
+                },
+            )
+            worker_stats["partitions"] += 1
+            worker_stats["batches"] += batches
+            worker_stats["rows"] += len(rows)
+            worker_stats["seconds"] += elapsed
+            worker_stats["retries"] += retries
+            worker_stats["skipped"] += skipped
+
+    try:
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="neo4j-writer"
+        ) as pool:
+            jobs = [pool.submit(load_partition, rows) for rows in partitions]
+            for job in jobs:
+                job.result()
+    finally:
+        for session in sessions:
+            session.close()
+
+    report = [
+        WorkerStats(worker, **worker_stats)
+        for worker, worker_stats in sorted(stats.items())
+    ]
+    for worker_stats in report:
+        logger.info(
+            f"{worker_stats.worker}: {worker_stats.rows} rows in "
+            f"{worker_stats.batches} batches, {worker_stats.seconds:.1f}s, "
+            f"{worker_stats.rows_per_second:,.0f} rows/s, {worker_stats.retries} retries, "
+            f"{worker_stats.skipped} skipped"
+        )
+    return report
@@ -0,0 +1,321 @@
+"""
+Stage timing and memory instrumentation for the generate_neo4j_data.py pipeline
+
+A RunProfiler records, for each named stage of a run, the wall time, the rows going in and
+coming out, and the resident set size at the start and at its peak. RSS is sampled on a
+background thread, so the peak includes short lived frames that are freed before the stage
+ends. Stages can nest, ie each save_*_csv_file inside the NDC stage. Each thread nests its
+own stages, and a thread running a function wrapped with in_stage() nests them under the
+stage that was open where it was wrapped.
+
+Optionally the whole run is also captured with cProfile, or with tracemalloc to get the
+peak Python allocations per stage and the lines that allocated most. Both slow the run
+down, tracemalloc by several times, so they're off by default.
+
+The report is JSON, written beside the import files, so runs of two releases can be
+diffed to spot regressions.
+
+Code that's called with or without a profiler running uses the module level stage(),
+which records into the active profiler and does nothing otherwise.
+"""
+
+import cProfile
+import json
+import logging
+import os
+import platform
+import pstats
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CPROFILE = "cprofile"
+TRACEMALLOC = "tracemalloc"
+PROFILE_MODES = (CPROFILE, TRACEMALLOC)
+REPORT_FILE = "run_report.json"
+PROFILE_FILE = "run_profile.prof"
+DEFAULT_SAMPLE_INTERVAL = 0.05
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 20
+
+_MB = 1024 * 1024
+# ru_maxrss is in kilobytes on Linux and bytes on macOS
+_MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+_active: Optional["RunProfiler"] = None
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # No procfs, the peak so far is the closest there is
+        return peak_rss()
+
+
+def peak_rss(children: bool = False) -> int:
+    """Peak resident set size in bytes, of this process or its largest child process"""
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    return resource.getrusage(who).ru_maxrss * _MAXRSS_UNIT
+
+
+def _mb(num_bytes: Optional[int]) -> Optional[float]:
+    return None if num_bytes is None else round(num_bytes / _MB, 1)
+
+
+class Stage:
+    """Measurements for one stage. Set rows_out inside the with block."""
+
+    def __init__(
+        self, name: str, rows_in: Optional[int] = None, parent: Optional[str] = None
+    ):
+        self.name = name
+        self.parent = parent
+        self.rows_in = rows_in
+        self.rows_out: Optional[int] = None
+        self.seconds: Optional[float] = None
+        self.rss_start = 0
+        self.rss_peak = 0
+        self.traced_peak: Optional[int] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "parent": self.parent,
+            "seconds": None if self.seconds is None else round(self.seconds, 3),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "rss_start_mb": _mb(self.rss_start),
+            "rss_peak_mb": _mb(self.rss_peak),
+            "traced_peak_mb": _mb(self.traced_peak),
+        }
+
+
+class RunProfiler:
+    """
+    Collects stages for one pipeline run. Use as a context manager around the run, it
+    becomes the active profiler for stage() while it's open.
+
+    Args:
+        profile: None, "cprofile" or "tracemalloc"
+        sample_interval: Seconds between RSS samples
+    """
+
+    def __init__(
+        self,
+        profile: Optional[str] = None,
+        sample_interval: float = DEFAULT_SAMPLE_INTERVAL,
+    ):
+        if profile is not None and profile not in PROFILE_MODES:
+            raise ValueError(f"profile must be one of {', '.join(PROFILE_MODES)}")
+        self.profile = profile
+        self.sample_interval = sample_interval
+        self.stages: List[Stage] = []
+        self.started_at: Optional[datetime] = None
+        self.seconds: Optional[float] = None
+        # Every open stage, for the RSS sampler, and each thread's own nesting
+        self._open: List[Stage] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._cprofile: Optional[cProfile.Profile] = None
+        self._allocations: List[Dict] = []
+        self._started = 0.0
+
+    def __enter__(self) -> "RunProfiler":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        global _active
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.perf_counter()
+        self._stop.clear()
+        self._sampler = threading.Thread(
+            target=self._sample, name="rss-sampler", daemon=True
+        )
+        self._sampler.start()
+        if self.profile == CPROFILE:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        elif self.profile == TRACEMALLOC:
+            tracemalloc.start()
+        _active = self
+
+    def stop(self):
+        global _active
+        if _active is self:
+            _active = None
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self.profile == TRACEMALLOC and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            self._allocations = [
+                {
+                    "line": str(stat.traceback[0]),
+                    "size_mb": _mb(stat.size),
+                    "count": stat.count,
+                }
+                for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+            ]
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self.seconds = time.perf_counter() - self._started
+
+    def _sample(self):
+        while not self._stop.wait(self.sample_interval):
+            self._update_peaks(current_rss())
+
+    def _update_peaks(self, rss: int):
+        with self._lock:
+            for open_stage in self._open:
+                open_stage.rss_peak = max(open_stage.rss_peak, rss)
+
+    def _thread_stages(self) -> List[Stage]:
+        if not hasattr(self._local, "stages"):
+            self._local.stages = []
+        return self._local.stages
+
+    def _current_name(self) -> Optional[str]:
+        thread_stages = self._thread_stages()
+        if thread_stages:
+            return thread_stages[-1].name
+        return getattr(self._local, "spawned_from", None)
+
+    def in_stage(self, func: Callable) -> Callable:
+        """
+        Wraps func to run on another thread, ie a pool worker, with its stages nested
+        under this thread's innermost open stage.
+        """
+        parent = self._current_name()
+
+        def run(*args, **kwargs):
+            spawned_from = getattr(self._local, "spawned_from", None)
+            self._local.spawned_from = parent
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._local.spawned_from = spawned_from
+
+        return run
+
+    @contextmanager
+    def stage(self, name: str, rows_in: Optional[int] = None) -> Iterator[Stage]:
+        thread_stages = self._thread_stages()
+        run_stage = Stage(name, rows_in, self._current_name())
+        run_stage.rss_start = run_stage.rss_peak = current_rss()
+        thread_stages.append(run_stage)
+        with self._lock:
+            self.stages.append(run_stage)
+            self._open.append(run_stage)
+        if tracemalloc.is_tracing():
+            # Peaks of enclosing stages are lost from here on, they're per innermost stage
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        try:
+            yield run_stage
+        finally:
+            run_stage.seconds = time.perf_counter() - started
+            if tracemalloc.is_tracing():
+                run_stage.traced_peak = tracemalloc.get_traced_memory()[1]
+            self._update_peaks(current_rss())
+            thread_stages.remove(run_stage)
+            with self._lock:
+                self._open.remove(run_stage)
+            logger.info(
+                f"Stage {name} took {run_stage.seconds:.2f}s, "
+                f"peak RSS {_mb(run_stage.rss_peak)} MB"
+                + ("" if run_stage.rows_out is None else f", {run_stage.rows_out} rows")
+            )
+
+    def report(self) -> Dict:
+        report = {
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "seconds": None if self.seconds is None else round(self.seconds, 3),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "peak_rss_mb": _mb(peak_rss()),
+            "peak_child_rss_mb": _mb(peak_rss(children=True)),
+            "profile": self.profile,
+            "stages": [run_stage.to_dict() for run_stage in self.stages],
+        }
+        if self._cprofile is not None:
+            stats = pstats.Stats(self._cprofile)
+            report["functions"] = [
+                {
+                    "function": f"{file_name}:{line}({function})",
+                    "calls": calls,
+                    "total_seconds": round(total, 3),
+                    "cumulative_seconds": round(cumulative, 3),
+                }
+                for (file_name, line, function), (
+                    _,
+                    calls,
+                    total,
+                    cumulative,
+                    _,
+                ) in sorted(
+                    stats.stats.items(), key=lambda item: item[1][3], reverse=True
+                )[
+                    :TOP_FUNCTIONS
+                ]
+            ]
+        if self._allocations:
+            report["allocations"] = self._allocations
+        return report
+
+    def write_report(self, report_dir: Path) -> Path:
+        """
+        Writes the JSON report, and the full cProfile stats for pstats or snakeviz when
+        they were captured. Returns the report path.
+        """
+        report_dir = Path(report_dir)
+        report_dir.mkdir(parents=True, exist_ok=True)
+        report_path = report_dir / REPORT_FILE
+        report_path.write_text(json.dumps(self.report(), indent=2))
+        if self._cprofile is not None:
+            self._cprofile.dump_stats(report_dir / PROFILE_FILE)
+        logger.info(f"Saved run report {report_path}")
+        return report_path
+
+
+def active() -> Optional[RunProfiler]:
+    return _active
+
+
+@contextmanager
+def stage(name: str, rows_in: Optional[int] = None) -> Iterator[Stage]:
+    """
+    Records a stage in the active profiler. Without one the Stage is still yielded, so
+    callers can set rows_out either way, but nothing is measured.
+    """
+    if _active is None:
+        yield Stage(name, rows_in)
+        return
+    with _active.stage(name, rows_in) as run_stage:
+        yield run_stage
+
+
+def in_stage(func: Callable) -> Callable:
+    """
+    Wraps func for another thread so the stages it records nest under the caller's open
+    stage. Returns func as is without an active profiler.
+    """
+    if _active is None:
+        return func
+    return _active.in_stage(func)
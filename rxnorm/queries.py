@@ -0,0 +1,280 @@
+"""
+Cypher and response shaping shared by webapp.py and the async webapp_async.py
+"""
+
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+from rxnorm.ndc import normalize_ndcs
+
+SEARCH = (
+    "MATCH (n:NDC)-[:aka]-(i) "
+    "WHERE n.ndc CONTAINS $ndc1"
+    " AND n.brand IS NOT NULL "
+    " AND i.brand IS NOT NULL "
+    "RETURN n.ndc as ndc, n.brand as brand "
+    "LIMIT 7"
+)
+
+# Ingredients are linked to each NDC when the import files are built
+INGREDIENTS = (
+    "MATCH (n:NDC {ndc:$ndc})-[:has_active_ingredient]->(i:IN) "
+    "WHERE i.brand IS NOT NULL "
+    "RETURN COLLECT(DISTINCT i.brand) as ingredients"
+)
+
+# One page of NDCs with their ingredients, ordered by NDC so the last one is the cursor for
+# the next page. Ingredients are deduplicated here rather than in Python.
+GRAPH = (
+    "MATCH (n:NDC) "
+    "WHERE n.ndc > $after AND n.brand IS NOT NULL "
+    "AND EXISTS { MATCH (n)-[:has_active_ingredient]->(i:IN) WHERE i.brand IS NOT NULL } "
+    "WITH n ORDER BY n.ndc LIMIT $limit "
+    "MATCH (n)-[:has_active_ingredient]->(i:IN) "
+    "WHERE i.brand IS NOT NULL "
+    "WITH n, collect(DISTINCT {rxcui: i.rxcui, brand: i.brand}) AS ingredients "
+    "RETURN n.ndc AS ndc, n.brand AS brand, n.rxcui AS rxcui, ingredients "
+    "ORDER BY ndc"
+)
+
+DEFAULT_GRAPH_LIMIT = 700
+MAX_GRAPH_LIMIT = 10_000
+
+# Batch lookups, one row per NDC found. NDCs that aren't in the graph have no row.
+INGREDIENTS_BATCH = (
+    "UNWIND $ndcs AS ndc "
+    "MATCH (n:NDC {ndc: ndc}) "
+    "OPTIONAL MATCH (n)-[:has_active_ingredient]->(i:IN) "
+    "WHERE i.brand IS NOT NULL "
+    "RETURN ndc, collect(DISTINCT i.brand) AS ingredients"
+)
+RESOLVE_BATCH = (
+    "UNWIND $ndcs AS ndc "
+    "MATCH (n:NDC {ndc: ndc}) "
+    "RETURN ndc, n.rxcui AS rxcui, n.brand AS brand"
+)
+BATCH_QUERIES = {"ingredients": INGREDIENTS_BATCH, "resolve": RESOLVE_BATCH}
+# Fields each batch route returns, with their values for an NDC that isn't found
+BATCH_FIELDS = {
+    "ingredients": {"ingredients": []},
+    "resolve": {"rxcui": None, "brand": None},
+}
+MAX_BATCH_NDCS = 100_000
+# NDCs per UNWIND query, results are streamed back after each one
+BATCH_CHUNK_SIZE = 5_000
+
+# Written by generate_neo4j_data.create_build_info_node
+BUILD_VERSION = "MATCH (b:BUILD {name: 'rxnorm'}) RETURN b.version AS version"
+
+
+def driver_config() -> Dict:
+    """
+    Connection pool settings for the Neo4j driver, from the environment:
+        NEO4J_MAX_POOL_SIZE         Most connections kept open, defaults to 100
+        NEO4J_ACQUISITION_TIMEOUT   Seconds a query waits for a free connection, defaults to 60
+        NEO4J_CONNECTION_TIMEOUT    Seconds to open a connection, defaults to 30
+    """
+    return {
+        "max_connection_pool_size": int(os.getenv("NEO4J_MAX_POOL_SIZE", 100)),
+        "connection_acquisition_timeout": float(
+            os.getenv("NEO4J_ACQUISITION_TIMEOUT", 60)
+        ),
+        "connection_timeout": float(os.getenv("NEO4J_CONNECTION_TIMEOUT", 30)),
+    }
+
+
+def max_body_bytes() -> int:
+    """
+    Largest request body the webapps read, from MAX_BODY_BYTES. The default fits a batch
+    of MAX_BATCH_NDCS NDCs with room to spare, anything bigger is answered with 413.
+    """
+    return int(os.getenv("MAX_BODY_BYTES", 4 * 1024 * 1024))
+
+
+def graph_params(args: Dict) -> Dict:
+    """
+    Page parameters for GRAPH from the request arguments: limit, after (the cursor) and
+    format, either json or ndjson.
+
+    Raises:
+        ValueError: limit isn't a positive number or the format is unknown
+    """
+    limit = int(args.get("limit", DEFAULT_GRAPH_LIMIT))
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    limit = min(limit, MAX_GRAPH_LIMIT)
+    return {
+        "limit": limit,
+        "after": args.get("after", ""),
+        "format": output_format(args),
+    }
+
+
+def output_format(args: Dict) -> str:
+    requested = args.get("format", "json")
+    if requested not in ("json", "ndjson"):
+        raise ValueError("format must be json or ndjson")
+    return requested
+
+
+def batch_ndcs(payload) -> List[str]:
+    """
+    Raw NDCs from a batch request body, either a JSON array of strings or
+    {"ndcs": [...]}.
+
+    Raises:
+        ValueError: The body isn't one of those or has more than MAX_BATCH_NDCS NDCs
+    """
+    if isinstance(payload, dict):
+        payload = payload.get("ndcs")
+    if not isinstance(payload, list):
+        raise ValueError('Body must be a JSON array of NDCs or {"ndcs": [...]}')
+    if len(payload) > MAX_BATCH_NDCS:
+        raise ValueError(f"At most {MAX_BATCH_NDCS} NDCs per batch")
+    if not all(isinstance(raw_ndc, str) for raw_ndc in payload):
+        # Numbers would have lost their leading zeros already
+        raise ValueError("NDCs must be strings")
+    return payload
+
+
+def batch_chunks(
+    raw_ndcs: List[str], chunk_size: int = BATCH_CHUNK_SIZE
+) -> Iterator[pd.DataFrame]:
+    """
+    Normalizes raw NDCs to 11 digits like the import files and yields them in input
+    order, chunk_size at a time, as frames with input, ndc and ndc_valid columns.
+    """
+    normalized = normalize_ndcs(pd.Series(raw_ndcs, dtype="string"))
+    normalized.insert(0, "input", raw_ndcs)
+    for start in range(0, len(normalized), chunk_size):
+        yield normalized.iloc[start : start + chunk_size]
+
+
+def chunk_ndcs(chunk: pd.DataFrame) -> List[str]:
+    """Distinct NDCs of a chunk, the ndcs parameter of the batch queries"""
+    return chunk["ndc"].dropna().unique().tolist()
+
+
+class GraphWriter:
+    """
+    Serializes GRAPH records for the D3 view one record at a time. NDCs are nodes,
+    ingredients are interned by RXCUI so each is one node however many NDCs share it, and
+    links point from ingredient to NDC by node position.
+
+    JSON output is {"nodes": [...], "links": [...], "next": cursor}. Nodes are written as
+    they arrive and only the links, pairs of integers, are held until the end.
+    NDJSON output is one {"node": ...}, {"link": ...} or final {"next": cursor} per line.
+    The cursor is the last NDC of a full page, pass it as after for the next page, and
+    null on the last page.
+    """
+
+    def __init__(self, limit: int, ndjson: bool = False):
+        self.limit = limit
+        self.ndjson = ndjson
+        self.ingredient_ids: Dict[str, int] = {}
+        self.node_count = 0
+        self.record_count = 0
+        self.last_ndc: Optional[str] = None
+        self.links = []
+
+    def start(self) -> str:
+        return "" if self.ndjson else '{"nodes": ['
+
+    def _node(self, node: Dict) -> str:
+        self.node_count += 1
+        if self.ndjson:
+            return json.dumps({"node": node}) + "\n"
+        return (", " if self.node_count > 1 else "") + json.dumps(node)
+
+    def _link(self, source: int, target: int) -> str:
+        if self.ndjson:
+            return json.dumps({"link": {"source": source, "target": target}}) + "\n"
+        self.links.append({"source": source, "target": target})
+        return ""
+
+    def add(self, record) -> str:
+        self.record_count += 1
+        self.last_ndc = record["ndc"]
+        target = self.node_count
+        chunks = [
+            self._node(
+                {
+                    "ndc": record["ndc"],
+                    "name": record["brand"],
+                    "label": "NDC",
+                    "rxcui": record["rxcui"],
+                    "icount": len(record["ingredients"]),
+                }
+            )
+        ]
+        for ingredient in record["ingredients"]:
+            source = self.ingredient_ids.get(ingredient["rxcui"])
+            if source is None:
+                source = self.ingredient_ids[ingredient["rxcui"]] = self.node_count
+                chunks.append(
+                    self._node(
+                        {
+                            "name": ingredient["brand"],
+                            "label": "IN",
+                            "rxcui": ingredient["rxcui"],
+                            "icount": 0,
+                        }
+                    )
+                )
+            chunks.append(self._link(source, target))
+        return "".join(chunks)
+
+    def end(self) -> str:
+        next_cursor = self.last_ndc if self.record_count >= self.limit else None
+        if self.ndjson:
+            return json.dumps({"next": next_cursor}) + "\n"
+        return (
+            f'], "links": {json.dumps(self.links)}, "next": {json.dumps(next_cursor)}}}'
+        )
+
+
+class BatchWriter:
+    """
+    Serializes batch lookup results in the order the NDCs were sent, as a JSON array or
+    one object per NDJSON line. Each result has the input, its normalized ndc, whether
+    that's a valid layout (valid), whether it's in the graph (found) and the route's
+    BATCH_FIELDS.
+    """
+
+    def __init__(self, route: str, ndjson: bool = False):
+        self.fields = BATCH_FIELDS[route]
+        self.ndjson = ndjson
+        self.count = 0
+
+    def start(self) -> str:
+        return "" if self.ndjson else "["
+
+    def add(self, chunk: pd.DataFrame, records: Iterable) -> str:
+        """Results for one chunk from batch_chunks, given the batch query's records"""
+        found = {record["ndc"]: record for record in records}
+        chunks = []
+        for raw_ndc, ndc, valid in chunk[["input", "ndc", "ndc_valid"]].itertuples(
+            index=False
+        ):
+            ndc = None if pd.isna(ndc) else ndc
+            record = found.get(ndc)
+            result = {
+                "input": raw_ndc,
+                "ndc": ndc,
+                "valid": bool(valid),
+                "found": record is not None,
+            }
+            for field, missing in self.fields.items():
+                result[field] = missing if record is None else record[field]
+            if self.ndjson:
+                chunks.append(json.dumps(result) + "\n")
+            else:
+                chunks.append((", " if self.count else "") + json.dumps(result))
+            self.count += 1
+        return "".join(chunks)
+
+    def end(self) -> str:
+        return "" if self.ndjson else "]"
@@ -0,0 +1,167 @@
+"""
+Response cache for the webapps
+
+The graph only changes when fill_db.sh reloads it or a delta is applied, so responses are
+cached by route and parameters. Each key includes the build version, which
+generate_neo4j_data.py stores on the (:BUILD) node. The apps re-read the version every
+BUILD_VERSION_CHECK seconds, and once it changes every older entry stops matching.
+
+Entries live in a per process LRU by default. Setting RESPONSE_CACHE_URL to a redis:// URL
+shares them between workers instead, which needs the redis package.
+
+Settings, from the environment:
+    RESPONSE_CACHE_SIZE     Most entries in the local cache, 0 turns caching off. Default 10000
+    RESPONSE_CACHE_TTL      Seconds an entry is kept, defaults to 3600
+    RESPONSE_CACHE_URL      Shared backend, ie redis://127.0.0.1:6379/0
+    BUILD_VERSION_CHECK     Seconds between build version checks, defaults to 30
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 10_000
+DEFAULT_TTL = 3600.0
+DEFAULT_VERSION_CHECK = 30.0
+KEY_PREFIX = "rxnorm:response:"
+
+
+class LocalBackend:
+    """Thread safe in-process LRU with a TTL on every entry"""
+
+    def __init__(
+        self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisBackend:
+    """
+    Cache shared by every worker and app instance. Redis evicts by its own maxmemory
+    policy, entries also expire after the TTL.
+    """
+
+    def __init__(self, url: str, ttl: float = DEFAULT_TTL):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(KEY_PREFIX + key)
+
+    def set(self, key: str, value: bytes):
+        self.client.set(KEY_PREFIX + key, value, ex=int(self.ttl))
+
+    def clear(self):
+        # Keys hold the build version, so old entries are never read again and expire
+        pass
+
+
+class ResponseCache:
+    """
+    Response bodies keyed on build version, route and parameters.
+
+    The app reads the build version from Neo4j whenever version_due() says so and passes
+    it to set_version. Until a version is known nothing is cached.
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        version_check_interval: float = DEFAULT_VERSION_CHECK,
+    ):
+        self.backend = backend
+        self.version_check_interval = version_check_interval
+        self.version: Optional[str] = None
+        self._version_checked = float("-inf")
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        max_entries = int(os.getenv("RESPONSE_CACHE_SIZE", DEFAULT_MAX_ENTRIES))
+        ttl = float(os.getenv("RESPONSE_CACHE_TTL", DEFAULT_TTL))
+        url = os.getenv("RESPONSE_CACHE_URL")
+        if url:
+            backend = RedisBackend(url, ttl)
+        elif max_entries > 0:
+            backend = LocalBackend(max_entries, ttl)
+        else:
+            backend = None
+        return cls(
+            backend,
+            float(os.getenv("BUILD_VERSION_CHECK", DEFAULT_VERSION_CHECK)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def version_due(self) -> bool:
+        return (
+            self.enabled
+            and time.monotonic() - self._version_checked >= self.version_check_interval
+        )
+
+    def set_version(self, version: Optional[str]):
+        self._version_checked = time.monotonic()
+        if version != self.version:
+            if self.version is not None:
+                logger.info(
+                    f"Build version changed to {version}, dropping cached responses"
+                )
+            self.backend.clear()
+            self.version = version
+
+    def key(self, route: str, params: Dict) -> str:
+        return json.dumps([self.version, route, sorted(params.items())], default=str)
+
+    def get(self, route: str, params: Dict) -> Optional[bytes]:
+        if not self.enabled or self.version is None:
+            return None
+        value = self.backend.get(self.key(route, params))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, route: str, params: Dict, body: bytes):
+        if self.enabled and self.version is not None:
+            self.backend.set(self.key(route, params), body)
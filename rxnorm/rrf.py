@@ -1,9 +1,35 @@
 import gzip as gz
+import re
 import warnings
+from functools import lru_cache
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Character level replacements done by std_col_ref in one str.translate call
+_COL_REF_TRANSLATION = str.maketrans(
+    {
+        **{char: "_" for char in "-/\\."},
+        "#": "num",
+        **{char: None for char in "()!@$%^&*"},
+    }
+)
+_WHITESPACE_RE = re.compile(r"\s")
+_UNDERSCORES_RE = re.compile(r"_+")
+
+
+# Bounded, std_col_ref is also mapped over labels, which can be any text
+@lru_cache(maxsize=1024)
+def _std_col_name(text: str) -> str:
+    new_text = _WHITESPACE_RE.sub("_", text.strip()).translate(_COL_REF_TRANSLATION)
+    return _UNDERSCORES_RE.sub("_", new_text).lower()
+
+
+@lru_cache(maxsize=256)
+def _std_col_names(columns: Tuple) -> Tuple:
+    return tuple(_std_col_name(column_name) for column_name in columns)
 
 
 def std_col_ref(text_series: pd.Series) -> pd.Series:
@@ -11,32 +37,23 @@ def std_col_ref(text_series: pd.Series) -> pd.Series:
     The standardized text makes matching column names dynamically much simpler.
     Transformations include, removing most punctuation, replacing whitespace, and lowercase.
 
-    NOTE - The order of these transformations is important. For example, if spaces are converted
-    to underscore after double underscores (_ _) are removed, then it will potentially create
-    new columns that have double underscores in the name.
+    Whitespace, hyphens, slashes and periods become underscores, '#' becomes 'num', the
+    remaining punctuation is removed and then runs of underscores are collapsed. The last
+    1024 distinct labels are cached, repeats of them are lookups.
 
     Args:
         text_series: Pandas Series with the column names or labels to standardize.
 
     Returns:
         new_text: Transformed pandas series with the standardization applied."""
-    new_text = text_series.str.strip()
-    new_text = new_text.str.replace(r"\s+", "_", regex=True)
-    new_text = new_text.str.replace("[-]+", "_", regex=True)
-    new_text = new_text.str.replace("/", "_", regex=False)
-    new_text = new_text.str.replace("\\", "_", regex=False)
-    new_text = new_text.str.replace(".", "_", regex=False)
-    new_text = new_text.str.replace("#", "num", regex=False)
-    new_text = new_text.str.replace("(", "", regex=False)
-    new_text = new_text.str.replace(")", "", regex=False)
-    new_text = new_text.str.replace("[!@#$%^&*]+", "", regex=True)
-    new_text = new_text.str.replace("[_]+", "_", regex=True)
-    new_text = new_text.str.lower()
-    return new_text
+    return text_series.map(_std_col_name)
 
 
 def standardize_columns(
-    df: pd.DataFrame, drop_na_cols: bool = False, inplace: bool = True
+    df: pd.DataFrame,
+    drop_na_cols: bool = False,
+    inplace: bool = True,
+    copy: bool = True,
 ) -> pd.DataFrame:
     """Standardizes column names and references:
 
@@ -45,114 +62,394 @@ def standardize_columns(
         drop_na_cols: Bool switch to drop columns that are entirely empty (NA)
         inplace: Bool switch to determine whether the original dataframe is modified or
                  a new one is created
+        copy: When inplace is False, whether the new dataframe gets its own copy of the data.
+              With copy=False only the column labels are new and the data is shared.
 
     Returns:
         pd.DataFrame: The dataframe with the columns standardized
     """
     if not inplace:
-        df = copy.deepcopy(df)
-    the_columns = df.columns
-    the_columns = std_col_ref(the_columns)
-    df.columns = the_columns
+        df = df.copy(deep=copy)
+    the_columns = _std_col_names(tuple(df.columns))
+    if the_columns != tuple(df.columns):
+        df.columns = the_columns
     if drop_na_cols:
         df = df.dropna(axis=1, how="all")
     return df
 
 
-def _rrf_to_df(rrf_path: Path, headers):
+CONSO_HEADERS = [
+    "rxcui",
+    "lat",
+    "ts",
+    "lui",
+    "stt",
+    "sui",
+    "ispref",
+    "rxaui",
+    "saui",
+    "scui",
+    "sdui",
+    "sab",
+    "tty",
+    "code",
+    "str",
+    "srl",
+    "suppress",
+    "cvf",
+]
+
+REL_HEADERS = [
+    "rxcui1",
+    "rxaui1",
+    "stype1",
+    "rel",
+    "rxcui2",
+    "rxaui2",
+    "stype2",
+    "rela",
+    "rui",
+    "srui",
+    "sab",
+    "sl",
+    "dir",
+    "rg",
+    "suppress",
+    "cvf",
+]
+
+SAT_HEADERS = [
+    "rxcui",
+    "lui",
+    "sui",
+    "rxaui",
+    "stype",
+    "code",
+    "atui",
+    "satui",
+    "atn",
+    "sab",
+    "atv",
+    "suppress",
+    "cvf",
+]
+
+STY_HEADERS = [
+    "rxcui",
+    "tui",
+    "stn",
+    "sty",
+    "atui",
+    "cvf",
+]
+
+# Per-file column types. Identifiers load as nullable integers and low-cardinality
+# codes as categoricals; anything not listed here loads as a string.
+CONSO_DTYPES = {
+    "rxcui": "Int64",
+    "rxaui": "Int64",
+    "lat": "category",
+    "ts": "category",
+    "stt": "category",
+    "ispref": "category",
+    "sab": "category",
+    "tty": "category",
+    "srl": "category",
+    "suppress": "category",
+    "cvf": "category",
+}
+
+REL_DTYPES = {
+    "rxcui1": "Int64",
+    "rxaui1": "Int64",
+    "stype1": "category",
+    "rel": "category",
+    "rxcui2": "Int64",
+    "rxaui2": "Int64",
+    "stype2": "category",
+    "rela": "category",
+    "sab": "category",
+    "sl": "category",
+    "dir": "category",
+    "suppress": "category",
+    "cvf": "category",
+}
+
+SAT_DTYPES = {
+    "rxcui": "Int64",
+    "rxaui": "Int64",
+    "stype": "category",
+    "atn": "category",
+    "sab": "category",
+    "suppress": "category",
+    "cvf": "category",
+}
+
+# TUI values look like "T121", so they are codes rather than integers
+STY_DTYPES = {
+    "rxcui": "Int64",
+    "tui": "category",
+    "stn": "category",
+    "sty": "category",
+    "cvf": "category",
+}
+
+# Rows per chunk when streaming an RRF file. RXNSAT rows are roughly 150 bytes
+# once parsed, so this keeps each chunk well under 100MB.
+DEFAULT_CHUNKSIZE = 500_000
+
+RowFilters = Dict[str, Union[str, Iterable[str]]]
+
+
+def _column_dtypes(headers: List, dtypes: Optional[Dict[str, str]]) -> Dict[str, str]:
+    dtypes = dtypes or {}
+    return {col_name: dtypes.get(col_name, "string") for col_name in headers}
+
+
+def _concat_chunks(chunks: List[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenates chunks while keeping categorical columns categorical.
+    Each chunk infers its own categories, which pd.concat would otherwise turn into objects.
+    """
+    df = pd.concat(chunks, ignore_index=True)
+    for col_name, dtype in chunks[0].dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            df[col_name] = union_categoricals(
+                [chunk[col_name] for chunk in chunks], ignore_order=True
+            )
+    return df
+
+
+def drop_empty_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Drops the columns that are entirely empty, like the unused fields of most RRF files.
+    A frame without rows keeps its columns, there's nothing to tell empty ones apart."""
+    if df.empty:
+        return df
+    return df.dropna(how="all", axis=1)
+
+
+def _rrf_to_df(rrf_path: Path, headers, dtypes: Optional[Dict[str, str]] = None):
     df = pd.read_csv(
         rrf_path,
         names=headers,
         delimiter="|",
-        dtype="string",
+        dtype=_column_dtypes(headers, dtypes),
         escapechar="ä",
         index_col=False,
-    ).dropna(how="all", axis=1)
-    return standardize_columns(df)
+    )
+    return standardize_columns(drop_empty_columns(df))
 
 
-def _read_rrf(filepath: Path, headers: List):
+def _read_rrf(
+    filepath: Path,
+    headers: List,
+    dtypes: Optional[Dict[str, str]] = None,
+    columns: Optional[List[str]] = None,
+    filters: Optional[RowFilters] = None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+):
+    if columns is not None or filters is not None:
+        chunks = list(_iter_rrf(filepath, headers, dtypes, columns, filters, chunksize))
+        if not chunks:
+            column_dtypes = _column_dtypes(columns or headers, dtypes)
+            return pd.DataFrame(
+                {
+                    col_name: pd.Series(dtype=dtype)
+                    for col_name, dtype in column_dtypes.items()
+                }
+            )
+        df = _concat_chunks(chunks)
+        if columns is not None:
+            # Requested columns are kept even when empty, callers select them by name
+            return df
+        # Same clean up as a whole file read, over all the chunks as a column can be empty
+        # in some of them
+        return drop_empty_columns(df)
     if filepath.suffix != ".gz":
-        return _rrf_to_df(filepath, headers)
+        return _rrf_to_df(filepath, headers, dtypes)
     with gz.open(filepath, "rt") as rrf_file:
-        return _rrf_to_df(rrf_file, headers)
-
-
-def read_rrf_conso(filepath: Path = Path("RXNCONSO.RRF.gz")):
-    headers = [
-        "rxcui",
-        "lat",
-        "ts",
-        "lui",
-        "stt",
-        "sui",
-        "ispref",
-        "rxaui",
-        "saui",
-        "scui",
-        "sdui",
-        "sab",
-        "tty",
-        "code",
-        "str",
-        "srl",
-        "suppress",
-        "cvf",
-    ]
-
-    return _read_rrf(filepath, headers)
-
-
-def read_rrf_rel(filepath: Path = Path("RXNREL.RRF.gz")):
-    headers = [
-        "rxcui1",
-        "rxaui1",
-        "stype1",
-        "rel",
-        "rxcui2",
-        "rxaui2",
-        "stype2",
-        "rela",
-        "rui",
-        "srui",
-        "sab",
-        "sl",
-        "dir",
-        "rg",
-        "suppress",
-        "cvf",
-    ]
-
-    return _read_rrf(filepath, headers)
-
-
-def read_rrf_sat(filepath: Path = Path("RXNSAT.RRF.gz")):
-    headers = [
-        "rxcui",
-        "lui",
-        "sui",
-        "rxaui",
-        "stype",
-        "code",
-        "atui",
-        "satui",
-        "atn",
-        "sab",
-        "atv",
-        "suppress",
-        "cvf",
-    ]
-
-    return _read_rrf(filepath, headers)
-
-
-def read_rrf_sty(filepath: Path = Path("RXNSTY.RRF.gz")):
-    headers = [
-        "rxcui",
-        "tui",
-        "stn",
-        "sty",
-        "atui",
-        "cvf",
-    ]
-    return _read_rrf(filepath, headers)
+        return _rrf_to_df(rrf_file, headers, dtypes)
+
+
+def _filter_mask(chunk: pd.DataFrame, filters: RowFilters) -> pd.Series:
+    """Builds a row mask where every column matches its filter value.
+    A string value is an equality test, any other iterable is a membership test."""
+    mask = pd.Series(True, index=chunk.index)
+    for col_name, value in filters.items():
+        if isinstance(value, str):
+            mask &= chunk[col_name] == value
+        else:
+            mask &= chunk[col_name].isin(list(value))
+    return mask.fillna(False)
+
+
+def _iter_rrf(
+    filepath: Path,
+    headers: List,
+    dtypes: Optional[Dict[str, str]] = None,
+    columns: Optional[List[str]] = None,
+    filters: Optional[RowFilters] = None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+) -> Iterator[pd.DataFrame]:
+    """Streams an RRF file as DataFrame chunks of at most `chunksize` rows.
+
+    Only the requested columns, plus any filter columns, are parsed. Filters are
+    applied to each chunk as soon as it is parsed, so rows that don't match are
+    never held in memory alongside the rest of the file.
+
+    Args:
+        filepath: Location of the RRF(.gz) file
+        headers: Column names for the RRF file, in file order
+        dtypes: Column types by name, columns not listed are read as strings
+        columns: Columns to keep, defaults to all of them
+        filters: Mapping of column name to a required value or collection of values
+        chunksize: Maximum number of rows parsed per chunk
+
+    Yields:
+        pd.DataFrame: Chunk of matching rows with only the requested columns"""
+    filters = filters or {}
+    columns = list(columns) if columns is not None else list(headers)
+    unknown = [col for col in [*columns, *filters] if col not in headers]
+    if unknown:
+        raise ValueError(f"Unknown RRF columns requested: {unknown}")
+    usecols = [col for col in headers if col in columns or col in filters]
+
+    rrf_file = gz.open(filepath, "rt") if filepath.suffix == ".gz" else filepath
+    try:
+        reader = pd.read_csv(
+            rrf_file,
+            names=headers,
+            usecols=usecols,
+            delimiter="|",
+            dtype=_column_dtypes(usecols, dtypes),
+            escapechar="ä",
+            index_col=False,
+            chunksize=chunksize,
+        )
+        for chunk in reader:
+            if filters:
+                chunk = chunk.loc[_filter_mask(chunk, filters)]
+            yield standardize_columns(chunk[columns])
+    finally:
+        if rrf_file is not filepath:
+            rrf_file.close()
+
+
+def read_rrf_conso(
+    filepath: Path = Path("RXNCONSO.RRF.gz"),
+    columns: Optional[List[str]] = None,
+    filters: Optional[RowFilters] = None,
+):
+    return _read_rrf(filepath, CONSO_HEADERS, CONSO_DTYPES, columns, filters)
+
+
+def read_rrf_rel(
+    filepath: Path = Path("RXNREL.RRF.gz"),
+    columns: Optional[List[str]] = None,
+    filters: Optional[RowFilters] = None,
+):
+    return _read_rrf(filepath, REL_HEADERS, REL_DTYPES, columns, filters)
+
+
+def read_rrf_sat(
+    filepath: Path = Path("RXNSAT.RRF.gz"),
+    columns: Optional[List[str]] = None,
+    filters: Optional[RowFilters] = None,
+):
+    return _read_rrf(filepath, SAT_HEADERS, SAT_DTYPES, columns, filters)
+
+
+def read_rrf_sty(
+    filepath: Path = Path("RXNSTY.RRF.gz"),
+    columns: Optional[List[str]] = None,
+    filters: Optional[RowFilters] = None,
+):
+    return _read_rrf(filepath, STY_HEADERS, STY_DTYPES, columns, filters)
+
+
+def iter_rrf_conso(
+    filepath: Path = Path("RXNCONSO.RRF.gz"),
+    columns: Optional[List[str]] = None,
+    filters: Optional[RowFilters] = None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+) -> Iterator[pd.DataFrame]:
+    return _iter_rrf(filepath, CONSO_HEADERS, CONSO_DTYPES, columns, filters, chunksize)
+
+
+def iter_rrf_rel(
+    filepath: Path = Path("RXNREL.RRF.gz"),
+    columns: Optional[List[str]] = None,
+    filters: Optional[RowFilters] = None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+) -> Iterator[pd.DataFrame]:
+    return _iter_rrf(filepath, REL_HEADERS, REL_DTYPES, columns, filters, chunksize)
+
+
+def iter_rrf_sat(
+    filepath: Path = Path("RXNSAT.RRF.gz"),
+    columns: Optional[List[str]] = None,
+    filters: Optional[RowFilters] = None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+) -> Iterator[pd.DataFrame]:
+    return _iter_rrf(filepath, SAT_HEADERS, SAT_DTYPES, columns, filters, chunksize)
+
+
+def iter_rrf_sty(
+    filepath: Path = Path("RXNSTY.RRF.gz"),
+    columns: Optional[List[str]] = None,
+    filters: Optional[RowFilters] = None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+) -> Iterator[pd.DataFrame]:
+    return _iter_rrf(filepath, STY_HEADERS, STY_DTYPES, columns, filters, chunksize)
+
+
+# Bump whenever the headers or dtypes above change so cached tables are rebuilt
+SCHEMA_VERSION = 1
+
+RRF_TABLES = {
+    "RXNCONSO": (CONSO_HEADERS, CONSO_DTYPES),
+    "RXNREL": (REL_HEADERS, REL_DTYPES),
+    "RXNSAT": (SAT_HEADERS, SAT_DTYPES),
+    "RXNSTY": (STY_HEADERS, STY_DTYPES),
+}
+
+
+def rrf_table_name(filepath: Path) -> str:
+    """Finds the RRF table for a file, ie RXNSAT for 'rrf/RXNSAT.RRF.gz'"""
+    table_name = Path(filepath).name.split(".")[0].upper()
+    if table_name not in RRF_TABLES:
+        raise ValueError(
+            f"Unknown RRF file {filepath}, expected one of {list(RRF_TABLES)}"
+        )
+    return table_name
+
+
+def read_rrf(
+    filepath: Path,
+    columns: Optional[List[str]] = None,
+    filters: Optional[RowFilters] = None,
+) -> pd.DataFrame:
+    """Reads any supported RRF file using the headers and dtypes for its table."""
+    headers, dtypes = RRF_TABLES[rrf_table_name(filepath)]
+    return _read_rrf(Path(filepath), headers, dtypes, columns, filters)
+
+
+def iter_rrf(
+    filepath: Path,
+    columns: Optional[List[str]] = None,
+    filters: Optional[RowFilters] = None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+) -> Iterator[pd.DataFrame]:
+    """Streams any supported RRF file using the headers and dtypes for its table."""
+    headers, dtypes = RRF_TABLES[rrf_table_name(filepath)]
+    return _iter_rrf(Path(filepath), headers, dtypes, columns, filters, chunksize)
+
+
+def apply_dtypes(df: pd.DataFrame, table_name: str) -> pd.DataFrame:
+    """Casts the columns of a table back to its schema, ie after loading it from Parquet."""
+    headers, dtypes = RRF_TABLES[table_name]
+    column_dtypes = _column_dtypes(headers, dtypes)
+    for col_name in df.columns:
+        dtype = column_dtypes.get(col_name)
+        if dtype and str(df[col_name].dtype) != dtype:
+            df[col_name] = df[col_name].astype(dtype)
+    return df
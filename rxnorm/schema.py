@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Constraints and indexes for the webapp's lookups
+
+neo4j-admin import doesn't create any schema, so without this every lookup is a label scan:
+    /ingredients/<ndc> matches {ndc: $ndc} - uniqueness constraint on NDC.ndc
+    /search uses n.ndc CONTAINS $q          - text index on NDC.ndc
+Constraints also cover RXCUI.rxcui and STY.tui, which back the online MERGE loads. Text
+indexes on NDC.brand and a full-text index over NDC ndc and brand support brand search.
+
+Everything is created with IF NOT EXISTS, so running it again is cheap. It waits until
+every index is online, as a populating index isn't used by queries.
+
+The webapps only check the indexes as they start, see check_ready, and answer lookups
+with 503 until they're online.
+
+Usage (after fill_db.sh has started the server):
+    python -m rxnorm.schema
+    python -m rxnorm.schema --check-only
+"""
+
+import argparse
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+import neo4j
+from rxnorm import graph
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 300
+# Seconds a starting webapp waits for the indexes, and then between checks until they're online
+STARTUP_TIMEOUT = 10
+RECHECK_INTERVAL = 30
+
+# (label, property) pairs with a text index, for CONTAINS and ENDS WITH lookups
+TEXT_INDEXES: List[Tuple[str, str]] = [
+    ("NDC", "ndc"),
+    ("NDC", "brand"),
+]
+
+# Full-text index name mapped to its label and properties
+FULLTEXT_INDEXES: Dict[str, Tuple[str, List[str]]] = {
+    "ndc_search": ("NDC", ["ndc", "brand"]),
+}
+
+
+def text_index_name(label: str, prop: str) -> str:
+    return f"{label}_{prop}_text".lower()
+
+
+def schema_queries() -> List[str]:
+    queries = [
+        graph.constraint_query(label, id_property)
+        for label, id_property in graph.ID_PROPERTIES.items()
+    ]
+    queries += [
+        f"CREATE TEXT INDEX {graph.cypher_name(text_index_name(label, prop))} "
+        f"IF NOT EXISTS FOR (n:{graph.cypher_name(label)}) ON (n.{graph.cypher_name(prop)})"
+        for label, prop in TEXT_INDEXES
+    ]
+    for name, (label, props) in FULLTEXT_INDEXES.items():
+        prop_list = ", ".join(f"n.{graph.cypher_name(prop)}" for prop in props)
+        queries.append(
+            f"CREATE FULLTEXT INDEX {graph.cypher_name(name)} "
+            f"IF NOT EXISTS FOR (n:{graph.cypher_name(label)}) ON EACH [{prop_list}]"
+        )
+    return queries
+
+
+def expected_indexes() -> List[str]:
+    """Names of every index the schema creates, including those backing constraints."""
+    names = [
+        graph.constraint_name(label, id_property)
+        for label, id_property in graph.ID_PROPERTIES.items()
+    ]
+    names += [text_index_name(label, prop) for label, prop in TEXT_INDEXES]
+    return names + list(FULLTEXT_INDEXES)
+
+
+def create_schema(session: neo4j.Session):
+    for query in schema_queries():
+        session.run(query).consume()
+        logger.info(query)
+
+
+def index_states(session: neo4j.Session) -> Dict[str, str]:
+    return {
+        record["name"]: record["state"]
+        for record in session.run("SHOW INDEXES YIELD name, state")
+    }
+
+
+def wait_for_indexes(session: neo4j.Session, timeout: int = DEFAULT_TIMEOUT):
+    """
+    Waits for every index to come online and checks the expected ones exist.
+
+    Raises:
+        TimeoutError: An index is still populating after timeout seconds
+        ValueError: An expected index is missing or failed
+    """
+    try:
+        session.run("CALL db.awaitIndexes($timeout)", timeout=timeout).consume()
+    except neo4j.exceptions.AuthError:
+        raise
+    except neo4j.exceptions.ClientError as error:
+        # Raised when the wait times out, the states below say which index is behind
+        logger.warning(f"Waiting for indexes failed: {error.message}")
+
+    states = index_states(session)
+    populating = [name for name, state in states.items() if state == "POPULATING"]
+    if populating:
+        raise TimeoutError(
+            f"Indexes not online after {timeout}s: {', '.join(populating)}"
+        )
+    problems = [
+        f"{name} is {states.get(name, 'missing')}"
+        for name in expected_indexes()
+        if states.get(name) != "ONLINE"
+    ]
+    if problems:
+        for problem in problems:
+            logger.error(problem)
+        raise ValueError(f"Indexes not ready: {', '.join(problems)}")
+    logger.info(f"{len(states)} indexes online")
+
+
+def bootstrap(
+    driver: neo4j.Driver,
+    database: Optional[str] = None,
+    timeout: int = DEFAULT_TIMEOUT,
+    create: bool = True,
+):
+    """Creates the constraints and indexes, unless create is False, and waits for them."""
+    with driver.session(database=database) as session:
+        if create:
+            create_schema(session)
+        wait_for_indexes(session, timeout)
+
+
+def check_ready(
+    driver: neo4j.Driver,
+    database: Optional[str] = None,
+    timeout: int = STARTUP_TIMEOUT,
+) -> bool:
+    """
+    Checks every index is online without creating any, for servers starting up. Problems
+    are logged instead of raised.
+    """
+    try:
+        bootstrap(driver, database, timeout, create=False)
+    except (
+        TimeoutError,
+        ValueError,
+        neo4j.exceptions.Neo4jError,
+        neo4j.exceptions.DriverError,
+    ) as error:
+        logger.error(f"Neo4j indexes not ready: {error}")
+        return False
+    return True
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Create the Neo4j constraints and indexes and wait for them"
+    )
+    parser.add_argument(
+        "--uri", default=os.getenv("NEO4J_URI", "bolt://127.0.0.1:7687")
+    )
+    parser.add_argument("--user", default=os.getenv("NEO4J_USER", "neo4j"))
+    parser.add_argument("--database", default=os.getenv("NEO4J_DATABASE"))
+    parser.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT)
+    parser.add_argument(
+        "--check-only",
+        action="store_true",
+        help="Only check the indexes are online",
+    )
+    parsed = parser.parse_args(args)
+
+    password = os.getenv("NEO4J_PASSWORD", "neo4j")
+    with neo4j.GraphDatabase.driver(parsed.uri, auth=(parsed.user, password)) as driver:
+        bootstrap(driver, parsed.database, parsed.timeout, create=not parsed.check_only)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,271 @@
+"""
+Typeahead index for NDC and drug name search
+
+Built by generate_neo4j_data.py next to the import files and loaded by the webapps, so
+search keystrokes never reach Neo4j. Everything is stored as .npy arrays and
+memory-mapped on load:
+    NDC prefix      normalized 11 digit NDCs, sorted, searched with a binary search
+    Name tokens     sorted lower case tokens of the brand and generic names, each pointing
+                    at the NDCs whose names contain it (CSR style postings)
+    Names           the brand of each NDC as one UTF-8 blob plus offsets, as fixed width
+                    strings would be mostly padding
+
+A query with letters matches NDCs whose names have a word starting with each word typed,
+and the exact word once it's followed by a space. Anything else is treated as a partial
+NDC and matched on prefix, or anywhere in the NDC when nothing starts with it.
+"""
+
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_DIR = Path("./search_index")
+DEFAULT_LIMIT = 7
+INDEX_INFO_FILE = "search_index.json"
+ARRAYS = [
+    "ndc_keys",
+    "brand_blob",
+    "brand_offsets",
+    "token_keys",
+    "token_ptr",
+    "token_rows",
+]
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Sorts after every character a key can hold, so prefix + _MAX_CHAR bounds a prefix range
+_MAX_CHAR = "\U0010ffff"
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def load_from_env() -> Optional["SearchIndex"]:
+    """
+    The index in SEARCH_INDEX_DIR, ./search_index by default, or None when it hasn't been
+    built and searches have to go to Neo4j.
+    """
+    index_dir = Path(os.getenv("SEARCH_INDEX_DIR", DEFAULT_INDEX_DIR))
+    if not SearchIndex.exists(index_dir):
+        logger.warning(f"No search index in {index_dir}, searching in Neo4j instead")
+        return None
+    return SearchIndex.load(index_dir)
+
+
+class SearchIndex:
+    """
+    Rows are NDCs in sorted order, so row i is ndc_keys[i]. Row order doubles as the
+    result order.
+    """
+
+    def __init__(
+        self,
+        ndc_keys: np.ndarray,
+        brand_blob: np.ndarray,
+        brand_offsets: np.ndarray,
+        token_keys: np.ndarray,
+        token_ptr: np.ndarray,
+        token_rows: np.ndarray,
+    ):
+        self.ndc_keys = ndc_keys
+        self.brand_blob = brand_blob
+        self.brand_offsets = brand_offsets
+        self.token_keys = token_keys
+        self.token_ptr = token_ptr
+        self.token_rows = token_rows
+        self._ndc_blob: Optional[bytes] = None
+
+    def __len__(self) -> int:
+        return len(self.ndc_keys)
+
+    @classmethod
+    def build(
+        cls, ndc_data: pd.DataFrame, generic_names: Optional[pd.DataFrame] = None
+    ) -> "SearchIndex":
+        """
+        Args:
+            ndc_data: Frame with ndc, rxcui and brand columns, ie from prepare_ndc_data.
+                      NDCs without a brand are left out, like the Neo4j search.
+            generic_names: Frame with rxcui and generic columns. The generic name of each
+                           NDC's RXCUI is searchable too.
+        """
+        rows = ndc_data.loc[ndc_data["brand"].notna(), ["ndc", "rxcui", "brand"]]
+        rows = rows.astype("string").dropna(subset=["ndc"])
+        rows = rows.drop_duplicates(subset="ndc").sort_values("ndc", ignore_index=True)
+        names = rows["brand"]
+        if generic_names is not None:
+            generics = (
+                generic_names[["rxcui", "generic"]]
+                .astype("string")
+                .dropna()
+                .drop_duplicates(subset="rxcui")
+                .set_index("rxcui")["generic"]
+            )
+            generic = rows["rxcui"].map(generics).fillna("")
+            names = names + " " + generic
+
+        # One (token, row) pair per distinct word in each NDC's names
+        tokens = names.str.lower().str.findall(_TOKEN_RE.pattern).explode().dropna()
+        # Hash the tokens to codes and only sort the distinct ones, sorting millions of
+        # strings is most of the build time otherwise
+        token_codes, distinct_tokens = pd.factorize(tokens.to_numpy(dtype=str))
+        token_order = np.argsort(distinct_tokens)
+        token_keys = distinct_tokens[token_order].astype(str)
+        token_ranks = np.empty(len(token_order), dtype=np.int64)
+        token_ranks[token_order] = np.arange(len(token_order))
+        pair_keys = np.unique(
+            token_ranks[token_codes] * len(rows) + tokens.index.to_numpy(dtype=np.int64)
+        )
+        token_ptr = np.zeros(len(token_keys) + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(pair_keys // len(rows), minlength=len(token_keys)),
+            out=token_ptr[1:],
+        )
+
+        encoded = [brand.encode("utf-8") for brand in rows["brand"]]
+        brand_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(brand) for brand in encoded], out=brand_offsets[1:])
+        brand_blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+        index = cls(
+            rows["ndc"].to_numpy(dtype=str),
+            brand_blob,
+            brand_offsets,
+            token_keys,
+            token_ptr,
+            (pair_keys % len(rows)).astype(np.int32),
+        )
+        logger.info(
+            f"Built search index with {len(index)} NDCs and {len(token_keys)} name tokens"
+        )
+        return index
+
+    def save(self, index_dir: Path = DEFAULT_INDEX_DIR) -> Path:
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        for array_name in ARRAYS:
+            np.save(index_dir / f"{array_name}.npy", getattr(self, array_name))
+        index_info = {"ndcs": len(self), "tokens": len(self.token_keys)}
+        (index_dir / INDEX_INFO_FILE).write_text(json.dumps(index_info, indent=2))
+        logger.info(f"Saved search index to {index_dir}")
+        return index_dir
+
+    @classmethod
+    def load(
+        cls, index_dir: Path = DEFAULT_INDEX_DIR, mmap: bool = True
+    ) -> "SearchIndex":
+        index_dir = Path(index_dir)
+        index = cls(
+            **{
+                array_name: np.load(
+                    index_dir / f"{array_name}.npy", mmap_mode="r" if mmap else None
+                )
+                for array_name in ARRAYS
+            }
+        )
+        logger.info(f"Loaded search index with {len(index)} NDCs from {index_dir}")
+        return index
+
+    @staticmethod
+    def exists(index_dir: Path = DEFAULT_INDEX_DIR) -> bool:
+        return (Path(index_dir) / INDEX_INFO_FILE).exists()
+
+    def brand(self, row: int) -> str:
+        start, end = self.brand_offsets[row], self.brand_offsets[row + 1]
+        return bytes(self.brand_blob[start:end]).decode("utf-8")
+
+    def _prefix_range(self, keys: np.ndarray, prefix: str) -> Tuple[int, int]:
+        return (
+            int(np.searchsorted(keys, prefix, side="left")),
+            int(np.searchsorted(keys, prefix + _MAX_CHAR, side="left")),
+        )
+
+    def _token_range(self, token: str, prefix: bool) -> Tuple[int, int]:
+        if prefix:
+            return self._prefix_range(self.token_keys, token)
+        first = int(np.searchsorted(self.token_keys, token))
+        found = first < len(self.token_keys) and self.token_keys[first] == token
+        return first, first + 1 if found else first
+
+    def _has_token(self, rows: np.ndarray, token_range: Tuple[int, int]) -> np.ndarray:
+        first, last = token_range
+        postings = self.token_rows[self.token_ptr[first] : self.token_ptr[last]]
+        if last - first != 1:
+            return np.isin(rows, postings)
+        # One token's rows are sorted, so a binary search per row is enough
+        positions = np.minimum(np.searchsorted(postings, rows), len(postings) - 1)
+        return (
+            postings[positions] == rows if len(postings) else np.zeros(len(rows), bool)
+        )
+
+    def _ndc_bytes(self) -> bytes:
+        # NDCs back to back for substring search, built on first use
+        if self._ndc_blob is None:
+            self._ndc_blob = np.asarray(self.ndc_keys).astype("S11").tobytes()
+        return self._ndc_blob
+
+    def search_rows(self, query: str, limit: int = DEFAULT_LIMIT) -> np.ndarray:
+        """Rows matching a query, in NDC order"""
+        if re.search(r"[A-Za-z]", query):
+            # Every word counts as a prefix, except the last one once it's followed by a space
+            tokens = tokenize(query)
+            last_done = query[-1:].isspace()
+            token_ranges = [
+                self._token_range(
+                    token, prefix=not (last_done and num == len(tokens) - 1)
+                )
+                for num, token in enumerate(tokens)
+            ]
+            # Start from the word with the fewest rows and check the others against it
+            token_ranges.sort(
+                key=lambda token_range: self.token_ptr[token_range[1]]
+                - self.token_ptr[token_range[0]]
+            )
+            first, last = token_ranges[0]
+            rows = np.unique(
+                self.token_rows[self.token_ptr[first] : self.token_ptr[last]]
+            )
+            for token_range in token_ranges[1:]:
+                if not len(rows):
+                    break
+                rows = rows[self._has_token(rows, token_range)]
+            return rows[:limit]
+
+        digits = re.sub(r"\D", "", query)
+        if not digits:
+            return np.empty(0, dtype=np.int64)
+        first, last = self._prefix_range(self.ndc_keys, digits)
+        if last > first:
+            return np.arange(first, min(last, first + limit))
+
+        # Partial NDCs from the middle, ie a product code, the same as CONTAINS
+        ndc_bytes = self._ndc_bytes()
+        needle = digits.encode()
+        width = 11
+        rows = []
+        position = ndc_bytes.find(needle)
+        while position >= 0 and len(rows) < limit:
+            row, offset = divmod(position, width)
+            if offset + len(needle) <= width:
+                rows.append(row)
+                position = ndc_bytes.find(needle, (row + 1) * width)
+            else:
+                position = ndc_bytes.find(needle, position + 1)
+        return np.array(rows, dtype=np.int64)
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT) -> List[List[str]]:
+        """
+        [ndc, brand] pairs for a query, in the same shape as the Neo4j search records
+        """
+        return [
+            [str(self.ndc_keys[row]), self.brand(row)]
+            for row in self.search_rows(query, limit)
+        ]
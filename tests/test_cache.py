@@ -0,0 +1,105 @@
+import os
+
+import pandas as pd
+import pytest
+
+from rxnorm import cache, rrf
+
+SAT_ROWS = [
+    "1|||10||1|AT1||NDC|RXNORM|00904198861|N||",
+    "1|||11||1|AT2||NDC|MTHSPL|00904198862|N||",
+    "2|||20||2|AT3||DCSA|RXNORM|CII|N||",
+    "3|||30||3|AT4||NDC|RXNORM|00573015020|O||",
+]
+
+
+@pytest.fixture
+def sat_path(tmp_path):
+    sat_path = tmp_path / "rrf" / "RXNSAT.RRF"
+    sat_path.parent.mkdir()
+    sat_path.write_text("\n".join(SAT_ROWS) + "\n")
+    return sat_path
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """Counts the times an RRF file is parsed into the cache"""
+    calls = []
+    iter_rrf = rrf.iter_rrf
+
+    def counted(*args, **kwargs):
+        calls.append(args[0])
+        return iter_rrf(*args, **kwargs)
+
+    monkeypatch.setattr(rrf, "iter_rrf", counted)
+    return calls
+
+
+def assert_same_table(cached, read):
+    # Partitioned tables come back grouped by partition, so only the rows are compared
+    assert cached.columns.tolist() == read.columns.tolist()
+    pd.testing.assert_frame_equal(
+        cached.astype(object).sort_values(["rxcui", "atv"], ignore_index=True),
+        read.astype(object).sort_values(["rxcui", "atv"], ignore_index=True),
+    )
+    assert cached.dtypes.astype(str).tolist() == read.dtypes.astype(str).tolist()
+
+
+@pytest.mark.parametrize(
+    "columns, filters",
+    [
+        (None, None),
+        (None, {"atn": "NDC"}),
+        (None, {"atn": "NDC", "sab": "RXNORM", "suppress": "N"}),
+        (["rxcui", "atv", "cvf"], {"atn": ["NDC", "DCSA"]}),
+    ],
+)
+def test_load_matches_read_rrf(tmp_path, sat_path, columns, filters):
+    cached = cache.load(sat_path, columns, filters, cache_dir=tmp_path / "cache")
+    assert_same_table(cached, rrf.read_rrf(sat_path, columns, filters))
+    # Empty columns such as lui and cvf are left out the same way, unless requested
+    assert "lui" not in cached.columns
+    assert ("cvf" in cached.columns) == (columns is not None)
+
+
+def test_warm_reuses_touched_file(tmp_path, sat_path, parses):
+    cache_dir = tmp_path / "cache"
+    entry_dir = cache.warm(sat_path, cache_dir)
+    assert cache.warm(sat_path, cache_dir) == entry_dir
+
+    # Outside a release folder the key is the contents alone
+    assert entry_dir.name == cache.cache_key(None, cache.file_digest(sat_path))
+    stat = sat_path.stat()
+    os.utime(sat_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 86_400 * 10**9))
+    assert cache.warm(sat_path, cache_dir) == entry_dir
+    assert parses == [sat_path]
+
+
+def test_warm_replaces_changed_file(tmp_path, sat_path, parses):
+    cache_dir = tmp_path / "cache"
+    entry_dir = cache.warm(sat_path, cache_dir)
+    sat_path.write_text("\n".join(SAT_ROWS[:2]) + "\n")
+
+    new_entry_dir = cache.warm(sat_path, cache_dir)
+    assert new_entry_dir != entry_dir
+    assert not entry_dir.exists()
+    assert len(parses) == 2
+    assert len(cache.load(sat_path, cache_dir=cache_dir)) == 2
+
+
+def test_release_from_folder_name(tmp_path):
+    sat_path = tmp_path / "RxNorm_full_03062023" / "rrf" / "RXNSAT.RRF"
+    sat_path.parent.mkdir(parents=True)
+    sat_path.write_text("\n".join(SAT_ROWS) + "\n")
+    assert cache.release_date(sat_path) == "2023-03-06"
+    entry_dir = cache.warm(sat_path, tmp_path / "cache")
+    assert entry_dir.name.startswith("2023-03-06_")
+    assert cache.release_date(tmp_path / "RXNSAT.RRF") is None
+
+
+def test_partitioned_by_atn(tmp_path, sat_path):
+    entry_dir = cache.warm(sat_path, tmp_path / "cache")
+    assert sorted(path.name for path in entry_dir.glob("atn=*")) == [
+        "atn=DCSA",
+        "atn=NDC",
+    ]
@@ -0,0 +1,118 @@
+import os
+
+import pandas as pd
+import pytest
+
+from rxnorm import checkpoints
+from rxnorm.checkpoints import CheckpointStore
+
+
+def entry(name, import_dir, content="x"):
+    """A manifest entry for one import file, written to import_dir"""
+    (import_dir / f"{name}.csv").write_text(content)
+    return {"name": name, "header": None, "files": [{"path": f"{name}.csv"}]}
+
+
+@pytest.fixture
+def rrf_files(tmp_path):
+    rrf_dir = tmp_path / "rrf"
+    rrf_dir.mkdir()
+    for name in ["RXNCONSO.RRF", "RXNREL.RRF"]:
+        (rrf_dir / name).write_text("1|2|\n")
+    return sorted(rrf_dir.iterdir())
+
+
+def test_input_fingerprint(rrf_files):
+    fingerprint = checkpoints.input_fingerprint(rrf_files, compress=False)
+    assert checkpoints.input_fingerprint(rrf_files, compress=False) == fingerprint
+    assert checkpoints.input_fingerprint(rrf_files, compress=True) != fingerprint
+
+    stat = rrf_files[0].stat()
+    os.utime(rrf_files[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    touched = checkpoints.input_fingerprint(rrf_files, compress=False)
+    assert touched != fingerprint
+
+    rrf_files[1].write_text("1|2|3|\n")
+    os.utime(rrf_files[1], ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert checkpoints.input_fingerprint(rrf_files, compress=False) != touched
+
+    rrf_files[1].unlink()
+    assert checkpoints.input_fingerprint(rrf_files, compress=False) != touched
+
+
+def test_frames_round_trip_and_reopen(tmp_path):
+    store = CheckpointStore(tmp_path / "checkpoints", "abc")
+    df = pd.DataFrame({"rxcui": ["1", "2"], "str": ["aspirin", None]})
+    assert not store.has_frames(["conso"])
+    store.save_frame("conso", df)
+
+    reopened = CheckpointStore(tmp_path / "checkpoints", "abc")
+    assert reopened.has_frames(["conso"])
+    pd.testing.assert_frame_equal(reopened.load_frame("conso"), df)
+    with pytest.raises(ValueError):
+        reopened.load_frame("rel")
+
+
+def test_new_fingerprint_discards_checkpoints(tmp_path):
+    import_dir = tmp_path / "import"
+    import_dir.mkdir()
+    store = CheckpointStore(tmp_path / "checkpoints", "abc")
+    store.save_frame("conso", pd.DataFrame({"rxcui": ["1"]}))
+    store.finish("ndc", [entry("ndc_nodes", import_dir)])
+    unrelated = tmp_path / "checkpoints" / "notes.txt"
+    unrelated.write_text("kept")
+
+    store = CheckpointStore(tmp_path / "checkpoints", "def")
+    assert not store.has_frames(["conso"])
+    assert store.finished("ndc", import_dir) is None
+    assert not list((tmp_path / "checkpoints").glob("*.parquet"))
+    assert unrelated.exists()
+
+
+def test_unreadable_state_starts_over(tmp_path):
+    checkpoint_dir = tmp_path / "checkpoints"
+    checkpoint_dir.mkdir()
+    (checkpoint_dir / checkpoints.STATE_FILE).write_text("{not json")
+    store = CheckpointStore(checkpoint_dir, "abc")
+    assert store.state["stages"] == {}
+
+
+def test_finished_needs_the_stage_files(tmp_path):
+    import_dir = tmp_path / "import"
+    import_dir.mkdir()
+    store = CheckpointStore(tmp_path / "checkpoints", "abc")
+    assert store.finished("ndc", import_dir) is None
+
+    entries = [entry("ndc_nodes", import_dir), entry("rel_ndc", import_dir)]
+    store.finish("ndc", entries)
+    reopened = CheckpointStore(tmp_path / "checkpoints", "abc")
+    assert reopened.finished("ndc", import_dir) == entries
+
+    (import_dir / "rel_ndc.csv").unlink()
+    assert store.finished("ndc", import_dir) is None
+
+
+def test_upstream_rebuild_invalidates_dependent_stages(tmp_path):
+    import_dir = tmp_path / "import"
+    import_dir.mkdir()
+    store = CheckpointStore(tmp_path / "checkpoints", "abc")
+    store.finish("conso", [entry("conso_nodes", import_dir, "v1")])
+    upstream = store.upstream(["conso"])
+    assert upstream["conso"] is not None
+    store.finish("ndc", [entry("ndc_nodes", import_dir)], upstream)
+    assert store.finished("ndc", import_dir, store.upstream(["conso"])) is not None
+
+    # Rebuilt with the same files, the dependent stage is still current
+    store.finish("conso", [entry("conso_nodes", import_dir, "v1")])
+    assert not store.outdated("ndc", store.upstream(["conso"]))
+    assert store.finished("ndc", import_dir, store.upstream(["conso"])) is not None
+
+    # Entries differ, ie the files were split differently, so ndc is rebuilt
+    rebuilt = entry("conso_nodes", import_dir, "v2")
+    rebuilt["files"].append({"path": "conso_nodes.csv", "rows": 2})
+    store.finish("conso", [rebuilt])
+    assert store.stage_fingerprint("conso") != upstream["conso"]
+    assert store.outdated("ndc", store.upstream(["conso"]))
+    assert store.finished("ndc", import_dir, store.upstream(["conso"])) is None
+    # Or when an upstream stage hasn't finished at all
+    assert store.outdated("ndc", store.upstream(["rel"]))
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from rxnorm.csr_graph import BOTH, IN, NDC, OUT, CSRGraph
+
+
+@pytest.fixture
+def rx_graph():
+    # NDC -aka-> SBD 20 -tradename_of-> SCD 10 -has_ingredient-> IN 1, and the
+    # SCD 11 -has_ingredient-> IN 1 and IN 2 combination
+    rel_maps = {
+        "has_ingredient": pd.DataFrame(
+            {"rxcui2": ["10", "11", "11"], "rxcui1": ["1", "1", "2"]}
+        ),
+        "tradename_of": pd.DataFrame({"rxcui2": ["20"], "rxcui1": ["10"]}),
+    }
+    ndc_links = pd.DataFrame({"ndc": ["00000000001"], "rxcui": ["20"]})
+    concepts = pd.DataFrame(
+        {
+            "rxcui": ["1", "2", "10", "11", "20"],
+            "tty": ["IN", "IN", "SCD", "SCD", "SBD"],
+        }
+    )
+    return CSRGraph.build(rel_maps, ndc_links, concepts)
+
+
+def keys_by_query(graph, query_nums, node_ids, queries):
+    keys = graph.node_keys(node_ids)
+    return [sorted(keys[query_nums == num]) for num in range(queries)]
+
+
+def test_k_hop_by_depth(rx_graph):
+    start_ids = rx_graph.node_ids(["20", "20", "20"])
+    found = [
+        keys_by_query(rx_graph, *rx_graph.k_hop(start_ids[:1], k), 1)[0]
+        for k in range(4)
+    ]
+    assert found == [
+        [],
+        ["00000000001", "10"],
+        ["00000000001", "1", "10"],
+        ["00000000001", "1", "10", "11"],
+    ]
+
+
+def test_k_hop_many_starts(rx_graph):
+    start_ids = np.concatenate(
+        [rx_graph.node_ids(["1", "missing"]), rx_graph.node_ids(["00000000001"], NDC)]
+    )
+    query_nums, node_ids = rx_graph.k_hop(start_ids, 2, include_start=True)
+    assert np.all(np.diff(query_nums) >= 0)
+    assert keys_by_query(rx_graph, query_nums, node_ids, 3) == [
+        ["1", "10", "11", "2", "20"],
+        [],
+        ["00000000001", "10", "20"],
+    ]
+
+
+@pytest.mark.parametrize(
+    "direction, expected",
+    [(OUT, ["1", "10"]), (IN, ["00000000001"]), (BOTH, ["00000000001", "1", "10"])],
+)
+def test_k_hop_direction(rx_graph, direction, expected):
+    query_nums, node_ids = rx_graph.k_hop(
+        rx_graph.node_ids(["20"]), 2, direction=direction
+    )
+    assert keys_by_query(rx_graph, query_nums, node_ids, 1) == [expected]
+
+
+def test_k_hop_rela_types(rx_graph):
+    query_nums, node_ids = rx_graph.k_hop(
+        rx_graph.node_ids(["10"]), 3, rela_types=["has_ingredient"]
+    )
+    assert keys_by_query(rx_graph, query_nums, node_ids, 1) == [["1", "11", "2"]]
+
+
+def test_k_hop_after_save_and_load(tmp_path, rx_graph):
+    loaded = CSRGraph.load(rx_graph.save(tmp_path / "rxgraph"))
+    start_ids = loaded.node_ids(["00000000001"], NDC)
+    for k in range(4):
+        for built, mapped in zip(
+            rx_graph.k_hop(start_ids, k), loaded.k_hop(start_ids, k)
+        ):
+            np.testing.assert_array_equal(built, mapped)
@@ -0,0 +1,146 @@
+import json
+
+import pandas as pd
+import pytest
+
+from rxnorm import delta, neo4j_import
+
+NODE_COLUMNS = {"rxcui": "rxcui:ID(RXCUI)", "str": "str"}
+REL_COLUMNS = {"start": "rxcui:START_ID(RXCUI)", "end": "rxcui:END_ID(RXCUI)"}
+
+
+def write_build(import_dir, scd, sbd, rels, version, rows_per_part=None):
+    """Writes a small build of SCD and SBD nodes, has_tradename relationships and BUILD"""
+    manifest = neo4j_import.ImportManifest(import_dir)
+    for tty, nodes in (("SCD", scd), ("SBD", sbd)):
+        written = neo4j_import.write_import_csv(
+            pd.DataFrame(nodes, columns=list(NODE_COLUMNS)),
+            import_dir / f"rxcui_{tty}_nodes.csv",
+            NODE_COLUMNS,
+            {":LABEL": f"RXCUI;{tty}"},
+            rows_per_part=rows_per_part,
+        )
+        manifest.add(
+            neo4j_import.NODES, written, list(NODE_COLUMNS.values()), ["RXCUI", tty]
+        )
+    written = neo4j_import.write_import_csv(
+        pd.DataFrame(rels, columns=list(REL_COLUMNS)),
+        import_dir / "rel_has_tradename.csv",
+        REL_COLUMNS,
+        {":TYPE": "has_tradename"},
+    )
+    manifest.add(
+        neo4j_import.RELATIONSHIPS,
+        written,
+        list(REL_COLUMNS.values()),
+        rela_type="has_tradename",
+    )
+    build_columns = {"name": "name:ID(BUILD)", "version": "version"}
+    written = neo4j_import.write_import_csv(
+        pd.DataFrame({"name": ["rxnorm"], "version": [version]}),
+        import_dir / f"{neo4j_import.BUILD_INFO_NAME}.csv",
+        build_columns,
+        {":LABEL": neo4j_import.BUILD_LABEL},
+    )
+    manifest.add(
+        neo4j_import.NODES,
+        written,
+        list(build_columns.values()),
+        [neo4j_import.BUILD_LABEL],
+    )
+    return manifest.write()
+
+
+@pytest.fixture(params=[None, 2], ids=["inline", "parts"])
+def builds(tmp_path, request):
+    # 2 moves from the SCD to the SBD file, 3 is renamed, 4 and its relationship are
+    # retired and 5 is added
+    previous = write_build(
+        tmp_path / "previous",
+        scd=[("1", "a"), ("2", "b"), ("3", "c"), ("4", "d")],
+        sbd=[("10", "x")],
+        rels=[("1", "10"), ("2", "10"), ("4", "10")],
+        version="v1",
+        rows_per_part=request.param,
+    )
+    current = write_build(
+        tmp_path / "current",
+        scd=[("1", "a"), ("3", "c2"), ("5", "e")],
+        sbd=[("10", "x"), ("2", "b")],
+        rels=[("1", "10"), ("2", "10"), ("5", "10")],
+        version="v2",
+        rows_per_part=request.param,
+    )
+    return previous, current
+
+
+def entry_rows(delta_manifest_path):
+    delta_manifest = json.loads(delta_manifest_path.read_text())
+    return {
+        entry["name"]: {
+            change: entry[change]["rows"]
+            for change in (delta.ADDED, delta.CHANGED, delta.RETIRED, delta.MOVED)
+            if change in entry
+        }
+        for entry in delta_manifest["entries"]
+    }
+
+
+def test_write_delta_counts(builds):
+    delta_manifest_path = delta.write_delta(*builds)
+    assert entry_rows(delta_manifest_path) == {
+        "rxcui_SCD_nodes": {"added": 1, "changed": 1, "retired": 1, "moved": 1},
+        "rxcui_SBD_nodes": {"added": 1, "changed": 0, "retired": 0, "moved": 0},
+        "rel_has_tradename": {"added": 1, "changed": 0, "retired": 1},
+        neo4j_import.BUILD_INFO_NAME: {
+            "added": 0,
+            "changed": 1,
+            "retired": 0,
+            "moved": 0,
+        },
+    }
+
+
+def test_moved_node_loses_old_label_and_isnt_deleted(builds):
+    queries = list(delta.delta_queries(delta.write_delta(*builds)))
+
+    removes = [(query, rows) for query, rows in queries if " REMOVE " in query]
+    assert len(removes) == 1
+    query, rows = removes[0]
+    assert query.endswith("REMOVE n:`SCD`")
+    assert rows == [{"id": "2"}]
+
+    deletes = [rows for query, rows in queries if "DETACH DELETE" in query]
+    assert deletes == [[{"id": "4"}]]
+
+    upserts = {
+        row["id"]: query
+        for query, rows in queries
+        if "MERGE (n" in query
+        for row in rows
+    }
+    assert upserts["2"].endswith("SET n:`RXCUI`:`SBD`")
+    assert upserts["3"].endswith("SET n:`RXCUI`:`SCD`")
+    assert upserts["5"].endswith("SET n:`RXCUI`:`SCD`")
+
+
+def test_delta_queries_order(builds):
+    queries = [query for query, _ in delta.delta_queries(delta.write_delta(*builds))]
+
+    def first(text):
+        return next(num for num, query in enumerate(queries) if text in query)
+
+    # Nodes are upserted and moved before relationships reference them, relationships
+    # are deleted before the nodes they hang off and BUILD comes last
+    assert first("MERGE (n:`RXCUI`") < first(" REMOVE ") < first("MERGE (a)-")
+    assert first("MERGE (a)-") < first("DELETE r") < first("DETACH DELETE")
+    assert "MERGE (n:`BUILD`" in queries[-1]
+    assert sum("`BUILD`" in query for query in queries) == 1
+
+
+def test_partial_delta_retires_nothing(builds):
+    delta_manifest_path = delta.write_delta(*builds, partial=True)
+    queries = list(delta.delta_queries(delta_manifest_path))
+    assert not any("DELETE" in query for query, _ in queries)
+    # A node that moved files in an update still loses its old label
+    assert any(" REMOVE " in query for query, _ in queries)
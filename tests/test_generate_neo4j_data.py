@@ -0,0 +1,102 @@
+import pandas as pd
+import pytest
+
+import generate_neo4j_data
+from rxnorm import joins
+
+
+def merge_generic_meds(scd, tradename_map, concept_brands):
+    """process_generic_meds as it was with pandas merges, to compare against"""
+    generic_meds = (
+        scd.rename(columns={"str": "generic"})
+        .merge(tradename_map, left_on="rxcui", right_on="rxcui2", how="left")
+        .merge(
+            concept_brands,
+            left_on="rxcui1",
+            right_on="rxcui",
+            how="left",
+            suffixes=("", "_BN"),
+        )
+    )
+    noname = generic_meds["brand"].isna()
+    generic_meds.loc[noname, "brand"] = generic_meds.loc[noname, "generic"]
+    generic_dedupe = generic_meds.drop_duplicates(subset=["rxcui", "rxcui_BN"]).copy()
+    generic_dupes = generic_dedupe.duplicated(subset="rxcui")
+    generic_dedupe.loc[generic_dupes, "rxcui"] = generic_dedupe.loc[
+        generic_dupes, "rxcui_BN"
+    ]
+    return generic_dedupe
+
+
+@pytest.fixture
+def conso():
+    return pd.DataFrame(
+        {
+            "rxcui": ["1", "1", "2", "3", "4", "10", "11", "12", "12"],
+            "str": [
+                "aspirin 81 MG",
+                "aspirin 81 MG oral",
+                "ibuprofen 200 MG",
+                "aspirin",
+                "naproxen 220 MG",
+                "Bayer",
+                "Advil",
+                "Motrin",
+                "Motrin IB",
+            ],
+            "tty": ["SCD", "SCD", "SCD", "IN", "SCD", "BN", "BN", "BN", "BN"],
+        }
+    )
+
+
+@pytest.fixture
+def tradename_map():
+    # 1 has one tradename listed twice, 2 has two, 4 has none and 3 one without a name
+    return pd.DataFrame(
+        {
+            "rxcui1": ["10", "10", "11", "12", "99"],
+            "rxaui1": ["a10", "a10b", "a11", "a12", "a99"],
+            "rxcui2": ["1", "1", "2", "2", "3"],
+            "rxaui2": ["a1", "a1", "a2", "a2b", "a3"],
+            ":TYPE": ["has_tradename"] * 5,
+        }
+    )
+
+
+def test_process_generic_meds_matches_merge(conso, tradename_map):
+    scd = conso[conso["tty"].isin(["SCD", "IN"])]
+    concept_brands = conso.rename(columns={"str": "brand"})[
+        ["rxcui", "brand"]
+    ].drop_duplicates(subset="rxcui")
+    expected = merge_generic_meds(scd, tradename_map, concept_brands)
+
+    brands = joins.RxcuiLookup(
+        joins.RxcuiKeys(conso["rxcui"]), conso["rxcui"], conso["str"]
+    )
+    generic_meds = generate_neo4j_data.process_generic_meds(scd, tradename_map, brands)
+
+    pd.testing.assert_frame_equal(
+        generic_meds.reset_index(drop=True).astype(object),
+        expected.reset_index(drop=True).astype(object),
+    )
+
+
+def test_partition_relationship_maps():
+    rel = pd.DataFrame(
+        {
+            "rxcui1": ["10", "11", "12", "13"],
+            "rxaui1": ["a10", "a11", "a12", "a13"],
+            "rxcui2": ["1", "2", "3", "4"],
+            "rxaui2": ["a1", "a2", "a3", "a4"],
+            "rela": ["has_tradename", "consists_of", "has_tradename", "isa"],
+            "sab": ["RXNORM"] * 4,
+        }
+    )
+    rel_maps = generate_neo4j_data.partition_relationship_maps(
+        rel, ["has_tradename", "consists_of", "contains"]
+    )
+    assert list(rel_maps) == ["has_tradename", "consists_of", "contains"]
+    for rela_type, rel_map in rel_maps.items():
+        expected = rel[rel["rela"] == rela_type][generate_neo4j_data.REL_MAP_COLUMNS]
+        expected = expected.rename(columns={"rela": ":TYPE"})
+        pd.testing.assert_frame_equal(rel_map, expected)
@@ -0,0 +1,112 @@
+import json
+from collections import Counter
+
+import pandas as pd
+import pytest
+
+from rxnorm.benchmark import fake_neo4j, load_test
+
+
+@pytest.fixture
+def ndcs():
+    return pd.DataFrame(
+        {
+            "ndc": ["00000000001", "00000000002", "00000000003"],
+            "rxcui": ["1", "2", "3"],
+            "brand": ["Advil Liqui-Gels", "Motrin IB", None],
+        }
+    )
+
+
+@pytest.fixture
+def graph(ndcs):
+    ingredients = pd.DataFrame(
+        {
+            "ndc": ["00000000001", "00000000002"],
+            "rxcui": ["10", "10"],
+            "brand": ["Ibuprofen", "Ibuprofen"],
+        }
+    )
+    return fake_neo4j.FakeGraph(ndcs, ingredients, version="2023-01-02")
+
+
+def test_parse_mix():
+    assert load_test.parse_mix("search=0.6, ingredients=0.4") == {
+        "search": 0.6,
+        "ingredients": 0.4,
+    }
+    for mix in ["search=1,lookup=1", "search=lots", "search=0", "search=-1,graph=2"]:
+        with pytest.raises(ValueError):
+            load_test.parse_mix(mix)
+
+
+def test_load_ndcs_from_csv(tmp_path):
+    csv_path = tmp_path / "ndc_nodes.csv"
+    csv_path.write_text("ndc:ID(NDC),rxcui\n00000000001,1\n,2\n")
+    ndcs = load_test.load_ndcs(csv_path)
+    assert ndcs["ndc"].tolist() == ["00000000001"]
+    assert ndcs["brand"].isna().all()
+
+    csv_path.write_text("ndc:ID(NDC),rxcui\n")
+    with pytest.raises(ValueError):
+        load_test.load_ndcs(csv_path)
+
+
+def test_query_mix_is_seeded_and_weighted(ndcs):
+    mix = {"search": 3, "ingredients": 1, "resolve_batch": 0}
+    queries = [load_test.QueryMix(ndcs, mix, seed=1) for _ in range(2)]
+    first, again = ([query_mix.next() for _ in range(400)] for query_mix in queries)
+    assert first == again
+
+    routes = Counter(route for route, _, _, _ in first)
+    assert set(routes) == {"search", "ingredients"}
+    assert 250 < routes["search"] < 350
+
+    route, method, path, body = load_test.QueryMix(ndcs, {"resolve_batch": 1}).next()
+    assert (route, method, path) == ("resolve_batch", "POST", "/resolve/batch")
+    assert len(json.loads(body)) == load_test.BATCH_NDCS
+
+
+def test_load_test_arguments(ndcs):
+    queries = load_test.QueryMix(ndcs, load_test.DEFAULT_MIX)
+    with pytest.raises(ValueError):
+        load_test.LoadTest("http://127.0.0.1:8088", queries, rps=0)
+    with pytest.raises(ValueError):
+        load_test.LoadTest("127.0.0.1:8088", queries)
+
+
+def test_load_test_against_fake_webapp(graph, ndcs, monkeypatch, tmp_path):
+    monkeypatch.setenv("SEARCH_INDEX_DIR", str(tmp_path / "no_index"))
+    mix = {route: 1 for route in load_test.ROUTES}
+    with load_test.fake_webapp(graph) as base_url:
+        report = load_test.LoadTest(
+            base_url,
+            load_test.QueryMix(ndcs, mix),
+            rps=100,
+            duration=0.5,
+            warmup=0.1,
+            connections=4,
+        ).run()
+
+    assert report["all"]["requests"] == 50
+    assert report["all"]["errors"] == 0, report["error_samples"]
+    assert set(report["routes"]) <= set(load_test.ROUTES)
+    assert sum(summary["requests"] for summary in report["routes"].values()) == 50
+    assert report["all"]["p99_ms"] >= report["all"]["p50_ms"] > 0
+    table = load_test.format_report(report)
+    assert table.splitlines()[-1].startswith("all")
+
+
+def test_errors_counted_per_route(ndcs):
+    # Nothing listens on the port, so every request fails to connect
+    report = load_test.LoadTest(
+        "http://127.0.0.1:9",
+        load_test.QueryMix(ndcs, {"ingredients": 1}),
+        rps=50,
+        duration=0.1,
+        warmup=0,
+        timeout=1,
+    ).run()
+    assert report["routes"]["ingredients"]["errors"] == 5
+    assert report["all"]["error_rate"] == 1.0
+    assert report["error_samples"]
@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+
+from rxnorm import ndc
+
+RAW_NDCS = [
+    "12345678901",
+    "1234-5678-91",
+    "12345-678-91",
+    "12345-6789-1",
+    "12345-6789-01",
+    "012345-6789-01",
+    "112345-6789-01",
+    "123-456-78",
+    "1234-567-89",
+    "1234567890",
+    "123456789012",
+    "12345-6789",
+    "1-2-3-4",
+    "(12345) 6789*01",
+    "1234a-5678-91",
+    "",
+    "--",
+]
+
+
+def test_normalize_ndcs_matches_scalar():
+    normalized = ndc.normalize_ndcs(pd.Series(RAW_NDCS))
+    assert normalized["ndc"].tolist() == [
+        ndc.standardize_ndc_11(raw) for raw in RAW_NDCS
+    ]
+    assert normalized["ndc_valid"].tolist() == [
+        ndc.is_valid_ndc(raw) for raw in RAW_NDCS
+    ]
+
+
+def test_normalize_ndcs_keeps_index_and_missing():
+    raw = pd.Series(["1234-5678-91", None], index=[10, 20])
+    normalized = ndc.normalize_ndcs(raw)
+    assert normalized.index.tolist() == [10, 20]
+    assert normalized.loc[10, "ndc"] == "01234567891"
+    assert pd.isna(normalized.loc[20, "ndc"])
+    assert not normalized.loc[20, "ndc_valid"]
+
+
+@pytest.mark.parametrize(
+    "raw, expected",
+    [
+        ("1234-5678-91", "01234567891"),
+        ("12345-678-91", "12345067891"),
+        ("12345-6789-1", "12345678901"),
+    ],
+)
+def test_standardize_ndc_11_pads_short_segment(raw, expected):
+    assert ndc.standardize_ndc_11(raw) == expected
+    assert ndc.is_valid_ndc(raw)
@@ -0,0 +1,105 @@
+import time
+
+import pandas as pd
+import pytest
+
+from rxnorm import neo4j_import
+
+COLUMNS = {"ndc": "ndc:ID(NDC)", "brand": "brand"}
+CONSTANTS = {":LABEL": "NDC"}
+
+
+@pytest.fixture
+def ndc_nodes():
+    return pd.DataFrame(
+        {
+            "ndc": [f"{num:011d}" for num in range(25)],
+            "brand": [f"Brand, {num}" for num in range(25)],
+        }
+    )
+
+
+def read_back(import_dir, entry):
+    if entry["header"]:
+        names = pd.read_csv(import_dir / entry["header"], sep=",").columns.tolist()
+        parts = [
+            pd.read_csv(import_dir / file_info["path"], header=None, names=names)
+            for file_info in entry["files"]
+        ]
+        return pd.concat(parts, ignore_index=True)
+    return pd.read_csv(import_dir / entry["files"][0]["path"])
+
+
+@pytest.mark.parametrize(
+    "rows_per_part, compress", [(None, False), (None, True), (10, False), (10, True)]
+)
+def test_write_and_verify_round_trip(tmp_path, ndc_nodes, rows_per_part, compress):
+    manifest = neo4j_import.ImportManifest(tmp_path)
+    written = neo4j_import.write_import_csv(
+        ndc_nodes,
+        tmp_path / "ndc_nodes.csv",
+        columns=COLUMNS,
+        constants=CONSTANTS,
+        rows_per_part=rows_per_part,
+        compress=compress,
+        workers=2,
+    )
+    manifest.add(neo4j_import.NODES, written, list(COLUMNS.values()), ["NDC"])
+    manifest_path = manifest.write()
+
+    assert written.rows == len(ndc_nodes)
+    assert sum(written.part_rows) == len(ndc_nodes)
+    assert len(written.parts) == (3 if rows_per_part else 1)
+
+    loaded = neo4j_import.ImportManifest.load(manifest_path)
+    assert loaded.verify() == []
+    assert loaded.build_version() == manifest.build_version()
+
+    entry = loaded.entries[0]
+    assert entry["id_spaces"] == {"ID": "NDC"}
+    data = read_back(tmp_path, entry)
+    assert data.columns.tolist() == ["ndc:ID(NDC)", "brand", ":LABEL"]
+    assert (
+        data["ndc:ID(NDC)"].map("{:011d}".format).tolist() == ndc_nodes["ndc"].tolist()
+    )
+    assert data["brand"].tolist() == ndc_nodes["brand"].tolist()
+    assert (data[":LABEL"] == "NDC").all()
+
+
+def test_verify_reports_changed_missing_and_unlisted_files(tmp_path, ndc_nodes):
+    manifest = neo4j_import.ImportManifest(tmp_path)
+    written = neo4j_import.write_import_csv(
+        ndc_nodes, tmp_path / "ndc_nodes.csv", COLUMNS, CONSTANTS, rows_per_part=10
+    )
+    manifest.add(neo4j_import.NODES, written, list(COLUMNS.values()), ["NDC"])
+    loaded = neo4j_import.ImportManifest.load(manifest.write())
+
+    with open(written.parts[0], "a") as part:
+        part.write("00000000099,Extra,NDC\n")
+    written.parts[1].unlink()
+    (tmp_path / "stray_nodes.csv").write_text("id:ID\n1\n")
+
+    problems = loaded.verify()
+    assert problems == [
+        f"Checksum mismatch for {written.parts[0]}",
+        f"Missing {written.parts[1]}",
+        f"{tmp_path / 'stray_nodes.csv'} isn't in the manifest",
+    ]
+
+
+@pytest.mark.parametrize("rows_per_part", [None, 10])
+def test_same_frame_same_checksums(tmp_path, monkeypatch, ndc_nodes, rows_per_part):
+    checksums = []
+    for run, clock in (("first", 1_600_000_000.0), ("second", 1_700_000_000.0)):
+        # gzip would put the time in each member's header
+        monkeypatch.setattr(time, "time", lambda: clock)
+        written = neo4j_import.write_import_csv(
+            ndc_nodes,
+            tmp_path / run / "ndc_nodes.csv",
+            COLUMNS,
+            CONSTANTS,
+            rows_per_part=rows_per_part,
+            compress=True,
+        )
+        checksums.append(written.checksums)
+    assert checksums[0] == checksums[1]
@@ -0,0 +1,135 @@
+import re
+import threading
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import neo4j
+from rxnorm import parallel_load
+
+
+class FakeResult:
+    def __init__(self, written: int):
+        self.written = written
+
+    def single(self):
+        return {"written": self.written}
+
+
+class FakeTransaction:
+    def __init__(self, driver):
+        self.driver = driver
+        self.pending = []
+
+    def run(self, query, rows):
+        rela_type = re.search(r"\[r:`?(\w+)`?\]", query).group(1)
+        with self.driver.lock:
+            deadlock = self.driver.deadlocks > 0
+            self.driver.deadlocks -= deadlock
+        if deadlock:
+            raise neo4j.exceptions.TransientError("deadlock")
+        matched = [
+            row for row in rows if self.driver.nodes >= {row["start"], row["end"]}
+        ]
+        self.pending = [(row["start"], rela_type, row["end"]) for row in matched]
+        return FakeResult(len(matched))
+
+    def commit(self):
+        with self.driver.lock:
+            self.driver.written.extend(self.pending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class FakeSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def begin_transaction(self):
+        return FakeTransaction(self.driver)
+
+    def close(self):
+        pass
+
+
+class FakeDriver:
+    def __init__(self, nodes, deadlocks=0):
+        self.nodes = set(nodes)
+        self.deadlocks = deadlocks
+        self.written = []
+        self.lock = threading.Lock()
+
+    def session(self, database=None):
+        return FakeSession(self)
+
+
+def relationships():
+    return pd.DataFrame(
+        {
+            "rxcui2": ["1", "1", "2", "3", "4", "5", "6", "6"],
+            "rxcui1": ["10", "11", "10", "10", "11", "10", "11", "10"],
+            "rela": ["tradename_of", "has_form", "tradename_of", "has_form"] * 2,
+        }
+    )
+
+
+def neo_rrf(driver):
+    return SimpleNamespace(driver=driver, database="neo4j", batch_size=2)
+
+
+def test_partitions_are_disjoint_start_ranges_across_types():
+    partitions = parallel_load.partition_relationships(relationships(), ranges=3)
+    assert len(partitions) == 3
+    assert sum(len(rows) for rows in partitions) == len(relationships())
+    start_ids = [set(rows["rxcui2"]) for rows in partitions]
+    for i, ids in enumerate(start_ids):
+        for other in start_ids[i + 1 :]:
+            assert not ids & other
+    # Ranges hold rows of several types
+    assert any(rows["rela"].nunique() > 1 for rows in partitions)
+
+
+def test_partitions_no_more_than_start_nodes():
+    rel = relationships()
+    rel["rxcui2"] = "1"
+    assert len(parallel_load.partition_relationships(rel, ranges=4)) == 1
+    assert parallel_load.partition_relationships(rel.iloc[:0]) == []
+
+
+def test_load_writes_every_relationship():
+    driver = FakeDriver([str(rxcui) for rxcui in range(20)], deadlocks=2)
+    report = parallel_load.load_relationships_parallel(
+        neo_rrf(driver), relationships(), workers=3
+    )
+    expected = {
+        (start, rela, end)
+        for start, end, rela in relationships().itertuples(index=False)
+    }
+    assert set(driver.written) == expected
+    assert sum(stats.rows for stats in report) == len(expected)
+    assert sum(stats.retries for stats in report) == 2
+    assert sum(stats.skipped for stats in report) == 0
+
+
+def test_unmatched_nodes_fail_when_strict():
+    driver = FakeDriver(["1", "2", "3", "4", "5", "6", "10"])
+    with pytest.raises(ValueError, match="matched no nodes"):
+        parallel_load.load_relationships_parallel(
+            neo_rrf(driver), relationships(), workers=2
+        )
+
+
+def test_unmatched_nodes_skipped_when_not_strict():
+    driver = FakeDriver(["1", "2", "3", "4", "5", "6", "10"])
+    report = parallel_load.load_relationships_parallel(
+        neo_rrf(driver), relationships(), workers=2, strict=False
+    )
+    assert sum(stats.skipped for stats in report) == 3
+    assert sum(stats.rows for stats in report) == len(relationships())
+    assert all(end == "10" for _, _, end in driver.written)
+    assert len(driver.written) == 5
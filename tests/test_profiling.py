@@ -0,0 +1,81 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from rxnorm import profiling
+
+
+def test_stage_without_profiler_measures_nothing():
+    assert profiling.active() is None
+    with profiling.stage("load", rows_in=5) as run_stage:
+        run_stage.rows_out = 3
+    assert run_stage.seconds is None
+    assert profiling.in_stage(print) is print
+
+
+def test_stages_nest_and_are_timed():
+    with profiling.RunProfiler(sample_interval=0.01) as profiler:
+        assert profiling.active() is profiler
+        with profiling.stage("ndc", rows_in=10) as ndc_stage:
+            with profiling.stage("save") as save_stage:
+                save_stage.rows_out = 7
+            ndc_stage.rows_out = 8
+    assert profiling.active() is None
+
+    report = profiler.report()
+    stages = {run_stage["name"]: run_stage for run_stage in report["stages"]}
+    assert stages["ndc"]["parent"] is None
+    assert stages["save"]["parent"] == "ndc"
+    assert (stages["ndc"]["rows_in"], stages["ndc"]["rows_out"]) == (10, 8)
+    assert stages["save"]["rows_out"] == 7
+    assert stages["ndc"]["seconds"] >= stages["save"]["seconds"] >= 0
+    assert stages["ndc"]["rss_peak_mb"] >= stages["ndc"]["rss_start_mb"] > 0
+    assert report["seconds"] >= stages["ndc"]["seconds"]
+
+
+def test_worker_threads_nest_under_the_caller():
+    def work(name):
+        with profiling.stage(name):
+            pass
+
+    with profiling.RunProfiler() as profiler:
+        with profiling.stage("write"):
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                list(pool.map(profiling.in_stage(work), ["a", "b"]))
+        # The pool threads don't keep the nesting once the wrapped call returns
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pool.submit(work, "c").result()
+
+    parents = {run_stage.name: run_stage.parent for run_stage in profiler.stages}
+    assert parents == {"write": None, "a": "write", "b": "write", "c": None}
+
+
+def test_peak_includes_memory_freed_before_the_stage_ends():
+    profiler = profiling.RunProfiler()
+    with profiler.stage("spike") as run_stage:
+        profiler._update_peaks(run_stage.rss_start + 100 * 1024 * 1024)
+    assert run_stage.rss_peak >= run_stage.rss_start + 100 * 1024 * 1024
+
+
+@pytest.mark.parametrize("mode", profiling.PROFILE_MODES)
+def test_report_with_profile(mode, tmp_path):
+    with profiling.RunProfiler(profile=mode) as profiler:
+        with profiling.stage("build"):
+            blocks = [bytearray(1024) for _ in range(1000)]
+    assert blocks
+
+    report_path = profiler.write_report(tmp_path)
+    report = json.loads(report_path.read_text())
+    assert report["profile"] == mode
+    if mode == profiling.CPROFILE:
+        assert report["functions"]
+        assert (tmp_path / profiling.PROFILE_FILE).exists()
+    else:
+        assert report["allocations"]
+        assert report["stages"][0]["traced_peak_mb"] > 0
+
+
+def test_unknown_profile_mode():
+    with pytest.raises(ValueError):
+        profiling.RunProfiler(profile="perf")
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from rxnorm import queries
+
+
+def test_driver_config_from_env(monkeypatch):
+    assert queries.driver_config()["max_connection_pool_size"] == 100
+    monkeypatch.setenv("NEO4J_MAX_POOL_SIZE", "8")
+    monkeypatch.setenv("NEO4J_ACQUISITION_TIMEOUT", "2.5")
+    config = queries.driver_config()
+    assert config["max_connection_pool_size"] == 8
+    assert config["connection_acquisition_timeout"] == 2.5
+
+
+def test_graph_params():
+    assert queries.graph_params({}) == {
+        "limit": queries.DEFAULT_GRAPH_LIMIT,
+        "after": "",
+        "format": "json",
+    }
+    params = queries.graph_params({"limit": "50000", "after": "1", "format": "ndjson"})
+    assert params == {
+        "limit": queries.MAX_GRAPH_LIMIT,
+        "after": "1",
+        "format": "ndjson",
+    }
+    for args in [{"limit": "0"}, {"limit": "-5"}, {"limit": "ten"}, {"format": "xml"}]:
+        with pytest.raises(ValueError):
+            queries.graph_params(args)
+
+
+def graph_records():
+    ibuprofen = {"rxcui": "10", "brand": "Ibuprofen"}
+    famotidine = {"rxcui": "11", "brand": "Famotidine"}
+    return [
+        {"ndc": "1", "brand": "Advil", "rxcui": "1", "ingredients": [ibuprofen]},
+        {
+            "ndc": "2",
+            "brand": "Duexis",
+            "rxcui": "2",
+            "ingredients": [ibuprofen, famotidine],
+        },
+    ]
+
+
+def write_graph(writer, records):
+    return writer.start() + "".join(map(writer.add, records)) + writer.end()
+
+
+def test_graph_writer_interns_ingredients():
+    graph = json.loads(write_graph(queries.GraphWriter(2), graph_records()))
+    assert [node.get("ndc", node["name"]) for node in graph["nodes"]] == [
+        "1",
+        "Ibuprofen",
+        "2",
+        "Famotidine",
+    ]
+    assert graph["nodes"][2]["icount"] == 2
+    assert graph["links"] == [
+        {"source": 1, "target": 0},
+        {"source": 1, "target": 2},
+        {"source": 3, "target": 2},
+    ]
+    # A full page has a cursor for the next one
+    assert graph["next"] == "2"
+    assert (
+        json.loads(write_graph(queries.GraphWriter(3), graph_records()))["next"] is None
+    )
+
+
+def test_graph_writer_ndjson_matches_json():
+    graph = json.loads(write_graph(queries.GraphWriter(2), graph_records()))
+    lines = write_graph(queries.GraphWriter(2, ndjson=True), graph_records())
+    items = [json.loads(line) for line in lines.splitlines()]
+    assert [item["node"] for item in items if "node" in item] == graph["nodes"]
+    assert [item["link"] for item in items if "link" in item] == graph["links"]
+    assert items[-1] == {"next": "2"}
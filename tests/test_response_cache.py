@@ -0,0 +1,105 @@
+import pytest
+
+from rxnorm import response_cache
+from rxnorm.response_cache import LocalBackend, ResponseCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, "monotonic", clock)
+    return clock
+
+
+def test_local_backend_evicts_least_recently_used(clock):
+    backend = LocalBackend(max_entries=2)
+    backend.set("a", b"1")
+    backend.set("b", b"2")
+    assert backend.get("a") == b"1"
+    backend.set("c", b"3")
+    assert backend.get("b") is None
+    assert backend.get("a") == b"1"
+    assert backend.get("c") == b"3"
+    assert len(backend) == 2
+
+
+def test_local_backend_expires_entries(clock):
+    backend = LocalBackend(ttl=10)
+    backend.set("a", b"1")
+    clock.now += 9
+    assert backend.get("a") == b"1"
+    clock.now += 2
+    assert backend.get("a") is None
+    assert len(backend) == 0
+
+
+def test_nothing_cached_until_version_known(clock):
+    cache = ResponseCache(LocalBackend())
+    cache.set("ingredients", {"ndc": "1"}, b"body")
+    assert cache.get("ingredients", {"ndc": "1"}) is None
+    assert len(cache.backend) == 0
+
+
+def test_entries_keyed_on_version_route_and_params(clock):
+    cache = ResponseCache(LocalBackend())
+    cache.set_version("2023-01-02")
+    cache.set("graph", {"limit": 10, "after": ""}, b"page")
+    assert cache.get("graph", {"after": "", "limit": 10}) == b"page"
+    assert cache.get("graph", {"after": "", "limit": 11}) is None
+    assert cache.get("search", {"after": "", "limit": 10}) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    cache.set_version("2023-01-02")
+    assert cache.get("graph", {"limit": 10, "after": ""}) == b"page"
+    cache.set_version("2023-02-06")
+    assert cache.get("graph", {"limit": 10, "after": ""}) is None
+    assert len(cache.backend) == 0
+
+
+class SharedBackend(LocalBackend):
+    """Like RedisBackend, entries aren't dropped when the version changes"""
+
+    def clear(self):
+        pass
+
+
+def test_old_versions_not_served_from_shared_backend(clock):
+    cache = ResponseCache(SharedBackend())
+    cache.set_version("2023-01-02")
+    cache.set("search", {"q": "1"}, b"old")
+    cache.set_version("2023-02-06")
+    assert cache.get("search", {"q": "1"}) is None
+    cache.set("search", {"q": "1"}, b"new")
+    assert len(cache.backend) == 2
+    assert cache.get("search", {"q": "1"}) == b"new"
+
+
+def test_version_checked_every_interval(clock):
+    cache = ResponseCache(LocalBackend(), version_check_interval=30)
+    assert cache.version_due()
+    cache.set_version("2023-01-02")
+    assert not cache.version_due()
+    clock.now += 30
+    assert cache.version_due()
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("RESPONSE_CACHE_SIZE", "5")
+    monkeypatch.setenv("RESPONSE_CACHE_TTL", "60")
+    cache = ResponseCache.from_env()
+    assert cache.backend.max_entries == 5
+    assert cache.backend.ttl == 60
+
+    monkeypatch.setenv("RESPONSE_CACHE_SIZE", "0")
+    cache = ResponseCache.from_env()
+    assert not cache.enabled
+    assert not cache.version_due()
+    assert cache.get("search", {"q": "1"}) is None
@@ -0,0 +1,60 @@
+import pytest
+
+from rxnorm import rrf
+
+
+def rrf_line(headers, **values):
+    # RRF lines end with a delimiter too
+    return "|".join(values.get(header, "") for header in headers) + "|"
+
+
+REL_ROWS = [
+    rrf_line(
+        rrf.REL_HEADERS,
+        rxcui1=rxcui1,
+        rel="RO",
+        rxcui2=rxcui2,
+        rela=rela,
+        sab="RXNORM",
+        suppress="N",
+    )
+    for rxcui1, rxcui2, rela in [
+        ("1", "10", "has_tradename"),
+        ("2", "11", "consists_of"),
+        ("3", "12", "has_tradename"),
+    ]
+]
+
+
+@pytest.fixture
+def rel_path(tmp_path):
+    rel_path = tmp_path / "RXNREL.RRF"
+    rel_path.write_text("\n".join(REL_ROWS) + "\n")
+    return rel_path
+
+
+def test_read_rrf_drops_empty_columns(rel_path):
+    rel = rrf.read_rrf(rel_path)
+    assert rel.columns.tolist() == [
+        "rxcui1",
+        "rel",
+        "rxcui2",
+        "rela",
+        "sab",
+        "suppress",
+    ]
+
+
+def test_filtered_read_drops_the_same_columns(rel_path):
+    rel = rrf.read_rrf(rel_path, filters={"rela": "has_tradename"})
+    assert rel.columns.tolist() == rrf.read_rrf(rel_path).columns.tolist()
+    assert rel["rxcui2"].tolist() == [10, 12]
+
+
+def test_requested_columns_are_kept_when_empty(rel_path):
+    columns = ["rxcui1", "rxaui1", "rxcui2", "rxaui2", "rela"]
+    rel = rrf.read_rrf(rel_path, columns=columns)
+    assert rel.columns.tolist() == columns
+    assert rel["rxaui1"].isna().all()
+    filtered = rrf.read_rrf(rel_path, columns=columns, filters={"sab": "RXNORM"})
+    assert filtered.columns.tolist() == columns
@@ -0,0 +1,90 @@
+import logging
+
+import pytest
+
+import neo4j
+from rxnorm import schema
+
+
+class FakeSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def run(self, query, **params):
+        self.driver.queries.append(query)
+        if self.driver.error is not None:
+            raise self.driver.error
+        if query.startswith("SHOW INDEXES"):
+            return [
+                {"name": name, "state": state}
+                for name, state in self.driver.states.items()
+            ]
+        return self
+
+    def consume(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class FakeDriver:
+    def __init__(self, states=None, error=None):
+        self.states = states or {}
+        self.error = error
+        self.queries = []
+
+    def session(self, database=None):
+        return FakeSession(self)
+
+
+def online():
+    return {name: "ONLINE" for name in schema.expected_indexes()}
+
+
+def test_schema_queries_are_idempotent_and_cover_expected_indexes():
+    queries = schema.schema_queries()
+    assert all("IF NOT EXISTS" in query for query in queries)
+    for name in schema.expected_indexes():
+        assert any(name in query for query in queries)
+
+
+def test_bootstrap_creates_unless_check_only():
+    driver = FakeDriver(online())
+    schema.bootstrap(driver)
+    assert sum(query.startswith("CREATE") for query in driver.queries) == len(
+        schema.schema_queries()
+    )
+
+    driver = FakeDriver(online())
+    schema.bootstrap(driver, create=False)
+    assert not any(query.startswith("CREATE") for query in driver.queries)
+
+
+def test_populating_index_times_out():
+    states = {**online(), "ndc_search": "POPULATING"}
+    with pytest.raises(TimeoutError, match="ndc_search"):
+        schema.bootstrap(FakeDriver(states), create=False, timeout=1)
+
+
+def test_missing_index_fails():
+    states = online()
+    del states["ndc_ndc_text"]
+    with pytest.raises(ValueError, match="ndc_ndc_text is missing"):
+        schema.bootstrap(FakeDriver(states), create=False)
+
+
+def test_check_ready_logs_instead_of_raising(caplog):
+    assert schema.check_ready(FakeDriver(online()))
+
+    states = online()
+    del states["ndc_search"]
+    with caplog.at_level(logging.ERROR, logger="rxnorm.schema"):
+        assert not schema.check_ready(FakeDriver(states))
+    assert "ndc_search" in caplog.text
+
+    unreachable = FakeDriver(error=neo4j.exceptions.ServiceUnavailable("down"))
+    assert not schema.check_ready(unreachable)
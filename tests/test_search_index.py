@@ -0,0 +1,84 @@
+import pandas as pd
+import pytest
+
+from rxnorm.search_index import SearchIndex
+
+
+@pytest.fixture
+def ndc_data():
+    return pd.DataFrame(
+        {
+            "ndc": [
+                "00904198861",
+                "00573015020",
+                "00573016440",
+                "50580060010",
+                "12345678901",
+            ],
+            "rxcui": ["1", "2", "2", "3", "4"],
+            "brand": [
+                "Bayer Aspirin",
+                "Advil",
+                "Advil",
+                "Tylenol Extra Strength",
+                None,
+            ],
+        }
+    )
+
+
+@pytest.fixture
+def index(ndc_data):
+    generic_names = pd.DataFrame(
+        {
+            "rxcui": ["1", "2", "3"],
+            "generic": [
+                "aspirin 325 MG Oral Tablet",
+                "ibuprofen 200 MG",
+                "acetaminophen",
+            ],
+        }
+    )
+    return SearchIndex.build(ndc_data, generic_names=generic_names)
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        # NDC prefixes, with or without hyphens, in NDC order
+        ("00573", [["00573015020", "Advil"], ["00573016440", "Advil"]]),
+        ("0057-3", [["00573015020", "Advil"], ["00573016440", "Advil"]]),
+        # Partial NDC from the middle, not across two NDCs
+        ("8006", [["50580060010", "Tylenol Extra Strength"]]),
+        ("2000573", []),
+        # Words of the brand, any case, as prefixes
+        ("tyl", [["50580060010", "Tylenol Extra Strength"]]),
+        ("EXTRA str", [["50580060010", "Tylenol Extra Strength"]]),
+        # Words of the generic name
+        ("ibuprofen", [["00573015020", "Advil"], ["00573016440", "Advil"]]),
+        ("aspirin oral", [["00904198861", "Bayer Aspirin"]]),
+        # The last word must be whole once it's followed by a space
+        ("asp ", []),
+        ("aspirin ", [["00904198861", "Bayer Aspirin"]]),
+        # NDCs without a brand aren't searchable
+        ("12345", []),
+        ("nothing", []),
+        ("--", []),
+    ],
+)
+def test_search(index, query, expected):
+    assert index.search(query) == expected
+
+
+def test_search_limit(index):
+    assert index.search("00", limit=2) == [
+        ["00573015020", "Advil"],
+        ["00573016440", "Advil"],
+    ]
+    assert len(index) == 4
+
+
+def test_search_after_save_and_load(tmp_path, index):
+    loaded = SearchIndex.load(index.save(tmp_path / "search_index"))
+    for query in ["00573", "8006", "advil", "extra str"]:
+        assert loaded.search(query) == index.search(query)
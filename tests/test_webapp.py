@@ -0,0 +1,311 @@
+import asyncio
+import importlib
+import io
+import json
+import sys
+from functools import partial
+
+import pandas as pd
+import pytest
+
+import neo4j
+from rxnorm import queries, schema
+from rxnorm.benchmark import fake_neo4j
+
+
+class IndexingGraph(fake_neo4j.FakeGraph):
+    """FakeGraph whose full-text index is missing until online is set"""
+
+    online = False
+
+    def run(self, query, params):
+        if query.startswith("SHOW INDEXES") and not self.online:
+            return [
+                fake_neo4j.Record({"name": name, "state": "ONLINE"})
+                for name in schema.expected_indexes()
+                if name != "ndc_search"
+            ]
+        return super().run(query, params)
+
+
+class AsyncResult:
+    def __init__(self, records):
+        self.records = records
+
+    async def __aiter__(self):
+        for record in self.records:
+            yield record
+
+
+class AsyncSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def run(self, query, parameters=None, **params):
+        self.driver.in_flight += 1
+        self.driver.most_in_flight = max(
+            self.driver.most_in_flight, self.driver.in_flight
+        )
+        # Lets other requests start, like waiting on the network would
+        await asyncio.sleep(0.001)
+        self.driver.in_flight -= 1
+        return AsyncResult(
+            self.driver.driver.run(query, {**(parameters or {}), **params})
+        )
+
+    async def execute_read(self, work, *args):
+        return await work(self, *args)
+
+
+class AsyncDriver:
+    def __init__(self, driver):
+        self.driver = driver
+
+        self.in_flight = 0
+        self.most_in_flight = 0
+
+    def session(self, **kwargs):
+        return AsyncSession(self)
+
+    async def verify_connectivity(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+def make_graph(graph_class=fake_neo4j.FakeGraph):
+    ndcs = pd.DataFrame(
+        {
+            "ndc": ["00000000001", "00000000002", "00000000003"],
+            "rxcui": ["1", "2", "3"],
+            "brand": ["Advil", "Motrin", None],
+        }
+    )
+    ingredients = pd.DataFrame(
+        {
+            "ndc": ["00000000001", "00000000002", "00000000002"],
+            "rxcui": ["10", "10", "11"],
+            "brand": ["Ibuprofen", "Ibuprofen", "Famotidine"],
+        }
+    )
+    return graph_class(ndcs, ingredients, version="2023-01-02")
+
+
+@pytest.fixture
+def app_env(monkeypatch, tmp_path):
+    monkeypatch.setenv("SEARCH_INDEX_DIR", str(tmp_path / "no_index"))
+    monkeypatch.setenv("RESPONSE_CACHE_SIZE", "100")
+    monkeypatch.setattr(schema, "RECHECK_INTERVAL", 0.01)
+
+
+def load_async_webapp(monkeypatch, driver):
+    """Imports webapp_async.py, its startup connecting to driver"""
+    monkeypatch.setattr(
+        neo4j.AsyncGraphDatabase, "driver", lambda *args, **kwargs: AsyncDriver(driver)
+    )
+    monkeypatch.setattr(neo4j.GraphDatabase, "driver", lambda *args, **kwargs: driver)
+    if "webapp_async" in sys.modules:
+        return importlib.reload(sys.modules["webapp_async"])
+    return fake_neo4j.import_script("webapp_async")
+
+
+def test_lookups_get_503_until_indexes_are_online(app_env):
+    graph = make_graph(IndexingGraph)
+    webapp = fake_neo4j.load_webapp(fake_neo4j.FakeDriver(graph))
+    client = webapp.app.test_client()
+
+    response = client.get("/ingredients/00000000001")
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+    assert client.post("/resolve/batch", json=["00000000001"]).status_code == 503
+    assert client.get("/search?q=0000").status_code == 503
+    # Routes without Neo4j are still served
+    assert client.get("/").status_code == 200
+
+    graph.online = True
+    assert webapp.schema_ready.wait(timeout=5)
+    response = client.get("/ingredients/00000000001")
+    assert response.status_code == 200
+    assert response.get_json() == {"ingredients": [[["Ibuprofen"]]]}
+
+
+def test_async_lookups_get_503_until_indexes_are_online(app_env, monkeypatch):
+    graph = make_graph(IndexingGraph)
+    webapp_async = load_async_webapp(monkeypatch, fake_neo4j.FakeDriver(graph))
+
+    async def requests():
+        async with webapp_async.app.test_app() as test_app:
+            client = test_app.test_client()
+            response = await client.get("/ingredients/00000000001")
+            assert response.status_code == 503
+            assert (await client.get("/")).status_code == 200
+
+            graph.online = True
+            await asyncio.wait_for(webapp_async.schema_watch, timeout=5)
+            response = await client.get("/ingredients/00000000001")
+            assert response.status_code == 200
+
+    asyncio.run(requests())
+
+
+def test_async_routes(app_env, monkeypatch):
+    driver = fake_neo4j.FakeDriver(make_graph())
+    webapp_async = load_async_webapp(monkeypatch, driver)
+    monkeypatch.setattr(webapp_async, "BATCH_CONCURRENCY", 2)
+    # One NDC per query, so the batch takes several concurrent reads
+    monkeypatch.setattr(
+        queries, "batch_chunks", partial(queries.batch_chunks, chunk_size=1)
+    )
+
+    async def requests():
+        async with webapp_async.app.test_app() as test_app:
+            client = test_app.test_client()
+            response = await client.get("/ingredients/00000000002")
+            assert await response.get_json() == {
+                "ingredients": [[["Ibuprofen", "Famotidine"]]]
+            }
+            response = await client.get("/search?q=0002")
+            assert await response.get_json() == {"ndc": [["00000000002", "Motrin"]]}
+
+            ndcs = ["0000-0000-03", "00000000001", "bad", "00000000002"]
+            response = await client.post("/resolve/batch", json=ndcs)
+            results = await response.get_json()
+            assert [result["input"] for result in results] == ndcs
+            assert [result["found"] for result in results] == [True, True, False, True]
+            assert results[0]["ndc"] == "00000000003"
+            assert results[1]["brand"] == "Advil"
+
+    asyncio.run(requests())
+    assert webapp_async.driver.most_in_flight == 2
+
+
+def test_responses_cached_until_build_version_changes(app_env, monkeypatch):
+    monkeypatch.setenv("BUILD_VERSION_CHECK", "0")
+    graph = make_graph()
+    driver = fake_neo4j.FakeDriver(graph)
+    webapp = fake_neo4j.load_webapp(driver)
+    client = webapp.app.test_client()
+
+    first = client.get("/ingredients/00000000002").get_data()
+    queries_run = driver.query_count
+    assert client.get("/ingredients/00000000002").get_data() == first
+    # Only the build version was read again
+    assert driver.query_count == queries_run + 1
+    assert webapp.response_cache.hits == 1
+
+    graph.ingredients["00000000002"] = [{"rxcui": "10", "brand": "Ibuprofen"}]
+    assert client.get("/ingredients/00000000002").get_data() == first
+    graph.version = "2023-02-06"
+    response = client.get("/ingredients/00000000002")
+    assert response.get_json() == {"ingredients": [[["Ibuprofen"]]]}
+
+
+def test_graph_pages(app_env):
+    webapp = fake_neo4j.load_webapp(fake_neo4j.FakeDriver(make_graph()))
+    client = webapp.app.test_client()
+
+    page = client.get("/graph?limit=1").get_json()
+    assert [node["name"] for node in page["nodes"]] == ["Advil", "Ibuprofen"]
+    assert page["next"] == "00000000001"
+    page = client.get(f"/graph?limit=1&after={page['next']}").get_json()
+    assert [node["name"] for node in page["nodes"]] == [
+        "Motrin",
+        "Ibuprofen",
+        "Famotidine",
+    ]
+    lines = client.get("/graph?limit=5&format=ndjson").get_data(as_text=True)
+    assert lines.splitlines()[-1] == '{"next": null}'
+
+    response = client.get("/graph?limit=0")
+    assert response.status_code == 400
+    assert "limit" in response.get_json()["error"]
+
+
+def test_batch_lookups(app_env):
+    webapp = fake_neo4j.load_webapp(fake_neo4j.FakeDriver(make_graph()))
+    client = webapp.app.test_client()
+
+    ndcs = ["00000000002", "bad", "0000-0000-01"]
+    results = client.post("/ingredients/batch", json=ndcs).get_json()
+    assert [result["input"] for result in results] == ndcs
+    assert results[0]["ingredients"] == ["Ibuprofen", "Famotidine"]
+    assert not results[1]["valid"]
+    assert not results[1]["found"]
+    assert results[1]["ingredients"] == []
+    assert results[2]["ndc"] == "00000000001"
+
+    response = client.post("/resolve/batch?format=ndjson", json={"ndcs": ndcs})
+    lines = response.get_data(as_text=True).splitlines()
+    assert response.mimetype == "application/x-ndjson"
+    assert [json.loads(line)["brand"] for line in lines] == ["Motrin", None, "Advil"]
+
+    assert client.post("/resolve/batch", json={"ndc": ndcs}).status_code == 400
+    assert client.post("/resolve/batch", json=[2]).status_code == 400
+    assert client.post("/resolve/batch", data="[").status_code == 400
+
+
+def oversized_body(limit):
+    return json.dumps(["00000000001"] * (limit // 10)).encode("utf-8")
+
+
+def test_batch_body_limit(app_env, monkeypatch):
+    monkeypatch.setenv("MAX_BODY_BYTES", "1000")
+    webapp = fake_neo4j.load_webapp(fake_neo4j.FakeDriver(make_graph()))
+    client = webapp.app.test_client()
+    body = oversized_body(1000)
+
+    response = client.post("/resolve/batch", data=body, content_type="application/json")
+    assert response.status_code == 413
+    # Chunked, without a Content-Length
+    response = client.post(
+        "/resolve/batch",
+        input_stream=io.BytesIO(body),
+        content_type="application/json",
+        headers={"Transfer-Encoding": "chunked"},
+        environ_overrides={"wsgi.input_terminated": True},
+    )
+    assert response.status_code == 413
+    response = client.post(
+        "/resolve/batch",
+        input_stream=io.BytesIO(b'["00000000001"]'),
+        content_type="application/json",
+        headers={"Transfer-Encoding": "chunked"},
+        environ_overrides={"wsgi.input_terminated": True},
+    )
+    assert response.get_json()[0]["found"]
+
+
+def test_async_batch_body_limit(app_env, monkeypatch):
+    monkeypatch.setenv("MAX_BODY_BYTES", "1000")
+    webapp_async = load_async_webapp(monkeypatch, fake_neo4j.FakeDriver(make_graph()))
+    body = oversized_body(1000)
+
+    async def requests():
+        async with webapp_async.app.test_app() as test_app:
+            client = test_app.test_client()
+            response = await client.post(
+                "/resolve/batch",
+                data=body,
+                headers={"Content-Type": "application/json"},
+            )
+            assert response.status_code == 413
+            # Chunked, without a Content-Length
+            async with client.request(
+                "/resolve/batch",
+                method="POST",
+                headers={"Content-Type": "application/json"},
+            ) as connection:
+                for start in range(0, len(body), 256):
+                    await connection.send(body[start : start + 256])
+                await connection.send_complete()
+            response = await connection.as_response()
+            assert response.status_code == 413
+
+    asyncio.run(requests())
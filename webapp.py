@@ -1,13 +1,21 @@
 import logging
 import os
+import threading
+import time
+
 #!/usr/bin/env python
-from json import dumps
+from functools import wraps
+from json import dumps, loads
 
-from flask import Flask, Response, g, request
+from flask import Flask, Response, abort, g, request
 
 from neo4j import GraphDatabase, basic_auth
+from rxnorm import queries, schema, search_index
+from rxnorm.response_cache import ResponseCache
 
 app = Flask(__name__, static_url_path="/static/")
+# Bigger request bodies are answered with 413, see read_json
+app.config["MAX_CONTENT_LENGTH"] = queries.max_body_bytes()
 
 url = os.getenv("NEO4J_URI", "bolt://127.0.0.1:7687")
 username = os.getenv("NEO4J_USER", "neo4j")
@@ -17,10 +25,59 @@
 
 port = os.getenv("PORT", 8088)
 
-driver = GraphDatabase.driver(url, auth=basic_auth(username, password))
+READ_CHUNK_BYTES = 64 * 1024
+
+driver = GraphDatabase.driver(
+    url, auth=basic_auth(username, password), **queries.driver_config()
+)
 print("Connected?", driver.verify_connectivity())
 
 
+response_cache = ResponseCache.from_env()
+# Typeahead searches are answered from memory when generate_neo4j_data.py built the index
+ndc_search_index = search_index.load_from_env()
+
+
+# Lookups are label scans until the indexes exist, so they're answered with 503 until the
+# indexes are online. Only checked, creating them needs schema rights and is done by
+# fill_db.sh (python -m rxnorm.schema).
+schema_ready = threading.Event()
+
+
+def watch_schema():
+    while not schema.check_ready(driver, database):
+        time.sleep(schema.RECHECK_INTERVAL)
+    logging.info("Neo4j indexes are online")
+    schema_ready.set()
+
+
+if schema.check_ready(driver, database):
+    schema_ready.set()
+else:
+    threading.Thread(target=watch_schema, name="schema-check", daemon=True).start()
+
+
+def needs_schema(view):
+    """Answers a route that queries Neo4j with 503 while the indexes aren't online."""
+
+    @wraps(view)
+    def checked(*args, **kwargs):
+        if not schema_ready.is_set():
+            return schema_unavailable()
+        return view(*args, **kwargs)
+
+    return checked
+
+
+def schema_unavailable():
+    return Response(
+        dumps({"error": "Neo4j indexes are not online yet"}),
+        status=503,
+        mimetype="application/json",
+        headers={"Retry-After": str(schema.RECHECK_INTERVAL)},
+    )
+
+
 def get_db():
     if not hasattr(g, "neo4j_db"):
         g.neo4j_db = driver.session(database=database)
@@ -33,6 +90,29 @@ def close_db(error):
         g.neo4j_db.close()
 
 
+def _build_version(tx):
+    record = tx.run(queries.BUILD_VERSION).single()
+    return record["version"] if record else None
+
+
+def check_build_version():
+    if response_cache.version_due():
+        response_cache.set_version(get_db().execute_read(_build_version))
+
+
+def cached_json(route, params, load):
+    """
+    Serves the cached response for a route and parameters, or else calls load and caches
+    its result as JSON.
+    """
+    check_build_version()
+    body = response_cache.get(route, params)
+    if body is None:
+        body = dumps(load()).encode("utf-8")
+        response_cache.set(route, params, body)
+    return Response(body, mimetype="application/json")
+
+
 @app.route("/")
 def get_index():
     return app.send_static_file("index.html")
@@ -43,12 +123,7 @@ def get_search():
     def work(tx, q_):
         return list(
             tx.run(
-                "MATCH (n:NDC)-[:aka]-(i) "
-                "WHERE n.ndc CONTAINS $ndc1"
-                " AND n.brand IS NOT NULL "
-                " AND i.brand IS NOT NULL "
-                "RETURN n.ndc as ndc, n.brand as brand "
-                "LIMIT 7",
+                queries.SEARCH,
                 {"ndc1": q_},
             )
         )
@@ -57,83 +132,152 @@ def work(tx, q_):
         q = request.args["q"]
     except KeyError:
         return []
+    if ndc_search_index is not None:
+        return {"ndc": ndc_search_index.search(q)}
+    elif not schema_ready.is_set():
+        return schema_unavailable()
     else:
-        db = get_db()
-        results = db.execute_read(work, q)
-        print(results)
-        return Response(
-            dumps({"ndc": results}),
-            mimetype="application/json",
+        return cached_json(
+            "search", {"q": q}, lambda: {"ndc": get_db().execute_read(work, q)}
         )
 
 
 @app.route("/ingredients/<ndc>")
+@needs_schema
 def get_ingredients(ndc):
     def work(tx, ndc_):
         return list(
             tx.run(
-                "MATCH (n:NDC {ndc:$ndc})-[*1..3]-(i:IN)"
-                "WHERE i.brand IS NOT NULL "
-                "RETURN COLLECT(DISTINCT i.brand) as ingredients",
+                queries.INGREDIENTS,
                 {"ndc": ndc_},
             )
         )
 
-    db = get_db()
-    results = db.execute_read(work, ndc)
-
-    return Response(
-        dumps({"ingredients": results}),
-        mimetype="application/json",
+    return cached_json(
+        "ingredients",
+        {"ndc": ndc},
+        lambda: {"ingredients": get_db().execute_read(work, ndc)},
     )
 
 
 @app.route("/graph")
+@needs_schema
 def get_graph():
-    def work(tx, limit):
-        return list(
-            tx.run(
-                "MATCH (n:NDC)-[:aka]-(v)-[*1..2]-(i:IN) "
-                "WHERE n.brand IS NOT NULL and i.brand IS NOT NULL AND v.brand IS NOT NULL "
-                "RETURN n.ndc as ndc, n.brand as brand, n.rxcui as rxcui, collect(DISTINCT i) as ingredients "
-                "LIMIT $limit ",
-                {"limit": limit},
+    """
+    One page of the NDC to ingredient graph, streamed as it's read from Neo4j.
+    Takes limit, after (the next cursor from the previous page) and format=json|ndjson.
+    """
+    try:
+        params = queries.graph_params(request.args)
+    except ValueError as error:
+        return Response(
+            dumps({"error": str(error)}), status=400, mimetype="application/json"
+        )
+    ndjson = params["format"] == "ndjson"
+    mimetype = "application/x-ndjson" if ndjson else "application/json"
+
+    check_build_version()
+    body = response_cache.get("graph", params)
+    if body is not None:
+        return Response(body, mimetype=mimetype)
+    keep = response_cache.enabled and response_cache.version is not None
+
+    def chunks():
+        writer = queries.GraphWriter(params["limit"], ndjson)
+        yield writer.start()
+        # Own session, the request's session is closed before the stream finishes
+        with driver.session(database=database) as session:
+            records = session.run(
+                queries.GRAPH, limit=params["limit"], after=params["after"]
             )
+            for record in records:
+                yield writer.add(record)
+        yield writer.end()
+
+    def stream():
+        body = []
+        for chunk in chunks():
+            if keep:
+                body.append(chunk)
+            yield chunk
+        if keep:
+            response_cache.set("graph", params, "".join(body).encode("utf-8"))
+
+    return Response(stream(), mimetype=mimetype)
+
+
+def read_json():
+    """
+    The request's JSON body, or None when it isn't JSON. Werkzeug only applies
+    MAX_CONTENT_LENGTH to form data and chunked bodies have no Content-Length, so at most
+    that many bytes are read and bigger bodies are answered with 413.
+    """
+    limit = app.config["MAX_CONTENT_LENGTH"]
+    if (request.content_length or 0) > limit:
+        abort(413)
+    if not request.is_json:
+        return None
+    body = bytearray()
+    while len(body) <= limit:
+        chunk = request.stream.read(min(READ_CHUNK_BYTES, limit + 1 - len(body)))
+        if not chunk:
+            break
+        body += chunk
+    if len(body) > limit:
+        abort(413)
+    try:
+        return loads(body)
+    except ValueError:
+        return None
+
+
+def _batch_lookup(route):
+    """
+    Looks up a JSON array of raw NDCs with one UNWIND query per BATCH_CHUNK_SIZE NDCs and
+    streams the results back in the order they were sent. Takes format=json|ndjson.
+    """
+    try:
+        raw_ndcs = queries.batch_ndcs(read_json())
+        ndjson = queries.output_format(request.args) == "ndjson"
+    except ValueError as error:
+        return Response(
+            dumps({"error": str(error)}), status=400, mimetype="application/json"
         )
 
-    db = get_db()
-    results = db.execute_read(work, request.args.get("limit", 700))
-    nodes = []
-    rels = []
-    i = 0
-    for record in results:
-        node_data = {
-            "ndc": record["ndc"],
-            "name": record["brand"],
-            "label": "NDC",
-            "rxcui": record["rxcui"],
-            "icount": len(record["ingredients"]),
-        }
-        nodes.append(node_data)
-        target = i
-        i += 1
-        for ingredient in record["ingredients"]:
-            ingredient = {
-                "name": ingredient["brand"],
-                "label": "IN",
-                "rxcui": ingredient["rxcui"],
-                "icount": 0,
-            }
-            try:
-                source = nodes.index(ingredient)
-            except ValueError:
-                nodes.append(ingredient)
-                source = i
-                i += 1
-            rels.append({"source": source, "target": target})
-    return Response(dumps({"nodes": nodes, "links": rels}), mimetype="application/json")
+    def stream():
+        writer = queries.BatchWriter(route, ndjson)
+        yield writer.start()
+        # Own session, the request's session is closed before the stream finishes
+        with driver.session(database=database) as session:
+            for chunk in queries.batch_chunks(raw_ndcs):
+                records = session.execute_read(
+                    lambda tx: list(
+                        tx.run(
+                            queries.BATCH_QUERIES[route],
+                            ndcs=queries.chunk_ndcs(chunk),
+                        )
+                    )
+                )
+                yield writer.add(chunk, records)
+        yield writer.end()
+
+    mimetype = "application/x-ndjson" if ndjson else "application/json"
+    return Response(stream(), mimetype=mimetype)
+
+
+@app.route("/ingredients/batch", methods=["POST"])
+@needs_schema
+def post_ingredients_batch():
+    return _batch_lookup("ingredients")
+
+
+@app.route("/resolve/batch", methods=["POST"])
+@needs_schema
+def post_resolve_batch():
+    return _batch_lookup("resolve")
 
 
+# Async serving mode: webapp_async.py, based on
 # https://github.com/neo4j-examples/movies-python-bolt/blob/main/movies_async.py
 
 if __name__ == "__main__":
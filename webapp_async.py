@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+"""
+Async serving mode for the webapp, using Quart and the Neo4j async driver
+
+Quart is Flask's API on ASGI, so the routes are the same as webapp.py's. Requests wait on
+Neo4j without holding a thread, so one process handles many lookups at once. The driver's
+connection pool is shared by every request and sized with NEO4J_MAX_POOL_SIZE and
+NEO4J_ACQUISITION_TIMEOUT, see rxnorm.queries.driver_config. Request bodies over
+MAX_BODY_BYTES are answered with 413. Lookups are answered with 503 until the Neo4j indexes
+are online.
+
+Run with an ASGI server, ie
+    uvicorn webapp_async:app --host 127.0.0.1 --port 8088 --workers 4
+"""
+
+import asyncio
+import logging
+import os
+from functools import wraps
+from itertools import islice
+from json import dumps
+from typing import Dict, List
+
+from quart import Quart, Response, request
+
+from neo4j import AsyncGraphDatabase, GraphDatabase, basic_auth
+from rxnorm import queries, schema, search_index
+from rxnorm.response_cache import ResponseCache
+
+logger = logging.getLogger(__name__)
+
+app = Quart(__name__, static_url_path="/static/")
+# Quart counts the body as it arrives, so chunked bodies over the limit get 413 as well
+app.config["MAX_CONTENT_LENGTH"] = queries.max_body_bytes()
+
+url = os.getenv("NEO4J_URI", "bolt://127.0.0.1:7687")
+username = os.getenv("NEO4J_USER", "neo4j")
+password = os.getenv("NEO4J_PASSWORD", "neo4j")
+database = os.getenv("NEO4J_DATABASE", "neo4j")
+
+# Chunks of a batch lookup queried at once, each on its own pooled connection
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 4))
+
+driver = None
+response_cache = ResponseCache.from_env()
+ndc_search_index = None
+schema_ready = False
+schema_watch = None
+
+
+def _check_schema() -> bool:
+    # Lookups are label scans until the indexes exist, so they get 503 until they're online.
+    # Only checked, fill_db.sh creates them (python -m rxnorm.schema)
+    with GraphDatabase.driver(url, auth=basic_auth(username, password)) as sync_driver:
+        return schema.check_ready(sync_driver, database)
+
+
+async def watch_schema():
+    global schema_ready
+    while not await asyncio.to_thread(_check_schema):
+        await asyncio.sleep(schema.RECHECK_INTERVAL)
+    logger.info("Neo4j indexes are online")
+    schema_ready = True
+
+
+@app.before_serving
+async def startup():
+    global driver, ndc_search_index, schema_ready, schema_watch
+    driver = AsyncGraphDatabase.driver(
+        url, auth=basic_auth(username, password), **queries.driver_config()
+    )
+    await driver.verify_connectivity()
+    # Schema checks are sync and rare, so they get their own short lived driver
+    schema_ready = await asyncio.to_thread(_check_schema)
+    if not schema_ready:
+        schema_watch = asyncio.create_task(watch_schema())
+    # Typeahead searches are answered from memory when generate_neo4j_data.py built the index
+    ndc_search_index = search_index.load_from_env()
+    logger.info(f"Connected to {url}, database {database}")
+
+
+@app.after_serving
+async def shutdown():
+    if schema_watch is not None:
+        schema_watch.cancel()
+    if driver is not None:
+        await driver.close()
+
+
+async def _fetch(tx, query: str, params: Dict) -> List:
+    result = await tx.run(query, params)
+    return [record async for record in result]
+
+
+async def read(query: str, **params) -> List:
+    """Runs a read query on a pooled connection and returns all its records"""
+    async with driver.session(database=database) as session:
+        return await session.execute_read(_fetch, query, params)
+
+
+async def read_many(query: str, params_list: List[Dict]) -> List[List]:
+    """
+    Runs the same read query for each set of parameters at once, each on its own pooled
+    connection. Results are in the order of params_list.
+    """
+    return await asyncio.gather(*(read(query, **params) for params in params_list))
+
+
+async def check_build_version():
+    if response_cache.version_due():
+        records = await read(queries.BUILD_VERSION)
+        response_cache.set_version(records[0]["version"] if records else None)
+
+
+async def cached_json(route, params, load):
+    """
+    Serves the cached response for a route and parameters, or else awaits load and caches
+    its result as JSON.
+    """
+    await check_build_version()
+    body = response_cache.get(route, params)
+    if body is None:
+        body = dumps(await load()).encode("utf-8")
+        response_cache.set(route, params, body)
+    return Response(body, mimetype="application/json")
+
+
+def error_response(error: ValueError) -> Response:
+    return Response(
+        dumps({"error": str(error)}), status=400, mimetype="application/json"
+    )
+
+
+def schema_unavailable() -> Response:
+    return Response(
+        dumps({"error": "Neo4j indexes are not online yet"}),
+        status=503,
+        mimetype="application/json",
+        headers={"Retry-After": str(schema.RECHECK_INTERVAL)},
+    )
+
+
+def needs_schema(view):
+    """Answers a route that queries Neo4j with 503 while the indexes aren't online."""
+
+    @wraps(view)
+    async def checked(*args, **kwargs):
+        if not schema_ready:
+            return schema_unavailable()
+        return await view(*args, **kwargs)
+
+    return checked
+
+
+@app.route("/")
+async def get_index():
+    return await app.send_static_file("index.html")
+
+
+@app.route("/search")
+async def get_search():
+    try:
+        q = request.args["q"]
+    except KeyError:
+        return []
+    if ndc_search_index is not None:
+        # Answered from memory, so there's nothing to gain from caching it
+        return {"ndc": ndc_search_index.search(q)}
+    if not schema_ready:
+        return schema_unavailable()
+
+    async def load():
+        return {"ndc": await read(queries.SEARCH, ndc1=q)}
+
+    return await cached_json("search", {"q": q}, load)
+
+
+@app.route("/ingredients/<ndc>")
+@needs_schema
+async def get_ingredients(ndc):
+    async def load():
+        return {"ingredients": await read(queries.INGREDIENTS, ndc=ndc)}
+
+    return await cached_json("ingredients", {"ndc": ndc}, load)
+
+
+@app.route("/graph")
+@needs_schema
+async def get_graph():
+    """
+    One page of the NDC to ingredient graph, streamed as it's read from Neo4j.
+    Takes limit, after (the next cursor from the previous page) and format=json|ndjson.
+    """
+    try:
+        params = queries.graph_params(request.args)
+    except ValueError as error:
+        return error_response(error)
+    ndjson = params["format"] == "ndjson"
+    mimetype = "application/x-ndjson" if ndjson else "application/json"
+
+    await check_build_version()
+    body = response_cache.get("graph", params)
+    if body is not None:
+        return Response(body, mimetype=mimetype)
+    keep = response_cache.enabled and response_cache.version is not None
+
+    async def stream():
+        writer = queries.GraphWriter(params["limit"], ndjson)
+        chunks = [writer.start()]
+        yield chunks[-1].encode("utf-8")
+        async with driver.session(database=database) as session:
+            records = await session.run(
+                queries.GRAPH, limit=params["limit"], after=params["after"]
+            )
+            async for record in records:
+                chunk = writer.add(record)
+                if keep:
+                    chunks.append(chunk)
+                yield chunk.encode("utf-8")
+        chunks.append(writer.end())
+        yield chunks[-1].encode("utf-8")
+        if keep:
+            response_cache.set("graph", params, "".join(chunks).encode("utf-8"))
+
+    return Response(stream(), mimetype=mimetype)
+
+
+async def _batch_lookup(route):
+    """
+    Looks up a JSON array of raw NDCs with one UNWIND query per BATCH_CHUNK_SIZE NDCs and
+    streams the results back in the order they were sent. BATCH_CONCURRENCY chunks are
+    queried at once. Takes format=json|ndjson.
+    """
+    try:
+        raw_ndcs = queries.batch_ndcs(await request.get_json(silent=True))
+        ndjson = queries.output_format(request.args) == "ndjson"
+    except ValueError as error:
+        return error_response(error)
+
+    async def stream():
+        writer = queries.BatchWriter(route, ndjson)
+        yield writer.start().encode("utf-8")
+        chunks = queries.batch_chunks(raw_ndcs)
+        while True:
+            group = list(islice(chunks, BATCH_CONCURRENCY))
+            if not group:
+                break
+            group_records = await read_many(
+                queries.BATCH_QUERIES[route],
+                [{"ndcs": queries.chunk_ndcs(chunk)} for chunk in group],
+            )
+            for chunk, records in zip(group, group_records):
+                yield writer.add(chunk, records).encode("utf-8")
+        yield writer.end().encode("utf-8")
+
+    mimetype = "application/x-ndjson" if ndjson else "application/json"
+    return Response(stream(), mimetype=mimetype)
+
+
+@app.route("/ingredients/batch", methods=["POST"])
+@needs_schema
+async def post_ingredients_batch():
+    return await _batch_lookup("ingredients")
+
+
+@app.route("/resolve/batch", methods=["POST"])
+@needs_schema
+async def post_resolve_batch():
+    return await _batch_lookup("resolve")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(
+        "webapp_async:app",
+        host="127.0.0.1",
+        port=int(os.getenv("PORT", 8088)),
+        workers=int(os.getenv("WEB_WORKERS", 1)),
+    )